@@ -1,63 +1,208 @@
 import os
 import hashlib
-import requests
+import json
 import re
-import secrets
+import threading
+import time
 from datetime import datetime
 from functools import wraps
 
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+import click
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from web3 import Web3
 
-from models import db, Institution
+from models import db, Institution, Certificate, Revocation
 
 from config import (
     PINATA_API_KEY, 
     PINATA_SECRET_KEY, 
     CONTRACT_ADDRESS, 
-    CONTRACT_ABI,
-    INFURA_PROJECT_ID,
+    SECRET_KEY,
     ISSUER_ADDRESS,
-    ISSUER_PRIVATE_KEY
+    ISSUER_PRIVATE_KEY,
+    PINATA_API_URL,
+    IPFS_CONNECT_TIMEOUT,
+    IPFS_READ_TIMEOUT,
+    IPFS_MAX_RETRIES,
+    IPFS_MAX_WORKERS,
+    IPFS_SWEEP_INTERVAL,
+    INDEXER_ENABLED,
+    INDEXER_START_BLOCK,
+    INDEXER_CONFIRMATIONS,
+    TRACE_EXPORT_FILE,
+    ISSUE_BATCH_SIZE,
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    SQLITE_BUSY_TIMEOUT,
+    CACHE_URL,
+    CACHE_TTL,
+    CACHE_MAX_ENTRIES,
+    REVOCATION_CAPACITY,
+    REVOCATION_ERROR_RATE,
+    REVOCATION_REFRESH,
+    REVOCATION_RETRY_INTERVAL,
+    RPC_URLS,
+    RPC_TIMEOUT,
+    RPC_HEALTH_INTERVAL,
+    RPC_FINALITY_DEPTH,
+    RPC_CACHE_SIZE,
+    CHAIN_ID,
+    TX_FEE_HISTORY_BLOCKS,
+    TX_PRIORITY_PERCENTILE,
+    TX_MAX_FEE_GWEI,
+    TX_REPLACE_AFTER,
+    TX_FEE_BUMP,
+    TX_RECEIPT_TIMEOUT,
+    TX_NONCE_FILE,
+    MAIL_SERVER,
+    MAIL_PORT,
+    MAIL_USE_TLS,
+    MAIL_USE_SSL,
+    MAIL_USERNAME,
+    MAIL_PASSWORD,
+    MAIL_DEFAULT_SENDER,
+    MAIL_RATE_LIMIT,
+    MAIL_WORKERS,
+    MAIL_BATCH_SIZE,
+    MAIL_MAX_ATTEMPTS,
+    PUBLIC_URL,
+    IDEMPOTENCY_TTL,
+    IDEMPOTENCY_WAIT,
+    IDEMPOTENCY_LOCK_TIMEOUT,
+    RATE_LIMIT_URL,
+    VERIFY_RATE_PER_IP,
+    VERIFY_RATE_PER_API_KEY,
+    VERIFY_RATE_PER_INSTITUTION,
+    VERIFY_GLOBAL_RATE,
+    VERIFY_BURST_SECONDS,
+    VERIFY_API_KEYS,
+    VERIFY_MAX_INFLIGHT,
+    VERIFY_RESERVED_SLOTS,
+    VERIFY_MAX_UPLOAD_MB,
+    TRUSTED_PROXIES
 )
+from database import init_db
+import migrations
+import metrics
+from ipfs_cid import compute_cid, compute_file_cid
+import chain_indexer
+from services import Services
+import bulk_verify
+import shared_cache
+import mailer
+import idempotency
+import rate_limit
 
 app = Flask(__name__)
 CORS(app)
 
 # Configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///certichain.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = secrets.token_hex(16)
+app.config['SECRET_KEY'] = SECRET_KEY
 
 # Initialize extensions
-db.init_app(app)
-
-# Web3 Setup
-infura_url = f"https://sepolia.infura.io/v3/{INFURA_PROJECT_ID}"
-w3 = Web3(Web3.HTTPProvider(infura_url))
-
-try:
-    from web3.middleware import ExtraDataToPOAMiddleware
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-except ImportError:
-    from web3.middleware import geth_poa_middleware
-    w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-def get_safe_address(addr):
-    try:
-        return w3.to_checksum_address(addr)
-    except:
-        return None
+metrics.init_app(app)
+metrics.init_tracing(TRACE_EXPORT_FILE)
+init_db(
+    app, DATABASE_URL,
+    busy_timeout_ms=SQLITE_BUSY_TIMEOUT,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE
+)
 
-CHECKED_CONTRACT = get_safe_address(CONTRACT_ADDRESS)
-CHECKED_ISSUER = get_safe_address(ISSUER_ADDRESS)
+# Web3, contrat, indexeur et client IPFS : construits à la première utilisation
+services = Services(
+    app,
+    rpc_url=RPC_URLS,
+    contract_address=CONTRACT_ADDRESS,
+    issuer_address=ISSUER_ADDRESS,
+    ipfs_options=dict(
+        api_key=PINATA_API_KEY,
+        secret_key=PINATA_SECRET_KEY,
+        base_url=PINATA_API_URL,
+        connect_timeout=IPFS_CONNECT_TIMEOUT,
+        read_timeout=IPFS_READ_TIMEOUT,
+        max_retries=IPFS_MAX_RETRIES,
+        max_workers=IPFS_MAX_WORKERS
+    ),
+    indexer_options=dict(
+        start_block=INDEXER_START_BLOCK,
+        confirmations=INDEXER_CONFIRMATIONS
+    ),
+    revocation_options=dict(
+        capacity=REVOCATION_CAPACITY,
+        error_rate=REVOCATION_ERROR_RATE,
+        refresh_interval=REVOCATION_REFRESH
+    ),
+    rpc_options=dict(
+        timeout=RPC_TIMEOUT,
+        health_interval=RPC_HEALTH_INTERVAL,
+        finality_depth=RPC_FINALITY_DEPTH,
+        cache_size=RPC_CACHE_SIZE
+    ),
+    tx_options=dict(
+        private_key=ISSUER_PRIVATE_KEY,
+        chain_id=CHAIN_ID,
+        fee_history_blocks=TX_FEE_HISTORY_BLOCKS,
+        priority_percentile=TX_PRIORITY_PERCENTILE,
+        max_fee=int(TX_MAX_FEE_GWEI * 10 ** 9),
+        replace_after=TX_REPLACE_AFTER,
+        fee_bump=TX_FEE_BUMP,
+        receipt_timeout=TX_RECEIPT_TIMEOUT,
+        nonce_file=TX_NONCE_FILE or None
+    ),
+    mail_options=dict(
+        host=MAIL_SERVER,
+        port=MAIL_PORT,
+        username=MAIL_USERNAME,
+        password=MAIL_PASSWORD,
+        use_tls=MAIL_USE_TLS,
+        use_ssl=MAIL_USE_SSL,
+        sender=MAIL_DEFAULT_SENDER,
+        rate_limit=MAIL_RATE_LIMIT,
+        workers=MAIL_WORKERS,
+        batch_size=MAIL_BATCH_SIZE,
+        max_attempts=MAIL_MAX_ATTEMPTS
+    )
+)
 
-if CHECKED_CONTRACT and CHECKED_ISSUER:
-    contract = w3.eth.contract(address=CHECKED_CONTRACT, abi=CONTRACT_ABI)
-else:
-    contract = None
+# Réponses de vérification et listes, retirées du cache à chaque commit qui touche le certificat
+cache = shared_cache.make_cache(CACHE_URL, CACHE_TTL, CACHE_MAX_ENTRIES)
+shared_cache.invalidate_on_commit(cache, Certificate, lambda cert: [
+    f'verify:{cert.file_hash}',
+    f'verify-tx-hash:{cert.blockchain_hash}',
+    f'certs:{cert.institution_id}'
+])
+shared_cache.invalidate_on_commit(cache, Revocation, lambda revocation: [
+    f'verify:{revocation.file_hash}'
+])
+
+# Vérifications publiques : refus avant la lecture du fichier, voies prioritaires pour les institutions
+verify_limiter = rate_limit.VerifyLimiter(
+    rate_limit.make_buckets(RATE_LIMIT_URL),
+    ip_rate=VERIFY_RATE_PER_IP,
+    key_rate=VERIFY_RATE_PER_API_KEY,
+    institution_rate=VERIFY_RATE_PER_INSTITUTION,
+    global_rate=VERIFY_GLOBAL_RATE,
+    burst_seconds=VERIFY_BURST_SECONDS,
+    api_keys=VERIFY_API_KEYS,
+    max_inflight=VERIFY_MAX_INFLIGHT,
+    reserved=VERIFY_RESERVED_SLOTS,
+    max_upload=VERIFY_MAX_UPLOAD_MB * 1024 * 1024,
+    trusted_proxies=TRUSTED_PROXIES
+)
+verify_limiter.init_app(app, {
+    'verify': {'POST'},
+    'verify_by_hash': {'POST'},
+    'get_public_certificate': {'GET'},
+    'verify_bulk': {'POST'}
+})
 
 os.makedirs("certs/uploads", exist_ok=True)
 
@@ -94,13 +239,447 @@ def generate_file_hash(file_path):
     return sha256_hash.hexdigest()
 
 def upload_to_ipfs(file_path):
-    url = "https://api.pinata.cloud/pinning/pinFileToIPFS"
-    headers = {"pinata_api_key": PINATA_API_KEY, "pinata_secret_api_key": PINATA_SECRET_KEY}
-    with open(file_path, "rb") as f:
-        response = requests.post(url, files={"file": f}, headers=headers)
-    if response.status_code == 200:
-        return response.json()["IpfsHash"]
-    raise Exception(f"IPFS Error: {response.text}")
+    return services.ipfs_client.pin_file(file_path)
+
+def _confirm_pin(cert_id, expected_cid, future, started):
+    """Vérifie que Pinata a épinglé le CID calculé localement"""
+    from models import Certificate
+
+    metrics.STAGE_LATENCY.observe(time.perf_counter() - started, stage='ipfs')
+    try:
+        pinned_cid = future.result()
+    except Exception as e:
+        metrics.record_failure('ipfs')
+        print(f"IPFS upload failed (cert {cert_id}): {e}")
+        return
+
+    if pinned_cid != expected_cid:
+        metrics.record_failure('ipfs')
+        print(f"⚠️  CID divergent pour cert {cert_id}: local {expected_cid}, Pinata {pinned_cid}")
+        return
+
+    with app.app_context():
+        cert = Certificate.query.get(cert_id)
+        if cert and cert.ipfs_hash == expected_cid:
+            cert.ipfs_pinned = True
+            db.session.commit()
+
+def pin_in_background(cert_id, data, filename, expected_cid):
+    """Épingle hors du chemin critique ; le sweeper reprend les échecs"""
+    started = time.perf_counter()
+    future = services.ipfs_client.pin_bytes_async(data, filename)
+    future.add_done_callback(lambda f: _confirm_pin(cert_id, expected_cid, f, started))
+
+def certificate_file_path(cert_id):
+    return os.path.join('certs', 'uploads', f'cert_{cert_id}.pdf')
+
+def anchored_bytes(cert):
+    """Octets ancrés du certificat : la révision du fichier local dont le SHA-256 est cert.file_hash"""
+    from pdf_incremental import revisions
+
+    file_path = certificate_file_path(cert.id)
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if not cert.file_hash:
+        return data
+    for length, digest in revisions(data):
+        if digest == cert.file_hash:
+            return data[:length]
+    return None
+
+def repin_missing_certificates(limit=200):
+    """Ré-épingle les certificats sans ipfs_hash ou dont l'épinglage n'est pas confirmé"""
+    from models import Certificate
+
+    certs = Certificate.query.filter(
+        db.or_(Certificate.ipfs_hash.is_(None), Certificate.ipfs_pinned.isnot(True))
+    ).limit(limit).all()
+    # Le fichier local porte le tampon du hash blockchain : seule la révision ancrée est épinglée
+    futures = {}
+    for cert in certs:
+        data = anchored_bytes(cert)
+        if data is None:
+            if os.path.exists(certificate_file_path(cert.id)):
+                print(f"⚠️  Aucune révision du fichier de cert {cert.id} ne correspond à son file_hash")
+            continue
+        futures[cert.id] = services.ipfs_client.pin_bytes_async(data, f'cert_{cert.id}.pdf')
+
+    pinned = 0
+    for cert in certs:
+        future = futures.get(cert.id)
+        if future is None:
+            continue
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Ré-épinglage cert {cert.id} échoué: {e}")
+            continue
+        if cert.ipfs_hash and cert.ipfs_hash != result:
+            print(f"⚠️  CID divergent pour cert {cert.id}: enregistré {cert.ipfs_hash}, Pinata {result}")
+            continue
+        cert.ipfs_hash = result
+        cert.ipfs_pinned = True
+        pinned += 1
+    db.session.commit()
+    return pinned
+
+def _ipfs_sweeper_loop():
+    while True:
+        time.sleep(IPFS_SWEEP_INTERVAL)
+        try:
+            with app.app_context():
+                pinned = repin_missing_certificates()
+            if pinned:
+                print(f"IPFS: {pinned} certificat(s) ré-épinglé(s)")
+        except Exception as e:
+            print(f"Erreur sweeper IPFS: {e}")
+
+def start_ipfs_sweeper():
+    if IPFS_SWEEP_INTERVAL > 0:
+        threading.Thread(target=_ipfs_sweeper_loop, daemon=True).start()
+
+def _revocation_retry_loop():
+    while True:
+        time.sleep(REVOCATION_RETRY_INTERVAL)
+        try:
+            with app.app_context():
+                settled = retry_chain_revocations()
+            if settled:
+                print(f"Blockchain: {settled} révocation(s) en attente réglée(s)")
+        except Exception as e:
+            print(f"Erreur révocations en attente: {e}")
+
+def start_revocation_retry():
+    if REVOCATION_RETRY_INTERVAL > 0:
+        threading.Thread(target=_revocation_retry_loop, daemon=True).start()
+
+def start_background_jobs():
+    """Sweeper IPFS, révocations en attente, indexeur et file d'emails : un seul processus doit les lancer"""
+    start_ipfs_sweeper()
+    start_revocation_retry()
+    if services.indexer and INDEXER_ENABLED:
+        services.indexer.start()
+    if services.mail_dispatcher:
+        services.mail_dispatcher.start()
+
+def notify_recipients(certs):
+    """Met en file, dans la transaction en cours, un email par certificat ancré dont le destinataire a une adresse"""
+    if not MAIL_SERVER:
+        return 0
+    queued = 0
+    for cert in certs:
+        if not cert.recipient_email or not validate_email(cert.recipient_email):
+            continue
+        institution = cert.institution.name if cert.institution else 'Certichain'
+        body = (
+            f"Bonjour {cert.recipient_name},\n\n"
+            f"{institution} vous a délivré un certificat ({cert.certificate_type}), "
+            f"enregistré sur la blockchain Ethereum.\n\n"
+            f"Transaction : {cert.blockchain_hash}\n"
+            f"Fichier IPFS : {cert.ipfs_hash or 'en cours'}\n\n"
+            f"Vous pouvez le vérifier à tout moment sur {PUBLIC_URL}/verify\n\n"
+            f"-- Certichain"
+        )
+        mailer.enqueue(cert.recipient_email, f"Votre certificat de {institution} est disponible", body, cert.id)
+        queued += 1
+    return queued
+
+# Au-delà, un certificat 'issuing' est supposé abandonné (processus arrêté pendant l'attente du reçu)
+ISSUE_CLAIM_TIMEOUT = TX_RECEIPT_TIMEOUT + 60
+
+def _claim_pending(query, batch_size):
+    """Passe jusqu'à batch_size certificats à 'issuing' ; la condition sur status écarte ceux d'un autre processus"""
+    from models import Certificate
+    from datetime import timedelta
+
+    now = datetime.utcnow()
+    claimable = db.or_(
+        Certificate.status == 'created',
+        db.and_(Certificate.status == 'issuing',
+                Certificate.updated_at < now - timedelta(seconds=ISSUE_CLAIM_TIMEOUT))
+    )
+    ids = [cert_id for cert_id, in query.filter(claimable).with_entities(Certificate.id)
+           .order_by(Certificate.id).limit(batch_size)]
+    if not ids:
+        return []
+    Certificate.query.filter(Certificate.id.in_(ids), claimable) \
+        .update({'status': 'issuing', 'updated_at': now}, synchronize_session=False)
+    db.session.commit()
+    return Certificate.query.filter(Certificate.id.in_(ids), Certificate.status == 'issuing',
+                                    Certificate.updated_at == now).order_by(Certificate.id).all()
+
+def _send_issue(todo):
+    """
+    Une transaction issueCertificates si le contrat déployé l'a, sinon une
+    issueCertificate par certificat. Renvoie [(PendingTx, groupe)] des
+    transactions parties, et les certificats restés sans transaction si un
+    envoi échoue après d'autres (les reçus des premiers sont encore attendus).
+    """
+    if 'issueCertificates' in services.contract_functions:
+        pending = services.transactions.send(services.contract.functions.issueCertificates(
+            [cert_id for _, cert_id in todo],
+            [cert.ipfs_hash or '' for cert, _ in todo],
+            [cert.recipient_name for cert, _ in todo]
+        ))
+        return [(pending, todo)], []
+
+    # Nonces consécutifs : les transactions partent ensemble, puis on attend chaque reçu
+    sent = []
+    for i, (cert, cert_id) in enumerate(todo):
+        try:
+            pending = services.transactions.send(services.contract.functions.issueCertificate(
+                cert_id, cert.ipfs_hash or '', cert.recipient_name))
+        except Exception as e:
+            if not sent:
+                raise
+            print(f"Envoi interrompu, {len(todo) - i} certificat(s) sans transaction: {e}")
+            return sent, [cert for cert, _ in todo[i:]]
+        sent.append((pending, [(cert, cert_id)]))
+    return sent, []
+
+def stamp_certificate_file(cert):
+    """Ajoute le hash blockchain au PDF local encore à l'état ancré (SHA-256 = file_hash) ; True si ajouté"""
+    from pdf_generator import stamp_blockchain_hash
+
+    file_path = certificate_file_path(cert.id)
+    if not cert.blockchain_hash or not os.path.exists(file_path) or generate_file_hash(file_path) != cert.file_hash:
+        return False  # pas de fichier, ou déjà tamponné
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    with open(file_path, 'ab') as f:
+        f.write(stamp_blockchain_hash(data, cert.certificate_type, cert.blockchain_hash))
+    return True
+
+def issue_pending_certificates(institution_id=None, batch_size=ISSUE_BATCH_SIZE):
+    """Ancre en lots les certificats sans hash blockchain, réservés par le statut 'issuing'"""
+    from models import Certificate
+
+    query = Certificate.query.filter(
+        Certificate.blockchain_hash.is_(None),
+        Certificate.file_hash.isnot(None)
+    )
+    if institution_id:
+        query = query.filter_by(institution_id=institution_id)
+
+    issued = 0
+    while True:
+        batch = _claim_pending(query, batch_size)
+        if not batch:
+            return issued
+        try:
+            ids = [services.w3.to_hex(services.w3.solidity_keccak(['string'], [cert.file_hash])) for cert in batch]
+
+            # Un identifiant déjà ancré ferait échouer tout le lot : on l'écarte
+            # (getCertificates, ou certificates(id) en batch JSON-RPC sur un contrat plus ancien)
+            on_chain = services.bulk_verifier.chain_certificates(ids)
+            todo, issued_now, failed = [], [], []
+            for cert, cert_id in zip(batch, ids):
+                if cert_id not in on_chain:
+                    todo.append((cert, cert_id))
+                    continue
+                # Déjà miné (reçu attendu trop longtemps) : 'issued' seulement avec le hash de sa transaction
+                indexed = chain_indexer.lookup(cert_id)
+                tx_hash = indexed.tx_hash if indexed else \
+                    chain_indexer.issued_tx_hash(services.w3, services.contract, cert_id, on_chain[cert_id][1])
+                if tx_hash is None:
+                    failed.append(cert)  # reste 'created', repris au prochain passage
+                    continue
+                cert.blockchain_hash = tx_hash
+                cert.status = 'issued'
+                issued_now.append(cert)
+
+            if todo:
+                with metrics.stage('tx_send'):
+                    sent, unsent = _send_issue(todo)
+                failed.extend(unsent)
+                for pending_tx, group in sent:
+                    try:
+                        with metrics.stage('receipt_wait'):
+                            receipt = services.transactions.wait(pending_tx)
+                        tx_hash = services.w3.to_hex(receipt['transactionHash'])
+                        if receipt['status'] != 1:
+                            raise RuntimeError(f"Transaction {tx_hash} annulée")
+                    except Exception as e:
+                        print(f"Ancrage de {len(group)} certificat(s) échoué: {e}")
+                        failed.extend(cert for cert, _ in group)
+                        continue
+                    for cert, _ in group:
+                        cert.blockchain_hash = tx_hash
+                        cert.status = 'issued'
+                        issued_now.append(cert)
+            notify_recipients(issued_now)
+            issued += len(issued_now)
+            for cert in failed:
+                cert.status = 'created'
+            db.session.commit()
+            for cert in issued_now:
+                try:
+                    stamp_certificate_file(cert)
+                except Exception as e:
+                    print(f"⚠️  Tampon du hash blockchain sur cert {cert.id} échoué: {e}")
+            if failed:
+                return issued
+        except Exception:
+            db.session.rollback()
+            Certificate.query.filter(Certificate.id.in_([cert.id for cert in batch]),
+                                     Certificate.status == 'issuing') \
+                .update({'status': 'created'}, synchronize_session=False)
+            db.session.commit()
+            raise
+
+def revoke_certificate(cert, reason=''):
+    """
+    Marque le certificat révoqué et l'ajoute à la table et au filtre des
+    révocations ; un certificat ancré reste en attente de révocation sur le
+    contrat (chain_pending) jusqu'au minage de revokeCertificate.
+    """
+    cert.status = 'revoked'
+    if cert.file_hash:
+        cert_id = certificate_id(cert.file_hash)
+        if not Revocation.query.filter_by(certificate_id=cert_id).first():
+            db.session.add(Revocation(certificate_id=cert_id, file_hash=cert.file_hash, reason=reason, source='app',
+                                      chain_pending=bool(cert.blockchain_hash)))
+    with metrics.stage('db_commit'):
+        db.session.commit()
+    if cert.file_hash:
+        services.revocations.add(certificate_id(cert.file_hash))
+
+def revoke_on_chain(cert_id, reason=''):
+    """Appelle revokeCertificate pour un certificat ancré ; renvoie le hash de transaction"""
+    with metrics.stage('tx_send'):
+        pending_tx = services.transactions.send(services.contract.functions.revokeCertificate(cert_id, reason))
+    with metrics.stage('receipt_wait'):
+        receipt = services.transactions.wait(pending_tx)
+    tx_hash = services.w3.to_hex(receipt['transactionHash'])
+    if receipt['status'] != 1:
+        raise RuntimeError(f"Transaction {tx_hash} annulée")
+
+    revocation = Revocation.query.filter_by(certificate_id=cert_id).first()
+    if revocation:
+        revocation.tx_hash = tx_hash
+        revocation.chain_pending = False
+        db.session.commit()
+    return tx_hash
+
+def chain_revocation_enabled():
+    """Émetteur configuré et contrat déployé avec revokeCertificate (absent des anciennes versions)"""
+    return bool(services.contract and services.issuer and ISSUER_PRIVATE_KEY
+                and {'revokeCertificate', 'isRevoked'} <= services.contract_functions)
+
+def revoke_everywhere(cert, reason=''):
+    """
+    Révocation locale, puis sur le contrat si le certificat est ancré ;
+    renvoie (tx_hash, erreur). Après un échec, la révocation reste en
+    attente et retry_chain_revocations la renvoie.
+    """
+    revoke_certificate(cert, reason)
+    if not (cert.blockchain_hash and cert.file_hash and services.contract and services.issuer and ISSUER_PRIVATE_KEY):
+        return None, None
+    if not chain_revocation_enabled():
+        return None, "Le contrat déployé n'a pas de fonction revokeCertificate"
+    try:
+        return revoke_on_chain(certificate_id(cert.file_hash), reason), None
+    except Exception as e:
+        print(f"Blockchain revoke failed: {e}")
+        return None, str(e)
+
+# Une révocation plus récente peut encore attendre son reçu dans la requête qui l'a envoyée
+REVOCATION_RETRY_AFTER = TX_RECEIPT_TIMEOUT + 60
+
+def retry_chain_revocations(limit=50):
+    """Renvoie revokeCertificate pour les révocations ancrées en attente ; renvoie le nombre de réglées"""
+    from datetime import timedelta
+
+    if not chain_revocation_enabled():
+        return 0
+    cutoff = datetime.utcnow() - timedelta(seconds=REVOCATION_RETRY_AFTER)
+    pending = Revocation.query.filter(Revocation.chain_pending.is_(True), Revocation.revoked_at < cutoff) \
+        .order_by(Revocation.id).limit(limit).all()
+    settled = 0
+    for revocation in pending:
+        try:
+            if services.contract.functions.isRevoked(revocation.certificate_id).call():
+                # Un envoi précédent a fini par être miné : l'indexeur en fournira la transaction
+                revocation.chain_pending = False
+                db.session.commit()
+            else:
+                revoke_on_chain(revocation.certificate_id, revocation.reason or '')
+            settled += 1
+        except Exception as e:
+            db.session.rollback()
+            print(f"Révocation {revocation.certificate_id} sur la blockchain: {e}")
+    return settled
+
+@app.cli.command('index-chain')
+def index_chain_command():
+    """Rattrape l'index des événements CertificateIssued"""
+    if not services.indexer:
+        print("Smart contract non configuré")
+        return
+    print(f"{services.indexer.run_once()} événement(s) indexé(s)")
+
+@app.cli.command('repin-ipfs')
+def repin_ipfs_command():
+    """Ré-épingle maintenant les certificats sans ipfs_hash"""
+    print(f"{repin_missing_certificates()} certificat(s) ré-épinglé(s)")
+
+@app.cli.command('issue-pending')
+def issue_pending_command():
+    """Ancre en lots les certificats pas encore enregistrés sur la blockchain"""
+    if not services.contract or not services.issuer or not ISSUER_PRIVATE_KEY:
+        print("Smart contract non configuré")
+        return
+    print(f"{issue_pending_certificates()} certificat(s) ancré(s)")
+
+@app.cli.command('revoke-pending')
+def revoke_pending_command():
+    """Renvoie maintenant les révocations ancrées en attente sur la blockchain"""
+    if not chain_revocation_enabled():
+        print("Smart contract non configuré ou sans revokeCertificate")
+        return
+    print(f"{retry_chain_revocations()} révocation(s) réglée(s)")
+
+@app.cli.command('send-mail')
+def send_mail_command():
+    """Envoie maintenant les emails dus de la file"""
+    if not services.mail_dispatcher:
+        print("Serveur SMTP non configuré")
+        return
+    print(f"{services.mail_dispatcher.run_once()} email(s) envoyé(s)")
+
+@app.cli.command('migrate-db')
+@click.option('--status', is_flag=True, help="Lister les migrations sans les appliquer")
+def migrate_db_command(status):
+    """Applique les migrations du schéma en attente"""
+    if status:
+        waiting = migrations.pending()
+        for version, _ in migrations.MIGRATIONS:
+            print(f"{'en attente' if version in waiting else 'appliquée':12} {version}")
+        return
+    done = migrations.upgrade()
+    print(f"{len(done)} migration(s) appliquée(s)")
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Vérifie (SQLite) que les requêtes critiques utilisent un index"""
+    for name, steps in migrations.query_plans().items():
+        print(f"{name}: {' | '.join(steps)}")
+    missing = migrations.unindexed_queries()
+    if missing:
+        raise SystemExit(f"Parcours complet de table : {', '.join(missing)}")
+
+@app.cli.command('rpc-status')
+def rpc_status_command():
+    """Sonde les nœuds RPC et les affiche dans l'ordre de routage"""
+    pool = services.w3.provider
+    pool.check_health()
+    stats = pool.stats()
+    print(f"Tête: {stats['head']}  finalisé: {stats['finalized']}")
+    for node in stats['endpoints']:
+        state = 'ok' if node['healthy'] else 'écarté'
+        print(f"{node['endpoint']:40} {state:7} {node['latency_ms']} ms  bloc {node['head']}")
 
 # ==================== Routes ====================
 
@@ -185,7 +764,7 @@ def create_cert():
     if request.method == 'GET':
         return render_template('create_cert.html', institution=institution)
     
-    if not contract or not CHECKED_ISSUER:
+    if not services.contract or not services.issuer:
         return render_template('create_cert.html', error='Smart contract non configuré')
     
     try:
@@ -199,26 +778,24 @@ def create_cert():
         uploaded_file.save(file_path)
         
         file_hash = generate_file_hash(file_path)
-        cert_id = w3.solidity_keccak(['string'], [file_hash])
+        cert_id = services.w3.solidity_keccak(['string'], [file_hash])
         
-        ipfs_hash = upload_to_ipfs(file_path)
-        
-        nonce = w3.eth.get_transaction_count(CHECKED_ISSUER)
-        tx = contract.functions.issueCertificate(cert_id, ipfs_hash, name).build_transaction({
-            'chainId': 11155111,
-            'gas': 500000,
-            'gasPrice': w3.eth.gas_price,
-            'nonce': nonce,
-        })
+        # CID local, épinglage en arrière-plan
+        ipfs_hash = compute_file_cid(file_path)
+        services.ipfs_client.pin_async(file_path).add_done_callback(
+            lambda f: f.exception() and print(f"IPFS upload failed: {f.exception()}")
+        )
         
-        signed = w3.eth.account.sign_transaction(tx, private_key=ISSUER_PRIVATE_KEY)
-        tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-        w3.eth.wait_for_transaction_receipt(tx_hash)
+        with metrics.stage('tx_send'):
+            pending_tx = services.transactions.send(
+                services.contract.functions.issueCertificate(cert_id, ipfs_hash, name))
+        with metrics.stage('receipt_wait'):
+            receipt = services.transactions.wait(pending_tx)
         
         return render_template('create_cert.html', 
                              success=True,
-                             tx_hash=w3.to_hex(tx_hash),
-                             cert_id=w3.to_hex(cert_id),
+                             tx_hash=services.w3.to_hex(receipt['transactionHash']),
+                             cert_id=services.w3.to_hex(cert_id),
                              ipfs_hash=ipfs_hash)
         
     except Exception as e:
@@ -251,41 +828,98 @@ def verify():
 
         file_hash = generate_file_hash(file_path)
 
-        # D'abord vérifier dans la base de données
-        from models import Certificate
-        cert = Certificate.query.filter_by(file_hash=file_hash).first()
-
-        if cert:
-            return jsonify({
-                "verified": True,
-                "recipient": cert.recipient_name,
-                "issueDate": int(cert.created_at.timestamp()),
-                "ipfs": cert.ipfs_hash,
-                "certificate_type": cert.certificate_type,
-                "domain": cert.domain,
-                "message": "Certificat authentique trouvé dans la base de données"
-            })
-
-        # Si pas trouvé en DB, vérifier sur la blockchain
-        if contract:
-            cert_id = w3.solidity_keccak(['string'], [file_hash])
-            exists = contract.functions.verifyCertificate(cert_id).call()
-
-            if exists:
-                data = contract.functions.getCertificate(cert_id).call()
-                return jsonify({
-                    "verified": True,
-                    "recipient": data[1],
-                    "issueDate": data[2],
-                    "ipfs": data[0],
-                    "message": "Certificat authentique trouvé sur la blockchain"
-                })
-
-        return jsonify({"verified": False, "message": "Certificat non trouvé ou modifié"})
+        # Filtre des révocations avant le cache : une entrée d'un autre worker peut être périmée
+        if is_revoked(file_hash):
+            return jsonify(REVOKED_RESULT)
+
+        result = cache.get(f'verify:{file_hash}')
+        if result is None:
+            # PDF tamponné après l'ancrage : c'est une révision antérieure qui est ancrée
+            # (pas de cache : l'invalidation ne connaît que le hash ancré)
+            result = verify_stamped_pdf(file_path)
+        if result is None:
+            result = verify_file_hash(file_hash)
+            if result['verified']:
+                cache.set(f'verify:{file_hash}', result)
+        return jsonify(result)
 
     except Exception as e:
         return jsonify({"verified": False, "error": str(e)})
 
+def verify_stamped_pdf(file_path):
+    """Vérifie un PDF dont seule la mise à jour incrémentale du hash blockchain suit les octets ancrés"""
+    from pdf_generator import HASH_SLOTS, stamp_blockchain_hash
+    from pdf_incremental import revisions
+
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    for length, digest in revisions(data)[:-1]:
+        cert = Certificate.query.filter_by(file_hash=digest).first()
+        if not cert or not cert.blockchain_hash or cert.certificate_type not in HASH_SLOTS:
+            continue
+        # Toute autre modification ajoutée au fichier original est refusée
+        original = data[:length]
+        if original + stamp_blockchain_hash(original, cert.certificate_type, cert.blockchain_hash) == data:
+            return verify_file_hash(digest)
+    return None
+
+REVOKED_RESULT = {"verified": False, "revoked": True, "message": "Certificat révoqué par l'émetteur"}
+
+def certificate_id(file_hash):
+    """Identifiant bytes32 du certificat sur le contrat (solidityKeccak de file_hash), en hex, sans charger web3"""
+    from eth_hash.auto import keccak
+    return '0x' + keccak(file_hash.encode('utf-8')).hex()
+
+def is_revoked(file_hash):
+    return services.revocations.is_revoked(certificate_id(file_hash))
+
+def verify_file_hash(file_hash):
+    """Base de données, puis index local des événements, puis le contrat"""
+    if is_revoked(file_hash):
+        return REVOKED_RESULT
+
+    cert = Certificate.query.filter_by(file_hash=file_hash).first()
+    if cert and cert.status == 'revoked':
+        return REVOKED_RESULT
+
+    if cert:
+        return {
+            "verified": True,
+            "recipient": cert.recipient_name,
+            "issueDate": int(cert.created_at.timestamp()),
+            "ipfs": cert.ipfs_hash,
+            "certificate_type": cert.certificate_type,
+            "domain": cert.domain,
+            "message": "Certificat authentique trouvé dans la base de données"
+        }
+
+    # Si pas trouvé en DB, vérifier dans l'index local des événements
+    cert_id = services.w3.solidity_keccak(['string'], [file_hash])
+    indexed = chain_indexer.lookup(services.w3.to_hex(cert_id))
+    if indexed:
+        return {
+            "verified": True,
+            "recipient": indexed.recipient_name,
+            "issueDate": indexed.issue_date,
+            "ipfs": indexed.ipfs_hash,
+            "message": "Certificat authentique trouvé sur la blockchain"
+        }
+
+    # Blocs pas encore indexés : un seul appel au getter public
+    if services.contract:
+        ipfs, recipient, issue_date, exists = services.contract.functions.certificates(cert_id).call()
+
+        if exists:
+            return {
+                "verified": True,
+                "recipient": recipient,
+                "issueDate": issue_date,
+                "ipfs": ipfs,
+                "message": "Certificat authentique trouvé sur la blockchain"
+            }
+
+    return {"verified": False, "message": "Certificat non trouvé ou modifié"}
+
 @app.route('/api/certificates/public/<int:cert_id>')
 def get_public_certificate(cert_id):
     """Récupérer les informations publiques d'un certificat par ID"""
@@ -309,24 +943,57 @@ def verify_by_hash():
         if not blockchain_hash:
             return jsonify({"verified": False, "message": "Hash blockchain requis"})
 
+        cached = cache.get(f'verify-tx-hash:{blockchain_hash}')
+        if cached is not None and not is_revoked(cached['file_hash']):
+            return jsonify(cached['result'])
+
         # Rechercher le certificat par hash blockchain dans la DB
         cert = Certificate.query.filter_by(blockchain_hash=blockchain_hash).first()
 
+        if cert and (cert.status == 'revoked' or (cert.file_hash and is_revoked(cert.file_hash))):
+            return jsonify(REVOKED_RESULT)
+
         if cert:
-            return jsonify({
+            result = {
                 "verified": True,
                 "recipient": cert.recipient_name,
                 "issueDate": int(cert.created_at.timestamp()),  # Timestamp Unix
                 "ipfs": cert.ipfs_hash,
                 "certificate_type": cert.certificate_type,
                 "domain": cert.domain
-            })
+            }
+            if cert.file_hash:
+                cache.set(f'verify-tx-hash:{blockchain_hash}', {'file_hash': cert.file_hash, 'result': result})
+            return jsonify(result)
         else:
             return jsonify({"verified": False, "message": "Certificat non trouvé avec ce hash blockchain"})
 
     except Exception as e:
         return jsonify({"verified": False, "error": str(e)})
 
+@app.route('/api/verify/bulk', methods=['POST'])
+def verify_bulk():
+    """Vérifier des milliers de certificats en une requête (réponse NDJSON en flux)"""
+    data = request.json or {}
+    file_hashes = [h.strip() for h in data.get('file_hashes', []) if isinstance(h, str) and h.strip()]
+    tx_hashes = [h.strip() for h in data.get('tx_hashes', []) if isinstance(h, str) and h.strip()]
+
+    if not file_hashes and not tx_hashes:
+        return jsonify({"error": "file_hashes ou tx_hashes requis"}), 400
+    if len(file_hashes) + len(tx_hashes) > bulk_verify.MAX_ITEMS:
+        return jsonify({"error": f"Maximum {bulk_verify.MAX_ITEMS} éléments par requête"}), 413
+
+    def generate():
+        try:
+            for result in services.bulk_verifier.verify_file_hashes(file_hashes):
+                yield json.dumps(result) + '\n'
+            for result in services.bulk_verifier.verify_tx_hashes(tx_hashes):
+                yield json.dumps(result) + '\n'
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/logout', methods=['POST'])
 def logout():
     session.clear()
@@ -409,10 +1076,11 @@ def my_certificates():
 
 @app.route('/api/certificates/create', methods=['POST'])
 @login_required
+@idempotency.idempotent(ttl=IDEMPOTENCY_TTL, wait=IDEMPOTENCY_WAIT, lock_timeout=IDEMPOTENCY_LOCK_TIMEOUT)
 def create_certificate():
-    """API pour créer un certificat"""
+    """API pour créer un certificat ; avec Idempotency-Key, une nouvelle tentative rejoue la première réponse"""
     from models import Certificate, Institution
-    from pdf_generator import create_diploma_pdf, create_certification_pdf, create_badge_pdf
+    from pdf_generator import create_diploma_pdf, create_certification_pdf, create_badge_pdf, PENDING_HASH, stamp_blockchain_hash
 
     data = request.json or {}
     institution_id = session.get('institution_id')
@@ -420,6 +1088,18 @@ def create_certificate():
     if not institution_id:
         return jsonify({'message': 'Institution non authentifiée'}), 401
 
+    pdf_map = {
+        'diplome': create_diploma_pdf,
+        'certification': create_certification_pdf,
+        'badge': create_badge_pdf
+    }
+    pdf_func = pdf_map.get(data.get('certificate_type'))
+    if pdf_func is None:
+        return jsonify({'message': 'Type de certificat inconnu'}), 400
+
+    # Une erreur n'est renvoyée qu'avant l'enregistrement complet du certificat (ligne, PDF, hash) :
+    # la ligne est alors supprimée, et une nouvelle tentative (même Idempotency-Key) ne crée pas de doublon
+    row_id = None
     try:
         cert = Certificate(
             institution_id=institution_id,
@@ -432,7 +1112,9 @@ def create_certificate():
             status='created'
         )
         db.session.add(cert)
-        db.session.commit()
+        with metrics.stage('db_commit'):
+            db.session.commit()
+        row_id = cert.id
 
         # Préparer les données pour le PDF
         institution = Institution.query.get(institution_id)
@@ -443,20 +1125,11 @@ def create_certificate():
         pdf_payload['graduation_date'] = data.get('graduation_date', datetime.now().strftime('%d/%m/%Y'))
         pdf_payload['cert_number'] = f'CERT-{datetime.now().year}-{cert.id:05d}'
         pdf_payload['duration'] = data.get('duration', 'N/A')
-        pdf_payload['blockchain_hash'] = 'En cours...'  # Placeholder temporaire
-
-        pdf_map = {
-            'diplome': create_diploma_pdf,
-            'certification': create_certification_pdf,
-            'badge': create_badge_pdf
-        }
-
-        pdf_func = pdf_map.get(cert.certificate_type)
-        if pdf_func is None:
-            return jsonify({'message': 'Type de certificat inconnu'}), 400
+        pdf_payload['blockchain_hash'] = PENDING_HASH  # Remplacé par une mise à jour incrémentale après l'ancrage
 
         # Générer le PDF initial
-        pdf_buffer = pdf_func(pdf_payload)
+        with metrics.stage('render'):
+            pdf_buffer = pdf_func(pdf_payload)
 
         # Sauvegarder le PDF localement
         os.makedirs(os.path.join('certs', 'uploads'), exist_ok=True)
@@ -467,54 +1140,97 @@ def create_certificate():
             f.write(pdf_buffer.read())
 
         # Calculer le hash du fichier
-        file_hash = generate_file_hash(file_path)
-        cert.file_hash = file_hash
+        # CID calculé localement : la transaction n'attend pas Pinata,
+        # l'épinglage part en arrière-plan et confirmera le même CID
+        with metrics.stage('hash'):
+            file_hash = generate_file_hash(file_path)
+            cert.file_hash = file_hash
+            pdf_buffer.seek(0)
+            pdf_bytes = pdf_buffer.read()
+            cert.ipfs_hash = compute_cid(pdf_bytes)
+        cert.ipfs_pinned = False
+        # 'issuing' : issue_pending_certificates ne reprend pas ce certificat pendant l'attente du reçu
+        anchoring = bool(services.contract and services.issuer and ISSUER_PRIVATE_KEY)
+        if anchoring:
+            cert.status = 'issuing'
+        with metrics.stage('db_commit'):
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        if row_id is not None:
+            _discard_certificate(row_id)
+        return jsonify({'message': str(e)}), 400
+
+    # Certificat enregistré : la suite (épinglage, ancrage, tampon) est reprise par le sweeper et
+    # issue-pending en cas d'échec, et la réponse 201 est conservée pour les nouvelles tentatives
+    try:
+        pin_in_background(cert.id, pdf_bytes, filename, cert.ipfs_hash)
+    except Exception as e:
+        print(f"⚠️  Épinglage du cert {cert.id} non lancé, repris par le sweeper: {e}")
 
-        # Uploader sur IPFS
+    # Enregistrer sur la blockchain si possible
+    blockchain_hash = None
+    if anchoring:
         try:
-            ipfs_hash = upload_to_ipfs(file_path)
-            cert.ipfs_hash = ipfs_hash
+            cert_id = services.w3.solidity_keccak(['string'], [file_hash])
+            with metrics.stage('tx_send'):
+                pending_tx = services.transactions.send(services.contract.functions.issueCertificate(
+                    cert_id, cert.ipfs_hash or '', cert.recipient_name))
+            with metrics.stage('receipt_wait'):
+                receipt = services.transactions.wait(pending_tx)
+            blockchain_hash = services.w3.to_hex(receipt['transactionHash'])
+            cert.blockchain_hash = blockchain_hash
+            cert.status = 'issued'
+            notify_recipients([cert])
         except Exception as e:
-            cert.ipfs_hash = None
-            print(f"IPFS upload failed: {e}")
-
-        # Enregistrer sur la blockchain si possible
-        blockchain_hash = None
-        if contract and CHECKED_ISSUER and ISSUER_PRIVATE_KEY:
-            try:
-                cert_id = w3.solidity_keccak(['string'], [file_hash])
-                nonce = w3.eth.get_transaction_count(CHECKED_ISSUER)
-                tx = contract.functions.issueCertificate(cert_id, cert.ipfs_hash or '', cert.recipient_name).build_transaction({
-                    'chainId': 11155111,
-                    'gas': 500000,
-                    'gasPrice': w3.eth.gas_price,
-                    'nonce': nonce,
-                })
-                signed = w3.eth.account.sign_transaction(tx, private_key=ISSUER_PRIVATE_KEY)
-                tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
-                w3.eth.wait_for_transaction_receipt(tx_hash)
-                blockchain_hash = w3.to_hex(tx_hash)
-                cert.blockchain_hash = blockchain_hash
-                cert.status = 'issued'
-            except Exception as e:
-                print(f"Blockchain issue failed: {e}")
+            cert.status = 'created'  # repris par issue-pending
+            print(f"Blockchain issue failed: {e}")
 
-        # Régénérer le PDF avec le vrai hash blockchain si disponible
+    try:
+        # Hash blockchain ajouté en fin de fichier : les octets ancrés restent un préfixe exact
         if blockchain_hash:
-            pdf_payload['blockchain_hash'] = blockchain_hash[:20] + '...'  # Tronquer pour l'affichage
-            pdf_buffer_final = pdf_func(pdf_payload)
-            pdf_buffer_final.seek(0)
-            with open(file_path, 'wb') as f:
-                f.write(pdf_buffer_final.read())
+            with metrics.stage('render'):
+                update = stamp_blockchain_hash(pdf_bytes, cert.certificate_type, blockchain_hash)
+            with open(file_path, 'ab') as f:
+                f.write(update)
+
+        with metrics.stage('db_commit'):
+            db.session.commit()
+    except Exception as e:
+        # Transaction minée mais non enregistrée : le certificat reste 'issuing', issue-pending retrouve son hash
+        db.session.rollback()
+        print(f"⚠️  Enregistrement de l'ancrage du cert {cert.id} échoué: {e}")
+
+    return jsonify({
+        'message': 'Certificat créé et enregistré (local/ipfs/blockchain si disponible)',
+        'certificate_id': cert.id,
+        'certificate': cert.to_dict()
+    }), 201
 
+def _discard_certificate(cert_id):
+    """Supprime un certificat dont la création a échoué avant son enregistrement complet"""
+    from models import Certificate
+
+    try:
+        Certificate.query.filter_by(id=cert_id).delete(synchronize_session=False)
         db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️  Suppression du certificat incomplet {cert_id} échouée: {e}")
+    file_path = certificate_file_path(cert_id)
+    if os.path.exists(file_path):
+        os.remove(file_path)
 
-        return jsonify({
-            'message': 'Certificat créé et enregistré (local/ipfs/blockchain si disponible)',
-            'certificate_id': cert.id,
-            'certificate': cert.to_dict()
-        }), 201
+@app.route('/api/certificates/issue-pending', methods=['POST'])
+@login_required
+def issue_pending():
+    """Ancrer sur la blockchain, en lots, les certificats de l'institution encore en attente"""
+    if not services.contract or not services.issuer or not ISSUER_PRIVATE_KEY:
+        return jsonify({'message': 'Smart contract non configuré'}), 503
 
+    try:
+        issued = issue_pending_certificates(session.get('institution_id'))
+        return jsonify({'message': f'{issued} certificat(s) ancré(s)', 'issued': issued}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': str(e)}), 400
@@ -526,10 +1242,14 @@ def get_certificates():
     from models import Certificate
     
     institution_id = session.get('institution_id')
-    certificates = Certificate.query.filter_by(institution_id=institution_id).all()
+    listing = cache.get(f'certs:{institution_id}')
+    if listing is None:
+        certificates = Certificate.query.filter_by(institution_id=institution_id).all()
+        listing = [cert.to_dict() for cert in certificates]
+        cache.set(f'certs:{institution_id}', listing)
     
     return jsonify({
-        'certificates': [cert.to_dict() for cert in certificates]
+        'certificates': listing
     }), 200
 
 @app.route('/api/certificates/<int:cert_id>', methods=['DELETE'])
@@ -545,6 +1265,9 @@ def delete_certificate(cert_id):
         return jsonify({'message': 'Certificat non trouvé'}), 404
     
     try:
+        # Un certificat ancré resterait vérifiable sur la blockchain : il est d'abord révoqué
+        if cert.blockchain_hash and cert.status != 'revoked':
+            revoke_everywhere(cert, 'Certificat supprimé')
         db.session.delete(cert)
         db.session.commit()
         return jsonify({'message': 'Certificat supprimé'}), 200
@@ -552,6 +1275,29 @@ def delete_certificate(cert_id):
         db.session.rollback()
         return jsonify({'message': str(e)}), 400
 
+@app.route('/api/certificates/<int:cert_id>/revoke', methods=['POST'])
+@login_required
+def revoke(cert_id):
+    """Révoquer un certificat : /verify et la vérification en masse le rejettent"""
+    data = request.get_json(silent=True) or {}
+    institution_id = session.get('institution_id')
+    cert = Certificate.query.filter_by(id=cert_id, institution_id=institution_id).first()
+
+    if not cert:
+        return jsonify({'message': 'Certificat non trouvé'}), 404
+    if cert.status == 'revoked':
+        return jsonify({'message': 'Certificat déjà révoqué'}), 409
+
+    try:
+        tx_hash, error = revoke_everywhere(cert, (data.get('reason') or '').strip()[:255])
+        response = {'message': 'Certificat révoqué', 'certificate': cert.to_dict(), 'revocation_tx': tx_hash}
+        if error:
+            response['blockchain_error'] = error
+        return jsonify(response), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+
 @app.route('/certificate/<int:cert_id>')
 @login_required
 def view_certificate(cert_id):
@@ -569,9 +1315,8 @@ def view_certificate(cert_id):
 @app.route('/certificate/<int:cert_id>/download')
 @login_required
 def download_certificate_file(cert_id):
-    """Télécharger un certificat comme PDF"""
-    from models import Certificate, Institution
-    from pdf_generator import create_diploma_pdf, create_certification_pdf, create_badge_pdf
+    """Télécharger le PDF enregistré : octets ancrés + tampon du hash blockchain, vérifiable par /verify"""
+    from models import Certificate
     from flask import send_file
 
     institution_id = session.get('institution_id')
@@ -580,37 +1325,24 @@ def download_certificate_file(cert_id):
     if not cert:
         return render_template('404.html'), 404
 
-    # Préparer les données pour le PDF
-    institution = Institution.query.get(institution_id)
-    data = cert.data or {}
-    pdf_payload = dict(data)
-    pdf_payload['institution_name'] = institution.name if institution else pdf_payload.get('institution_name', 'Institution')
-    pdf_payload['recipient_name'] = cert.recipient_name
-    pdf_payload['graduation_date'] = data.get('graduation_date', datetime.now().strftime('%d/%m/%Y'))
-    pdf_payload['cert_number'] = f'CERT-{datetime.now().year}-{cert.id:05d}'
-    pdf_payload['duration'] = data.get('duration', 'N/A')
-    pdf_payload['blockchain_hash'] = (cert.blockchain_hash[:20] + '...' if cert.blockchain_hash else 'Non disponible')
+    # Un nouveau rendu ne serait pas le document ancré et échouerait à la vérification
+    file_path = certificate_file_path(cert.id)
+    if not os.path.exists(file_path):
+        return jsonify({'error': 'Fichier du certificat introuvable sur ce serveur'}), 404
 
-    pdf_map = {
-        'diplome': create_diploma_pdf,
-        'certification': create_certification_pdf,
-        'badge': create_badge_pdf
-    }
+    return send_file(
+        os.path.abspath(file_path),
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'{cert.certificate_type}_{cert.recipient_name}_{cert.id}.pdf'
+    )
 
-    try:
-        pdf_func = pdf_map.get(cert.certificate_type)
-        if pdf_func:
-            pdf_buffer = pdf_func(pdf_payload)
-            return send_file(
-                pdf_buffer,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f'{cert.certificate_type}_{cert.recipient_name}_{cert.id}.pdf'
-            )
-        else:
-            return jsonify({'error': 'Type de certificat inconnu'}), 400
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+# ==================== Metrics ====================
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques au format texte Prometheus"""
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
 
 # ==================== Error Handlers ====================
 
@@ -626,5 +1358,6 @@ def server_error(error):
 
 if __name__ == '__main__':
     with app.app_context():
-        db.create_all()
+        migrations.upgrade()
+    start_background_jobs()
     app.run(debug=True, port=5000)
\ No newline at end of file
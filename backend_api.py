@@ -8,6 +8,10 @@ import os
 import threading
 from pathlib import Path
 import hashlib
+import io
+from contextlib import contextmanager
+
+import erasure
 
 app = Flask(__name__)
 CORS(app)
@@ -18,6 +22,11 @@ NETWORK_PORT = 9000
 UPLOAD_FOLDER = Path('./uploads')
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 
+# Files at least this large are erasure coded (k data + m parity fragments)
+ERASURE_THRESHOLD = 16 * 1024 * 1024
+ERASURE_K = 4
+ERASURE_M = 2
+
 # Simple user database (in production, use a real database)
 users_db = {
     'demo@example.com': {
@@ -29,21 +38,427 @@ users_db = {
     }
 }
 
-# Active transfers tracking
+# user_id -> user record (same dicts as users_db)
+users_by_id = {user['user_id']: user for user in users_db.values()}
+
+RECONCILE_INTERVAL = 300  # seconds between quota reconciliations
+
+
+class QuotaLedger:
+    """Per-user storage accounting: committed bytes plus in-flight reservations"""
+    
+    def __init__(self, users):
+        self.users = users  # user_id -> user record
+        self.lock = threading.Lock()
+        self.reservations = {}  # reservation_id -> (user_id, nbytes)
+        self.reserved = {}  # user_id -> bytes reserved by in-flight uploads
+        self.versions = {}  # user_id -> counter bumped on every commit/free
+        self.mutations = {}  # user_id -> deletes under way in the network
+    
+    def reserve(self, user_id, nbytes):
+        """Reserve space for an upload, returns a reservation id or None if over quota"""
+        with self.lock:
+            user = self.users.get(user_id)
+            if not user:
+                return None
+            reserved = self.reserved.get(user_id, 0)
+            if user['used_storage'] + reserved + nbytes > user['storage_quota']:
+                return None
+            reservation_id = str(uuid.uuid4())
+            self.reservations[reservation_id] = (user_id, nbytes)
+            self.reserved[user_id] = reserved + nbytes
+            return reservation_id
+    
+    def commit(self, reservation_id):
+        """Turn a reservation into used storage once the upload is stored"""
+        with self.lock:
+            user_id, nbytes = self.reservations.pop(reservation_id)
+            self.reserved[user_id] -= nbytes
+            self.users[user_id]['used_storage'] += nbytes
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+    
+    def release(self, reservation_id):
+        """Give back a reservation whose upload failed"""
+        with self.lock:
+            entry = self.reservations.pop(reservation_id, None)
+            if entry:
+                user_id, nbytes = entry
+                self.reserved[user_id] -= nbytes
+    
+    def free(self, user_id, nbytes):
+        """Give back storage of a deleted file"""
+        with self.lock:
+            user = self.users[user_id]
+            user['used_storage'] = max(0, user['used_storage'] - nbytes)
+            self.versions[user_id] = self.versions.get(user_id, 0) + 1
+    
+    @contextmanager
+    def mutation(self, user_id):
+        """Mark a network change (delete) whose ledger update comes after it"""
+        with self.lock:
+            self.mutations[user_id] = self.mutations.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.mutations[user_id] -= 1
+                self.versions[user_id] = self.versions.get(user_id, 0) + 1
+    
+    def _busy(self, user_id):
+        """An upload or delete has reached the network but not the ledger yet"""
+        return self.reserved.get(user_id, 0) > 0 or self.mutations.get(user_id, 0) > 0
+    
+    def usage(self, user_id):
+        """Snapshot of quota, used and reserved bytes"""
+        with self.lock:
+            user = self.users[user_id]
+            return {
+                'storage_quota': user['storage_quota'],
+                'used_storage': user['used_storage'],
+                'reserved_storage': self.reserved.get(user_id, 0)
+            }
+    
+    def expand(self, user_id, nbytes):
+        """Raise a user's quota"""
+        with self.lock:
+            self.users[user_id]['storage_quota'] += nbytes
+            return self.users[user_id]['storage_quota']
+    
+    def reconcile(self, user_id, fetch_files):
+        """Reset used storage to the sizes registered in the network.
+        
+        Retries if a commit or free happened while the file list was fetched,
+        so the result never drops bytes committed concurrently. Skipped while
+        the user has an open reservation or a delete under way: the network
+        already shows a change the ledger will apply, which would then count
+        twice (upload) or not at all (delete). Returns None when skipped.
+        """
+        for _ in range(3):
+            with self.lock:
+                if self._busy(user_id):
+                    return None
+                version = self.versions.get(user_id, 0)
+            files = fetch_files(user_id)
+            if files is None:
+                return None
+            total = sum(f.get('file_size', 0) for f in files)
+            with self.lock:
+                if self._busy(user_id):
+                    return None
+                if self.versions.get(user_id, 0) == version:
+                    self.users[user_id]['used_storage'] = total
+                    return total
+        return None
+
+
+quota_ledger = QuotaLedger(users_by_id)
+
+# Active transfers tracking (gateway side of each transfer)
 active_transfers = {}
+transfers_lock = threading.Lock()
 
 def communicate_with_network(message: dict) -> dict:
     """Send message to network server"""
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.connect((NETWORK_HOST, NETWORK_PORT))
-        sock.send(json.dumps(message).encode('utf-8'))
-        response = json.loads(sock.recv(8192).decode('utf-8'))
+        sock.sendall(json.dumps(message).encode('utf-8'))
+        # Large responses (transfer lists) can span several reads
+        response = {'status': 'error', 'message': 'Empty response'}
+        data = b''
+        while True:
+            chunk = sock.recv(8192)
+            if not chunk:
+                break
+            data += chunk
+            try:
+                response = json.loads(data.decode('utf-8'))
+                break
+            except ValueError:
+                continue
         sock.close()
         return response
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
+def _track_transfer(transfer_id, **fields):
+    """Create or update the gateway view of a transfer"""
+    with transfers_lock:
+        transfer = active_transfers.setdefault(transfer_id, {'transfer_id': transfer_id, 'bytes_sent': 0})
+        transfer.update(fields)
+        transfer['last_update'] = time.time()
+        return transfer
+
+def _finish_transfer(transfer_id, status):
+    """Mark a transfer finished and drop old finished ones.
+    
+    Failures are also sent to the network server: the node may never report
+    the transfer done, which would leave it in progress there and keep
+    counting it in the node's load.
+    """
+    if status == 'failed':
+        communicate_with_network({'type': 'finish_transfers', 'transfer_ids': [transfer_id], 'status': status})
+    now = time.time()
+    with transfers_lock:
+        if transfer_id in active_transfers:
+            active_transfers[transfer_id]['status'] = status
+            active_transfers[transfer_id]['finished_at'] = now
+        for tid in [t for t, info in active_transfers.items()
+                    if info.get('finished_at') and now - info['finished_at'] > 60]:
+            del active_transfers[tid]
+
+def send_file_to_node(node, file_id, file_name, file_path, file_size, transfer_id):
+    """Stream a local file to a storage node"""
+    sock = socket.create_connection((node['ip'], node['port']), timeout=30)
+    try:
+        sock.sendall(json.dumps({
+            'type': 'upload',
+            'file_id': file_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'transfer_id': transfer_id
+        }).encode('utf-8'))
+        
+        ready = sock.recv(1024)
+        if ready != b'READY':
+            return json.loads(ready.decode('utf-8'))
+        
+        with open(file_path, 'rb') as f:
+            while True:
+                chunk = f.read(8192)
+                if not chunk:
+                    break
+                sock.sendall(chunk)
+                with transfers_lock:
+                    active_transfers[transfer_id]['bytes_sent'] += len(chunk)
+        
+        return json.loads(sock.recv(4096).decode('utf-8'))
+    finally:
+        sock.close()
+
+def fetch_file_from_node(node, file_id, dest_path, transfer_id):
+    """Download a file from a storage node to a local path"""
+    sock = socket.create_connection((node['ip'], node['port']), timeout=30)
+    try:
+        sock.sendall(json.dumps({
+            'type': 'download',
+            'file_id': file_id,
+            'transfer_id': transfer_id
+        }).encode('utf-8'))
+        
+        header = json.loads(sock.recv(4096).decode('utf-8'))
+        if header.get('status') != 'success':
+            return header
+        
+        file_size = header['file_size']
+        _track_transfer(transfer_id, file_size=file_size)
+        sock.sendall(b'READY')
+        
+        received = 0
+        with open(dest_path, 'wb') as f:
+            while received < file_size:
+                chunk = sock.recv(min(8192, file_size - received))
+                if not chunk:
+                    break
+                f.write(chunk)
+                received += len(chunk)
+                with transfers_lock:
+                    active_transfers[transfer_id]['bytes_sent'] += len(chunk)
+        
+        if received < file_size:
+            return {'status': 'error', 'message': 'Incomplete download'}
+        return {'status': 'success', 'file_size': file_size}
+    finally:
+        sock.close()
+
+def delete_from_node(node, file_id):
+    """Ask a storage node to delete an object; failures are only logged"""
+    try:
+        sock = socket.create_connection((node['ip'], node['port']), timeout=10)
+        sock.sendall(json.dumps({'type': 'delete', 'file_id': file_id}).encode('utf-8'))
+        sock.recv(4096)
+        sock.close()
+    except Exception as e:
+        print(f"⚠️  Delete on node {node['node_id']} failed: {e}")
+
+def store_single_copy(user_id, file_id, file_name, file_path, file_size):
+    """Store a whole file on the node picked by the network server"""
+    placement = communicate_with_network({
+        'type': 'upload_request',
+        'file_size': file_size,
+        'user_id': user_id,
+        'file_id': file_id
+    })
+    if placement.get('status') != 'success':
+        return {'status': 'error', 'message': placement.get('message'), 'code': 503}
+    
+    node = placement['node']
+    transfer_id = placement['transfer_id']
+    _track_transfer(transfer_id, direction='upload', user_id=user_id, file_id=file_id,
+                    file_name=file_name, file_size=file_size,
+                    node_id=node['node_id'], status='in_progress', started_at=time.time())
+    
+    try:
+        result = send_file_to_node(node, file_id, file_name, file_path, file_size, transfer_id)
+    except Exception as e:
+        result = {'status': 'error', 'message': str(e)}
+    
+    if result.get('status') != 'success':
+        _finish_transfer(transfer_id, 'failed')
+        return {'status': 'error', 'message': result.get('message'), 'code': 502}
+    
+    return {
+        'status': 'success',
+        'node_ids': [node['node_id']],
+        'transfer_ids': [transfer_id],
+        'file_info': {
+            'file_id': file_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'upload_time': time.time()
+        }
+    }
+
+def store_erasure_coded(user_id, file_id, file_name, file_path, file_size):
+    """Encode a file into k+m fragments and store each on a distinct node"""
+    k, m = ERASURE_K, ERASURE_M
+    fragment_ids = [f"{file_id}.frag{i}" for i in range(k + m)]
+    fragment_size = erasure.fragment_size(file_size, k)
+    
+    placement = communicate_with_network({
+        'type': 'upload_fragments_request',
+        'fragment_size': fragment_size,
+        'fragment_ids': fragment_ids,
+        'user_id': user_id
+    })
+    if placement.get('status') != 'success':
+        return {'status': 'error', 'message': placement.get('message'), 'fallback': True}
+    
+    fragment_paths = [UPLOAD_FOLDER / fragment_id for fragment_id in fragment_ids]
+    transfer_ids = [entry['transfer_id'] for entry in placement['placements']]
+    fragments = []
+    stored = False
+    try:
+        fragment_files = [open(path, 'wb') for path in fragment_paths]
+        try:
+            with open(file_path, 'rb') as src:
+                erasure.encode_file(src, file_size, k, m, fragment_files)
+        finally:
+            for f in fragment_files:
+                f.close()
+        
+        for index, (entry, path) in enumerate(zip(placement['placements'], fragment_paths)):
+            node = entry['node']
+            transfer_id = entry['transfer_id']
+            _track_transfer(transfer_id, direction='upload', user_id=user_id,
+                            file_id=entry['fragment_id'], file_name=file_name,
+                            file_size=fragment_size, node_id=node['node_id'],
+                            status='in_progress', started_at=time.time())
+            try:
+                result = send_file_to_node(node, entry['fragment_id'], f"{file_name}.frag{index}",
+                                           path, fragment_size, transfer_id)
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            
+            if result.get('status') != 'success':
+                return {'status': 'error', 'message': result.get('message'), 'code': 502}
+            
+            fragments.append({
+                'index': index,
+                'fragment_id': entry['fragment_id'],
+                'node_id': node['node_id']
+            })
+        stored = True
+    finally:
+        for path in fragment_paths:
+            path.unlink(missing_ok=True)
+        if not stored:
+            # Nothing registers these fragments: remove the ones already sent
+            for fragment in fragments:
+                delete_from_node(placement['placements'][fragment['index']]['node'], fragment['fragment_id'])
+            for transfer_id in transfer_ids:
+                _finish_transfer(transfer_id, 'failed')
+    
+    return {
+        'status': 'success',
+        'node_ids': [],
+        'transfer_ids': transfer_ids,
+        'file_info': {
+            'file_id': file_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'upload_time': time.time(),
+            'storage_mode': 'erasure',
+            'k': k,
+            'm': m,
+            'fragment_size': fragment_size,
+            'fragments': fragments
+        }
+    }
+
+def fetch_erasure_coded(user_id, file_info, dest_path):
+    """Download any k fragments of an erasure-coded file and rebuild it"""
+    k, m = file_info['k'], file_info['m']
+    fetched = {}
+    
+    for fragment in file_info['fragments']:
+        if len(fetched) == k:
+            break
+        locations = communicate_with_network({
+            'type': 'download_request',
+            'file_id': fragment['fragment_id'],
+            'user_id': user_id
+        })
+        if locations.get('status') != 'success' or not locations.get('nodes'):
+            continue
+        
+        transfer_id = locations['transfer_id']
+        _track_transfer(transfer_id, direction='download', user_id=user_id,
+                        file_id=fragment['fragment_id'], status='in_progress', started_at=time.time())
+        path = UPLOAD_FOLDER / f"dl_{transfer_id}"
+        for node in locations['nodes']:
+            try:
+                result = fetch_file_from_node(node, fragment['fragment_id'], path, transfer_id)
+            except Exception as e:
+                result = {'status': 'error', 'message': str(e)}
+            if result.get('status') == 'success':
+                fetched[fragment['index']] = path
+                _finish_transfer(transfer_id, 'completed')
+                break
+        else:
+            path.unlink(missing_ok=True)
+            _finish_transfer(transfer_id, 'failed')
+    
+    try:
+        if len(fetched) < k:
+            return {'status': 'error', 'message': f'Only {len(fetched)} of {k} fragments reachable'}
+        
+        fragment_files = {index: open(path, 'rb') for index, path in fetched.items()}
+        try:
+            with open(dest_path, 'wb') as dest:
+                erasure.decode_file(fragment_files, k, m, file_info['file_size'], dest)
+        finally:
+            for f in fragment_files.values():
+                f.close()
+        return {'status': 'success'}
+    finally:
+        for path in fetched.values():
+            path.unlink(missing_ok=True)
+
+def fetch_user_files(user_id):
+    """Files registered for a user in the network, or None on error"""
+    response = communicate_with_network({'type': 'get_user_files', 'user_id': user_id})
+    if response.get('status') != 'success':
+        return None
+    return response['files']
+
+def _reconcile_loop():
+    """Periodically realign used storage with the network registry"""
+    while True:
+        time.sleep(RECONCILE_INTERVAL)
+        for user_id in list(users_by_id):
+            quota_ledger.reconcile(user_id, fetch_user_files)
+
 # ← ADD THIS NEW ROUTE HERE (after the helper function, before other routes)
 @app.route('/')
 def index():
@@ -68,6 +483,198 @@ def login():
 
 # ... rest of your code stays the same ...
 
+@app.route('/api/files/upload', methods=['POST'])
+def upload_file():
+    """Upload a file to the storage network"""
+    user_id = request.form.get('user_id')
+    uploaded = request.files.get('file')
+    
+    if not user_id or not uploaded:
+        return jsonify({'status': 'error', 'message': 'user_id and file required'}), 400
+    if user_id not in users_by_id:
+        return jsonify({'status': 'error', 'message': 'User not found'}), 404
+    
+    # Cheap early rejection before spooling the body to disk
+    usage = quota_ledger.usage(user_id)
+    remaining = usage['storage_quota'] - usage['used_storage'] - usage['reserved_storage']
+    if request.content_length and request.content_length > remaining + 64 * 1024:
+        return jsonify({'status': 'error', 'message': 'Storage quota exceeded'}), 413
+    
+    file_id = str(uuid.uuid4())
+    temp_path = UPLOAD_FOLDER / file_id
+    uploaded.save(temp_path)
+    file_size = temp_path.stat().st_size
+    
+    reservation_id = quota_ledger.reserve(user_id, file_size)
+    if not reservation_id:
+        temp_path.unlink(missing_ok=True)
+        return jsonify({'status': 'error', 'message': 'Storage quota exceeded'}), 413
+    committed = False
+    
+    try:
+        result = None
+        if file_size >= ERASURE_THRESHOLD:
+            result = store_erasure_coded(user_id, file_id, uploaded.filename, temp_path, file_size)
+            if result.get('fallback'):
+                result = None  # not enough nodes, store a single copy instead
+        if result is None:
+            result = store_single_copy(user_id, file_id, uploaded.filename, temp_path, file_size)
+        
+        if result.get('status') != 'success':
+            return jsonify({'status': 'error', 'message': result['message']}), result.get('code', 502)
+        
+        file_info = result['file_info']
+        communicate_with_network({
+            'type': 'register_file',
+            'file_id': file_id,
+            'node_ids': result['node_ids'],
+            'user_id': user_id,
+            'file_info': file_info
+        })
+        quota_ledger.commit(reservation_id)
+        committed = True
+        for transfer_id in result['transfer_ids']:
+            _finish_transfer(transfer_id, 'completed')
+        
+        return jsonify({'status': 'success', 'file': file_info, 'transfer_ids': result['transfer_ids']})
+    finally:
+        if not committed:
+            quota_ledger.release(reservation_id)
+        temp_path.unlink(missing_ok=True)
+
+@app.route('/api/files/<file_id>/download')
+def download_file(file_id):
+    """Download a file from the storage network"""
+    user_id = request.args.get('user_id')
+    
+    files = fetch_user_files(user_id) if user_id else None
+    file_info = next((f for f in files or [] if f['file_id'] == file_id), None)
+    if file_info and file_info.get('storage_mode') == 'erasure':
+        dest_path = UPLOAD_FOLDER / f"dl_{uuid.uuid4()}"
+        result = fetch_erasure_coded(user_id, file_info, dest_path)
+        if result['status'] != 'success':
+            dest_path.unlink(missing_ok=True)
+            return jsonify(result), 502
+        return _send_and_remove(dest_path, file_info['file_name'])
+    
+    locations = communicate_with_network({
+        'type': 'download_request',
+        'file_id': file_id,
+        'user_id': user_id
+    })
+    
+    if locations.get('status') != 'success' or not locations.get('nodes'):
+        return jsonify({'status': 'error', 'message': 'File not available'}), 404
+    
+    transfer_id = locations['transfer_id']
+    _track_transfer(transfer_id, direction='download', user_id=user_id, file_id=file_id,
+                    status='in_progress', started_at=time.time())
+    dest_path = UPLOAD_FOLDER / f"dl_{transfer_id}"
+    
+    # Nodes are ordered least loaded first; fall back to the next replica on error
+    for node in locations['nodes']:
+        try:
+            result = fetch_file_from_node(node, file_id, dest_path, transfer_id)
+        except Exception as e:
+            result = {'status': 'error', 'message': str(e)}
+        if result.get('status') == 'success':
+            _finish_transfer(transfer_id, 'completed')
+            return _send_and_remove(dest_path, file_info['file_name'] if file_info else file_id)
+    
+    dest_path.unlink(missing_ok=True)
+    _finish_transfer(transfer_id, 'failed')
+    return jsonify({'status': 'error', 'message': 'Download failed'}), 502
+
+def _send_and_remove(path, download_name):
+    """Send a temp file to the client and delete it"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    path.unlink(missing_ok=True)
+    return send_file(io.BytesIO(data), as_attachment=True, download_name=download_name)
+
+@app.route('/api/files/<file_id>', methods=['DELETE'])
+def delete_file(file_id):
+    """Delete a file from the storage network and free its quota"""
+    user_id = request.args.get('user_id')
+    files = fetch_user_files(user_id)
+    if files is None:
+        return jsonify({'status': 'error', 'message': 'Network unavailable'}), 503
+    
+    file_info = next((f for f in files if f['file_id'] == file_id), None)
+    if not file_info:
+        return jsonify({'status': 'error', 'message': 'File not found'}), 404
+    
+    stored_ids = [f['fragment_id'] for f in file_info.get('fragments', [])] or [file_id]
+    with quota_ledger.mutation(user_id):
+        for stored_id in stored_ids:
+            locations = communicate_with_network({'type': 'get_file_locations', 'file_id': stored_id})
+            for node in locations.get('nodes', []):
+                delete_from_node(node, stored_id)
+        
+        communicate_with_network({'type': 'delete_file', 'file_id': file_id, 'user_id': user_id})
+        quota_ledger.free(user_id, file_info['file_size'])
+    
+    return jsonify({'status': 'success'})
+
+@app.route('/api/storage/usage')
+def storage_usage():
+    """Quota, used and reserved storage for a user"""
+    user_id = request.args.get('user_id')
+    if user_id not in users_by_id:
+        return jsonify({'status': 'error', 'message': 'User not found'}), 404
+    return jsonify({'status': 'success', **quota_ledger.usage(user_id)})
+
+@app.route('/api/storage/reconcile', methods=['POST'])
+def reconcile_storage():
+    """Realign a user's used storage with the files registered in the network"""
+    user_id = (request.json or {}).get('user_id')
+    if user_id not in users_by_id:
+        return jsonify({'status': 'error', 'message': 'User not found'}), 404
+    
+    used = quota_ledger.reconcile(user_id, fetch_user_files)
+    if used is None:
+        return jsonify({'status': 'error',
+                        'message': 'Reconciliation failed or upload/delete in progress, retry later'}), 503
+    return jsonify({'status': 'success', **quota_ledger.usage(user_id)})
+
+@app.route('/api/transfers')
+def list_transfers():
+    """Live transfer progress for a user, as seen by the network server"""
+    user_id = request.args.get('user_id')
+    response = communicate_with_network({'type': 'get_transfers', 'user_id': user_id})
+    if response.get('status') != 'success':
+        return jsonify(response), 503
+    
+    with transfers_lock:
+        for transfer in response['transfers']:
+            local = active_transfers.get(transfer['transfer_id'])
+            if local:
+                transfer['gateway_bytes'] = local['bytes_sent']
+    return jsonify(response)
+
+@app.route('/api/transfers/<transfer_id>')
+def get_transfer(transfer_id):
+    """Progress of a single transfer"""
+    response = communicate_with_network({'type': 'get_transfers', 'transfer_id': transfer_id})
+    transfers = response.get('transfers') or []
+    with transfers_lock:
+        local = dict(active_transfers.get(transfer_id) or {})
+    
+    if not transfers and not local:
+        return jsonify({'status': 'error', 'message': 'Transfer not found'}), 404
+    
+    transfer = transfers[0] if transfers else {}
+    if local:
+        transfer.setdefault('transfer_id', transfer_id)
+        transfer['gateway_bytes'] = local['bytes_sent']
+        transfer.setdefault('status', local.get('status'))
+    return jsonify({'status': 'success', 'transfer': transfer})
+
+@app.route('/api/nodes/stats')
+def node_stats():
+    """Per-node throughput and load"""
+    return jsonify(communicate_with_network({'type': 'get_node_stats'}))
+
 @app.route('/api/storage/expand', methods=['POST'])
 def expand_storage():
     """Expand user storage (simulates adding a new node)"""
@@ -75,23 +682,16 @@ def expand_storage():
     user_id = data.get('user_id')
     additional_gb = data.get('additional_gb', 5)
     
-    # Find user
-    user = None
-    for u in users_db.values():
-        if u['user_id'] == user_id:
-            user = u
-            break
-    
-    if not user:
+    if user_id not in users_by_id:
         return jsonify({'status': 'error', 'message': 'User not found'}), 404
     
     # Increase quota
     additional_bytes = additional_gb * 1024 * 1024 * 1024
-    user['storage_quota'] += additional_bytes
+    new_quota = quota_ledger.expand(user_id, additional_bytes)
     
     return jsonify({
         'status': 'success',
-        'new_quota': user['storage_quota'],
+        'new_quota': new_quota,
         'message': f'Storage expanded by {additional_gb}GB'
     })
 
@@ -103,6 +703,7 @@ if __name__ == '__main__':
     print(f"Network Server: {NETWORK_HOST}:{NETWORK_PORT}")
     print("="*60 + "\n")
     
+    threading.Thread(target=_reconcile_loop, daemon=True).start()
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
     
 # ← REMOVE THIS PART - it's in the wrong place and will never execute
\ No newline at end of file
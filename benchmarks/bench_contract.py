@@ -0,0 +1,113 @@
+"""
+CertificateRegistry on a local EVM: gas and latency per certificate for
+single vs batched issuance, and per-id reads vs getCertificates.
+
+Compiles smart_contracts/certificate.sol with py-solc-x (downloads the
+compiler on first run) and deploys it on eth-tester, so no node is needed:
+
+    pip install py-solc-x "eth-tester[py-evm]"
+
+Usage: python benchmarks/bench_contract.py [count] [batch_size]
+"""
+
+import os
+import sys
+import time
+
+import solcx
+from web3 import Web3, EthereumTesterProvider
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOLC_VERSION = '0.8.19'
+
+
+def compile_registry():
+    if SOLC_VERSION not in [str(v) for v in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(SOLC_VERSION)
+    compiled = solcx.compile_files(
+        [os.path.join(ROOT, 'smart_contracts', 'certificate.sol')],
+        output_values=['abi', 'bin'],
+        solc_version=SOLC_VERSION
+    )
+    _, artifact = next((k, v) for k, v in compiled.items() if k.endswith(':CertificateRegistry'))
+    return artifact['abi'], artifact['bin']
+
+
+def deploy(w3, abi, bytecode):
+    factory = w3.eth.contract(abi=abi, bytecode=bytecode)
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor().transact())
+    return w3.eth.contract(address=receipt['contractAddress'], abi=abi)
+
+
+def cert_args(w3, start, count):
+    ids = [w3.solidity_keccak(['string'], [f'file-hash-{i}']) for i in range(start, start + count)]
+    cids = [f'bafkreitest{i:08d}' for i in range(start, start + count)]
+    names = [f'Recipient {i}' for i in range(start, start + count)]
+    return ids, cids, names
+
+
+def issue_single(w3, contract, ids, cids, names):
+    gas = 0
+    for cert_id, cid, name in zip(ids, cids, names):
+        tx_hash = contract.functions.issueCertificate(cert_id, cid, name).transact()
+        gas += w3.eth.wait_for_transaction_receipt(tx_hash)['gasUsed']
+    return gas
+
+
+def issue_batched(w3, contract, ids, cids, names, batch_size):
+    gas = 0
+    for i in range(0, len(ids), batch_size):
+        tx_hash = contract.functions.issueCertificates(
+            ids[i:i + batch_size], cids[i:i + batch_size], names[i:i + batch_size]
+        ).transact({'gas': 30_000_000})
+        gas += w3.eth.wait_for_transaction_receipt(tx_hash)['gasUsed']
+    return gas
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    abi, bytecode = compile_registry()
+    w3 = Web3(EthereumTesterProvider())
+    w3.eth.default_account = w3.eth.accounts[0]
+    contract = deploy(w3, abi, bytecode)
+
+    single = cert_args(w3, 0, count)
+    batched = cert_args(w3, count, count)
+
+    start = time.perf_counter()
+    single_gas = issue_single(w3, contract, *single)
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched_gas = issue_batched(w3, contract, *batched, batch_size)
+    batched_time = time.perf_counter() - start
+
+    # Reads: half issued ids, half unknown ids (getCertificate would revert on those)
+    lookups = batched[0][:count // 2] + cert_args(w3, 10 * count, count - count // 2)[0]
+
+    start = time.perf_counter()
+    found_single = sum(contract.functions.certificates(cert_id).call()[3] for cert_id in lookups)
+    read_single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found_batched = 0
+    for i in range(0, len(lookups), batch_size):
+        found_batched += sum(contract.functions.getCertificates(lookups[i:i + batch_size]).call()[3])
+    read_batched_time = time.perf_counter() - start
+    assert found_single == found_batched == count // 2
+
+    print(f"{count} certificates, batch size {batch_size}\n")
+    print(f"{'':30}{'gas / cert':>12}{'ms / cert':>12}{'calls':>8}")
+    print(f"{'issueCertificate':30}{single_gas / count:>12.0f}{1000 * single_time / count:>12.2f}{count:>8}")
+    print(f"{'issueCertificates':30}{batched_gas / count:>12.0f}{1000 * batched_time / count:>12.2f}"
+          f"{-(-count // batch_size):>8}")
+    print(f"{'certificates(id) reads':30}{'':>12}{1000 * read_single_time / count:>12.2f}{count:>8}")
+    print(f"{'getCertificates reads':30}{'':>12}{1000 * read_batched_time / count:>12.2f}"
+          f"{-(-count // batch_size):>8}")
+    print(f"\nBatched issuance saves {100 * (1 - batched_gas / single_gas):.1f}% gas per certificate.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Idempotency-Key check for POST /api/certificates/create.
+
+Runs app.py against a scratch SQLite database and FakePinata (no chain), and
+replays what flaky clients do:
+
+  retries      each create is sent 3 times with the same key: one
+               certificate, one render, the retries replay the first body
+  concurrent   8 simultaneous requests with the same key: one certificate,
+               all 8 get the same response
+  mismatch     same key with another body is refused (422)
+  failure      a failed request (400) releases its key
+  expiry       an expired key is accepted again as a new request
+
+and compares the time spent on retries with and without a key.
+Exits 1 when any of these does not hold.
+
+Usage: python benchmarks/bench_idempotency.py [creates]
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_pinata import FakePinata
+
+RETRIES = 3
+CONCURRENT = 8
+
+
+def payload(i):
+    return {'certificate_type': 'badge', 'recipient_name': f'Recipient {i}', 'recipient_email': '',
+            'domain': 'Informatique', 'badge_name': f'Badge {i}'}
+
+
+def load_app(workdir, pinata_url):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('IPFS_SWEEP_INTERVAL', '0')
+    os.environ['PINATA_API_URL'] = pinata_url
+    os.environ.setdefault('PINATA_API_KEY', 'bench')
+    os.environ.setdefault('PINATA_SECRET_KEY', 'bench')
+    import app as certichain
+    from models import db, Institution
+
+    certichain.app.config['TESTING'] = True
+    certichain.services.contract = None  # no chain: certificates stay 'created'
+    with certichain.app.app_context():
+        db.drop_all()
+        certichain.migrations.upgrade()
+        institution = Institution(name='Bench', email='idempotency@bench.local')
+        institution.set_password('bench')
+        db.session.add(institution)
+        db.session.commit()
+        return certichain, institution.id
+
+
+def client_for(certichain, institution_id):
+    client = certichain.app.test_client()
+    with client.session_transaction() as session:
+        session['institution_id'] = institution_id
+    return client
+
+
+def certificates(certichain):
+    from models import Certificate
+    with certichain.app.app_context():
+        return Certificate.query.count()
+
+
+def create(client, body, key=None):
+    headers = {'Idempotency-Key': key} if key else {}
+    return client.post('/api/certificates/create', json=body, headers=headers)
+
+
+def check_retries(certichain, client, count, failures):
+    before = certificates(certichain)
+    start = time.perf_counter()
+    for i in range(count):
+        for _ in range(RETRIES):
+            create(client, payload(i))
+    without_key = time.perf_counter() - start
+    created_without = certificates(certichain) - before
+
+    before = certificates(certichain)
+    start = time.perf_counter()
+    mismatched = replayed = 0
+    for i in range(count):
+        first = create(client, payload(i), key=f'retry-{i}')
+        for _ in range(RETRIES - 1):
+            again = create(client, payload(i), key=f'retry-{i}')
+            replayed += again.headers.get('Idempotent-Replayed') == 'true'
+            mismatched += (again.status_code, again.get_data()) != (first.status_code, first.get_data())
+    with_key = time.perf_counter() - start
+    created_with = certificates(certichain) - before
+
+    print(f"{'retries':<22}{'certificates':>14}{'seconds':>10}")
+    print(f"{'without key':<22}{created_without:>14}{without_key:>10.2f}")
+    print(f"{'with Idempotency-Key':<22}{created_with:>14}{with_key:>10.2f}")
+    if created_with != count:
+        failures.append(f'retries: {created_with} certificates for {count} keys')
+    if replayed != count * (RETRIES - 1) or mismatched:
+        failures.append(f'retries: {replayed} replays, {mismatched} differing from the first response')
+
+
+def check_concurrent(certichain, institution_id, failures):
+    before = certificates(certichain)
+    responses = [None] * CONCURRENT
+    barrier = threading.Barrier(CONCURRENT)
+
+    def send(slot):
+        client = client_for(certichain, institution_id)
+        barrier.wait()
+        responses[slot] = create(client, payload('concurrent'), key='concurrent')
+
+    threads = [threading.Thread(target=send, args=(slot,)) for slot in range(CONCURRENT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    created = certificates(certichain) - before
+    ids = {response.get_json().get('certificate_id') for response in responses}
+    codes = sorted(response.status_code for response in responses)
+    print(f"\nconcurrent: {CONCURRENT} requests, {created} certificate(s), status {codes}, ids {sorted(map(str, ids))}")
+    if created != 1 or len(ids) != 1 or codes != [201] * CONCURRENT:
+        failures.append(f'concurrent: {created} certificates, ids {ids}, status {codes}')
+
+
+def check_edges(certichain, client, failures):
+    from models import db, IdempotencyKey
+
+    mismatch = create(client, payload('other'), key='retry-0')
+    print(f"mismatch: {mismatch.status_code}")
+    if mismatch.status_code != 422:
+        failures.append(f'mismatch: status {mismatch.status_code}')
+
+    failed = create(client, dict(payload('bad'), certificate_type='unknown'), key='failing')
+    with certichain.app.app_context():
+        kept = IdempotencyKey.query.filter_by(key='failing').count()
+    print(f"failure: {failed.status_code}, key kept: {bool(kept)}")
+    if failed.status_code != 400 or kept:
+        failures.append(f'failure: status {failed.status_code}, key kept {bool(kept)}')
+
+    with certichain.app.app_context():
+        IdempotencyKey.query.filter_by(key='retry-0').update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+    before = certificates(certichain)
+    expired = create(client, payload(0), key='retry-0')
+    created = certificates(certichain) - before
+    print(f"expiry: {expired.status_code}, replayed: {expired.headers.get('Idempotent-Replayed') == 'true'}, "
+          f"{created} new certificate(s)")
+    if expired.status_code != 201 or created != 1:
+        failures.append(f'expiry: status {expired.status_code}, {created} new certificates')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    failures = []
+    pinata = FakePinata().start()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)  # rendered PDFs go to workdir/certs/uploads
+            certichain, institution_id = load_app(workdir, pinata.url)
+            client = client_for(certichain, institution_id)
+            check_retries(certichain, client, count, failures)
+            check_concurrent(certichain, institution_id, failures)
+            check_edges(certichain, client, failures)
+            os.chdir(ROOT)
+    finally:
+        pinata.stop()
+
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Cold-start cost of `import app`: median wall time over fresh interpreters,
+plus the heaviest modules reported by `python -X importtime`.
+
+With --budget the script exits 1 when the median exceeds it, so it can gate
+CI or a pre-deploy check (web3 and the IPFS client must stay out of the
+import path; they are built on first use by services.py).
+
+Usage: python benchmarks/bench_import.py [--runs 5] [--top 10] [--budget 1000]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TIMER = (
+    "import time; t = time.perf_counter(); import app; "
+    "print((time.perf_counter() - t) * 1000)"
+)
+
+
+def _env(workdir):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    return env
+
+
+def _workdir():
+    # app.py creates certs/uploads relative to the working directory
+    workdir = tempfile.mkdtemp(prefix='certichain-import-')
+    return workdir
+
+
+def cold_import_ms(runs, workdir):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', TIMER], cwd=workdir, env=_env(workdir),
+                             capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def top_modules(top, workdir):
+    """Modules with the largest cumulative import time (ms), outermost first"""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=workdir,
+                         env=_env(workdir), capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative) / 1000, depth, name.strip()))
+    return sorted(rows, key=lambda r: (-r[0], r[1]))[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--budget', type=float, help='fail when the median import exceeds this (ms)')
+    args = parser.parse_args()
+
+    workdir = _workdir()
+    samples = cold_import_ms(args.runs, workdir)
+    median = statistics.median(samples)
+    print(f"import app: median {median:.0f} ms over {args.runs} runs "
+          f"(min {min(samples):.0f}, max {max(samples):.0f})")
+    print("\nheaviest imports (cumulative ms):")
+    for ms, depth, name in top_modules(args.top, workdir):
+        print(f"  {ms:8.1f}  {'  ' * depth}{name}")
+
+    if args.budget is not None and median > args.budget:
+        print(f"\nover budget: {median:.0f} ms > {args.budget:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
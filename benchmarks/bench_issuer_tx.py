@@ -0,0 +1,339 @@
+"""
+Issuer transaction throughput and latency under fee-market congestion.
+
+Runs a local stand-in chain (JSON-RPC over HTTP) with an EIP-1559 fee
+market: blocks every BLOCK_TIME seconds, a base fee that follows block
+fullness, and synthetic competing demand whose volume and tips spike during
+periodic congestion windows. Blocks are filled by effective tip, and a
+transaction must fit in the remaining block gas by its gas limit.
+
+The same sequential issuance queue is then driven twice:
+
+  legacy      gasPrice from eth_gasPrice, fixed 500k gas limit, wait for
+              the receipt (the previous app.py code path)
+  tx_manager  tx_manager.TxManager: fees from the eth_feeHistory window,
+              estimated gas, replacement after REPLACE_AFTER blocks
+
+and reports throughput, latency (blocks and seconds), replacements, stuck
+transactions and average fee paid. Exits 1 if a tx_manager transaction is
+never mined or a nonce is reused by two mined transactions.
+
+Usage: python benchmarks/bench_issuer_tx.py [transactions]
+"""
+
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rlp
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from eth_hash.auto import keccak
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import TimeExhausted
+
+import config
+import tx_manager
+
+GWEI = 10 ** 9
+BLOCK_TIME = 0.2  # seconds
+BLOCK_GAS_LIMIT = 3_000_000
+CALM_BLOCKS, CONGESTED_BLOCKS = 12, 18
+ISSUER_KEY = '0x' + '42' * 32
+CONTRACT = Web3.to_checksum_address('0x' + '6d' * 20)
+STUCK_AFTER = 80  # blocks before a legacy transaction counts as stuck
+
+
+def _int(value):
+    return int.from_bytes(value, 'big') if isinstance(value, bytes) else int(value)
+
+
+def decode_raw(raw):
+    """Sender, nonce, fee caps and gas limit of a signed transaction"""
+    sender = Account.recover_transaction(raw)
+    if raw[0] >= 0xc0:
+        nonce, gas_price, gas = (_int(x) for x in rlp.decode(raw)[:3])
+        max_fee = tip = gas_price
+    else:
+        tx = TypedTransaction.from_bytes(HexBytes(raw)).as_dict()
+        nonce, gas = tx['nonce'], tx['gas']
+        max_fee, tip = tx['maxFeePerGas'], tx['maxPriorityFeePerGas']
+    return {'from': sender, 'nonce': nonce, 'gas': gas, 'max_fee': max_fee, 'tip': tip,
+            'hash': '0x' + keccak(raw).hex()}
+
+
+class CongestedChain:
+    """Stand-in JSON-RPC chain with an EIP-1559 fee market and bursts of competing demand"""
+
+    def __init__(self, seed=1, block_time=BLOCK_TIME, gas_limit=BLOCK_GAS_LIMIT):
+        self.rng = random.Random(seed)
+        self.block_time = block_time
+        self.gas_limit = gas_limit
+        self.base_fee = 2 * GWEI
+        self.blocks = []  # {'base_fee', 'gas_used', 'tips'}
+        self.mempool = {}  # (sender, nonce) -> tx
+        self.nonces = {}  # sender -> next confirmed nonce
+        self.receipts = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def height(self):
+        return len(self.blocks)
+
+    def congested(self, height):
+        return height % (CALM_BLOCKS + CONGESTED_BLOCKS) >= CALM_BLOCKS
+
+    def _competitors(self, height):
+        if self.congested(height):
+            count, tips = 40, (3, 9)
+        else:
+            count, tips = 8, (0.5, 2)
+        return [{'from': None, 'gas': 100_000, 'tip': int(self.rng.uniform(*tips) * GWEI),
+                 'max_fee': self.base_fee * 3} for _ in range(count)]
+
+    def mine(self):
+        with self.lock:
+            height = self.height + 1
+            candidates = [tx for tx in self.mempool.values() if tx['nonce'] == self.nonces.get(tx['from'], 0)]
+            candidates += self._competitors(height)
+            candidates = [tx for tx in candidates if tx['max_fee'] >= self.base_fee]
+            candidates.sort(key=lambda tx: min(tx['tip'], tx['max_fee'] - self.base_fee), reverse=True)
+
+            used, tips = 0, []
+            for tx in candidates:
+                if used + tx['gas'] > self.gas_limit:
+                    continue
+                tip = min(tx['tip'], tx['max_fee'] - self.base_fee)
+                gas_used = tx.get('gas_used', tx['gas'])
+                used += gas_used
+                tips.append(tip)
+                if tx['from'] is not None:
+                    del self.mempool[(tx['from'], tx['nonce'])]
+                    self.nonces[tx['from']] = tx['nonce'] + 1
+                    self.receipts[tx['hash']] = {
+                        'transactionHash': tx['hash'], 'blockHash': '0x' + keccak(str(height).encode()).hex(),
+                        'blockNumber': hex(height), 'transactionIndex': hex(len(tips) - 1),
+                        'from': tx['from'], 'to': CONTRACT, 'status': '0x1', 'type': '0x2',
+                        'gasUsed': hex(gas_used), 'cumulativeGasUsed': hex(used),
+                        'effectiveGasPrice': hex(self.base_fee + tip), 'contractAddress': None,
+                        'logs': [], 'logsBloom': '0x' + '00' * 256
+                    }
+            self.blocks.append({'base_fee': self.base_fee, 'gas_used': used, 'tips': sorted(tips)})
+            target = self.gas_limit // 2
+            self.base_fee = max(GWEI // 10, self.base_fee + self.base_fee * (used - target) // target // 8)
+
+    def _mining_loop(self):
+        while self.running:
+            time.sleep(self.block_time)
+            self.mine()
+
+    def fee_history(self, count, percentiles):
+        with self.lock:
+            blocks = self.blocks[-count:]
+            rewards = []
+            for block in blocks:
+                tips = block['tips'] or [0]
+                rewards.append([hex(tips[min(len(tips) - 1, int(len(tips) * p / 100))]) for p in percentiles])
+            return {
+                'oldestBlock': hex(self.height - len(blocks) + 1),
+                'baseFeePerGas': [hex(b['base_fee']) for b in blocks] + [hex(self.base_fee)],
+                'gasUsedRatio': [b['gas_used'] / self.gas_limit for b in blocks],
+                'reward': rewards
+            }
+
+    def send_raw(self, raw_hex):
+        raw = bytes.fromhex(raw_hex[2:])
+        tx = decode_raw(raw)
+        tx['gas_used'] = 80_000
+        with self.lock:
+            if tx['nonce'] < self.nonces.get(tx['from'], 0):
+                raise ValueError('nonce too low')
+            previous = self.mempool.get((tx['from'], tx['nonce']))
+            if previous is not None:
+                if previous['hash'] == tx['hash']:
+                    raise ValueError('already known')
+                if tx['max_fee'] < previous['max_fee'] * 1.1 or tx['tip'] < previous['tip'] * 1.1:
+                    raise ValueError('replacement transaction underpriced')
+            self.mempool[(tx['from'], tx['nonce'])] = tx
+        return tx['hash']
+
+    def answer(self, method, params):
+        if method == 'eth_chainId':
+            return hex(config.CHAIN_ID)
+        if method == 'eth_blockNumber':
+            return hex(self.height)
+        if method == 'eth_gasPrice':
+            return hex(self.base_fee + GWEI)
+        if method == 'eth_feeHistory':
+            return self.fee_history(_block_count(params[0]), params[2])
+        if method == 'eth_estimateGas':
+            return hex(80_000)
+        if method == 'eth_getTransactionCount':
+            with self.lock:
+                confirmed = self.nonces.get(Web3.to_checksum_address(params[0]), 0)
+                if params[1] != 'pending':
+                    return hex(confirmed)
+                mine = [n for (sender, n) in self.mempool if sender.lower() == params[0].lower()]
+                return hex(max([confirmed - 1] + mine) + 1)
+        if method == 'eth_sendRawTransaction':
+            return self.send_raw(params[0])
+        if method == 'eth_getTransactionReceipt':
+            with self.lock:
+                return self.receipts.get(params[0])
+        raise ValueError(f'method not found: {method}')
+
+    def _handler(self):
+        chain = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                reply = {'jsonrpc': '2.0', 'id': request['id']}
+                try:
+                    reply['result'] = chain.answer(request['method'], request.get('params', []))
+                except ValueError as e:
+                    reply['error'] = {'code': -32000, 'message': str(e)}
+                data = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        threading.Thread(target=self._mining_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _block_count(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def _setup(chain):
+    w3 = Web3(Web3.HTTPProvider(chain.url))
+    issuer = Account.from_key(ISSUER_KEY).address
+    contract = w3.eth.contract(address=CONTRACT, abi=config.load_contract_abi())
+    return w3, issuer, contract
+
+
+def _call(contract, i):
+    return contract.functions.issueCertificate(keccak(f'bench-{i}'.encode()), f'bafy{i}', f'Recipient {i}')
+
+
+def run_legacy(chain, count):
+    """Previous code path: eth_gasPrice, fixed gas, one transaction at a time"""
+    w3, issuer, contract = _setup(chain)
+    results = []
+    for i in range(count):
+        sent_block, start = chain.height, time.perf_counter()
+        tx = _call(contract, i).build_transaction({
+            'chainId': config.CHAIN_ID,
+            'gas': 500000,
+            'gasPrice': w3.eth.gas_price,
+            'nonce': w3.eth.get_transaction_count(issuer),
+        })
+        signed = w3.eth.account.sign_transaction(tx, private_key=ISSUER_KEY)
+        tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction)
+        try:
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=STUCK_AFTER * chain.block_time,
+                                                          poll_latency=0.05)
+        except TimeExhausted:
+            results.append(None)
+            break  # the queue is blocked behind this nonce
+        results.append((receipt, receipt['blockNumber'] - sent_block, time.perf_counter() - start))
+    return results, 0
+
+
+def run_tx_manager(chain, count):
+    w3, issuer, contract = _setup(chain)
+    manager = tx_manager.TxManager(w3, issuer, ISSUER_KEY, config.CHAIN_ID, poll_interval=0.05,
+                                   receipt_timeout=STUCK_AFTER * chain.block_time)
+    manager.oracle.ttl = chain.block_time
+    replaced = tx_manager.TX_REPLACEMENTS.values.get((), 0)
+    results = []
+    for i in range(count):
+        sent_block, start = chain.height, time.perf_counter()
+        try:
+            receipt = manager.transact(_call(contract, i))
+        except TimeoutError:
+            results.append(None)
+            break
+        results.append((receipt, receipt['blockNumber'] - sent_block, time.perf_counter() - start))
+    return results, tx_manager.TX_REPLACEMENTS.values.get((), 0) - replaced
+
+
+def report(name, results, replaced, elapsed):
+    mined = [r for r in results if r is not None]
+    blocks = sorted(r[1] for r in mined) or [0]
+    seconds = sorted(r[2] for r in mined) or [0]
+    fees = [r[0]['gasUsed'] * r[0]['effectiveGasPrice'] / GWEI / 1e6 for r in mined] or [0]
+
+    def pick(samples, q):
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    print(f"{name:<12}{len(mined):>7}{len(mined) / elapsed:>9.2f}{pick(blocks, 50):>8}{pick(blocks, 99):>8}"
+          f"{pick(seconds, 50):>8.2f}{pick(seconds, 99):>8.2f}{replaced:>10}{len(results) - len(mined):>7}"
+          f"{statistics.mean(fees):>12.4f}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    failures = []
+    print(f"{count} issuances, block every {BLOCK_TIME}s, congestion {CONGESTED_BLOCKS} of every "
+          f"{CALM_BLOCKS + CONGESTED_BLOCKS} blocks\n")
+    print(f"{'strategy':<12}{'mined':>7}{'tx/s':>9}{'p50 blk':>8}{'p99 blk':>8}{'p50 s':>8}{'p99 s':>8}"
+          f"{'replaced':>10}{'stuck':>7}{'fee (mETH)':>12}")
+    for name, run in (('legacy', run_legacy), ('tx_manager', run_tx_manager)):
+        chain = CongestedChain(seed=7).start()
+        try:
+            start = time.perf_counter()
+            results, replaced = run(chain, count)
+            report(name, results, replaced, time.perf_counter() - start)
+        finally:
+            chain.stop()
+        if name == 'tx_manager':
+            mined = [r for r in results if r is not None]
+            if len(mined) != count:
+                failures.append(f'tx_manager: {count - len(mined)} transaction(s) never mined')
+            nonces = [chain.nonces.get(Account.from_key(ISSUER_KEY).address, 0)]
+            if nonces[0] != len(mined):
+                failures.append(f'tx_manager: {len(mined)} mined for {nonces[0]} nonces used')
+
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
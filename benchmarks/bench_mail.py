@@ -0,0 +1,243 @@
+"""
+Mail outbox check and throughput benchmark against a local SMTP stand-in.
+
+Runs an aiosmtpd server (AUTH LOGIN/PLAIN, no TLS) that can inject
+transient failures (451 on DATA) and permanent bounces (550 for
+@bounce.test recipients), and drives mailer.Dispatcher over a scratch
+SQLite outbox:
+
+  throughput   N queued messages drained by the dispatcher's workers over
+               persistent authenticated connections, versus one connection
+               per message (connect, EHLO, AUTH, send, QUIT, as a plain
+               Flask-Mail send does)
+  reliability  transient failures are retried until delivered exactly
+               once, bounces are dead-lettered without retries
+  rate limit   the per-provider token bucket holds the configured rate
+
+Fails (exit 1) on a lost, duplicated or wrongly dead-lettered message, or
+when the observed rate exceeds the limit by more than 10%.
+
+    pip install aiosmtpd
+
+Usage: python benchmarks/bench_mail.py [messages]
+"""
+
+import logging
+import os
+import random
+import smtplib
+import socket
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import Counter
+from email.message import EmailMessage
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+from flask import Flask
+
+import mailer
+from database import init_db
+from models import db, OutboxMessage
+
+USERNAME, PASSWORD = 'bench', 'secret'
+
+# AUTH without TLS is intended: the stand-in only listens on 127.0.0.1
+logging.getLogger('mail.log').setLevel(logging.ERROR)
+warnings.filterwarnings('ignore', module='aiosmtpd')
+
+
+class StandIn:
+    """aiosmtpd handler: records deliveries by Message-ID and counts connections"""
+
+    def __init__(self, transient_rate=0.0, seed=1):
+        self.transient_rate = transient_rate
+        self.rng = random.Random(seed)
+        self.delivered = Counter()
+        self.sessions = set()
+        self.lock = threading.Lock()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address.endswith('@bounce.test'):
+            return '550 5.1.1 No such user'
+        envelope.rcpt_tos.append(address)
+        return '250 OK'
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            self.sessions.add(id(session))
+            if self.rng.random() < self.transient_rate:
+                return '451 4.3.0 Try again later'
+            message_id = next((line.split(':', 1)[1].strip() for line in
+                               envelope.content.decode('utf-8', 'replace').splitlines()
+                               if line.lower().startswith('message-id:')), None)
+            self.delivered[message_id] += 1
+        return '250 Message accepted'
+
+
+def _authenticate(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=auth_data.login == USERNAME.encode() and auth_data.password == PASSWORD.encode())
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(handler):
+    controller = Controller(handler, hostname='127.0.0.1', port=_free_port(), authenticator=_authenticate,
+                            auth_require_tls=False, auth_required=True)
+    controller.start()
+    return controller
+
+
+def make_app(workdir):
+    app = Flask('bench_mail')
+    init_db(app, f"sqlite:///{os.path.join(workdir, 'outbox.db')}")
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def enqueue(app, count, bounce_every=0):
+    with app.app_context():
+        OutboxMessage.query.delete()
+        for i in range(count):
+            domain = 'bounce.test' if bounce_every and i % bounce_every == 0 else 'example.test'
+            mailer.enqueue(f'recipient{i}@{domain}', 'Votre certificat est disponible',
+                           f'Bonjour {i},\n\nVotre certificat est enregistré.\n')
+        db.session.commit()
+
+
+def drain(dispatcher, timeout=600):
+    """Run the dispatcher's workers until nothing is pending or sending; returns elapsed seconds"""
+    start = time.perf_counter()
+    dispatcher.start()
+    try:
+        while time.perf_counter() - start < timeout:
+            with dispatcher.app.app_context():
+                left = OutboxMessage.query.filter(OutboxMessage.status.in_(['pending', 'sending'])).count()
+            if not left:
+                break
+            time.sleep(0.05)
+    finally:
+        dispatcher.stop()
+    return time.perf_counter() - start
+
+
+def statuses(app):
+    with app.app_context():
+        return Counter(status for status, in db.session.query(OutboxMessage.status))
+
+
+def dispatcher_for(app, controller, **options):
+    options.setdefault('rate_limit', 10 ** 6)
+    options.setdefault('poll_interval', 0.05)
+    return mailer.Dispatcher(app, controller.hostname, controller.port, USERNAME, PASSWORD,
+                             use_tls=False, sender='noreply@certichain.test', **options)
+
+
+def per_message_connections(controller, count):
+    """Baseline: a new authenticated connection for every message"""
+    start = time.perf_counter()
+    for i in range(count):
+        message = EmailMessage()
+        message['From'] = 'noreply@certichain.test'
+        message['To'] = f'recipient{i}@example.test'
+        message['Subject'] = 'Votre certificat est disponible'
+        message.set_content(f'Bonjour {i},\n\nVotre certificat est enregistré.\n')
+        with smtplib.SMTP(controller.hostname, controller.port) as smtp:
+            smtp.login(USERNAME, PASSWORD)
+            smtp.send_message(message)
+    return time.perf_counter() - start
+
+
+def check_throughput(app, count, failures):
+    handler = StandIn()
+    controller = start_server(handler)
+    try:
+        baseline_count = min(count, 2000)
+        baseline = per_message_connections(controller, baseline_count)
+
+        enqueue(app, count)
+        dispatcher = dispatcher_for(app, controller, workers=mailer.WORKERS)
+        handler.sessions.clear()
+        elapsed = drain(dispatcher)
+        sent = statuses(app)['sent']
+
+        print(f"{'strategy':<34}{'messages':>10}{'msg/s':>10}{'connections':>13}")
+        print(f"{'connection per message':<34}{baseline_count:>10}{baseline_count / baseline:>10.0f}"
+              f"{baseline_count:>13}")
+        print(f"{f'outbox, {mailer.WORKERS} persistent connections':<34}{sent:>10}{sent / elapsed:>10.0f}"
+              f"{len(handler.sessions):>13}")
+        if sent != count:
+            failures.append(f'throughput: {sent}/{count} sent')
+    finally:
+        controller.stop()
+
+
+def check_reliability(app, count, failures):
+    saved = mailer.RETRY_BASE
+    mailer.RETRY_BASE = 0  # retries due immediately
+    handler = StandIn(transient_rate=0.05)
+    controller = start_server(handler)
+    try:
+        enqueue(app, count, bounce_every=50)
+        drain(dispatcher_for(app, controller, workers=2, max_attempts=20))
+        result = statuses(app)
+        with app.app_context():
+            retried = OutboxMessage.query.filter(OutboxMessage.status == 'sent', OutboxMessage.attempts > 1).count()
+            bounced_attempts = {a for a, in db.session.query(OutboxMessage.attempts)
+                                .filter(OutboxMessage.status == 'dead')}
+        bounces = len(range(0, count, 50))
+        duplicates = sum(1 for n in handler.delivered.values() if n > 1)
+        print(f"\nreliability: {result['sent']} sent ({retried} after a 451 retry), {result['dead']} dead-lettered, "
+              f"{duplicates} duplicate(s)")
+        if result['sent'] != count - bounces or len(handler.delivered) != count - bounces:
+            failures.append(f"reliability: {result['sent']} sent, {len(handler.delivered)} delivered, "
+                            f"expected {count - bounces}")
+        if result['dead'] != bounces or bounced_attempts - {1}:
+            failures.append(f"reliability: {result['dead']} dead (attempts {bounced_attempts}), expected {bounces} x 1")
+        if duplicates:
+            failures.append(f'reliability: {duplicates} message(s) delivered twice')
+    finally:
+        controller.stop()
+        mailer.RETRY_BASE = saved
+
+
+def check_rate_limit(app, failures, rate=200, count=600):
+    controller = start_server(StandIn())
+    try:
+        enqueue(app, count)
+        elapsed = drain(dispatcher_for(app, controller, workers=4, rate_limit=rate))
+        # The bucket starts full: `rate` messages go out at once
+        observed = (count - rate) / elapsed
+        print(f"rate limit: {observed:.0f} msg/s observed for a limit of {rate}/s")
+        if observed > rate * 1.1:
+            failures.append(f'rate limit: {observed:.0f} msg/s for a limit of {rate}/s')
+    finally:
+        controller.stop()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        app = make_app(workdir)
+        check_throughput(app, count, failures)
+        check_reliability(app, min(count, 2000), failures)
+        check_rate_limit(app, failures)
+
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
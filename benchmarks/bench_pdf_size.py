@@ -0,0 +1,83 @@
+"""
+PDF determinism and size check for pdf_generator.
+
+Renders every template twice per payload and fails (exit 1) unless both
+renders are byte-identical, then reports the average PDF size with the
+default reportlab settings versus pdf_generator's (invariant rendering,
+page compression, binary rather than ASCII85 streams). Size drives IPFS
+pinning cost.
+
+Usage: python benchmarks/bench_pdf_size.py [payloads]
+"""
+
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pdf_generator
+from reportlab import rl_config
+
+TEMPLATES = {
+    'diplome': pdf_generator.create_diploma_pdf,
+    'certification': pdf_generator.create_certification_pdf,
+    'badge': pdf_generator.create_badge_pdf
+}
+
+
+def payloads(count):
+    for i in range(count):
+        yield {
+            'recipient_name': f'Amina Diallo {i}',
+            'domain': 'Informatique',
+            'mention': 'Très bien',
+            'graduation_date': '01/07/2025',
+            'institution_name': 'Université de Bench',
+            'cert_number': f'CERT-2025-{i:05d}',
+            'duration': '180 crédits',
+            'blockchain_hash': '0x' + f'{i:02x}' * 32
+        }
+
+
+def render_sizes(options, use_a85, count):
+    """Average size per template, and the templates whose two renders differ"""
+    saved = pdf_generator.PDF_OPTIONS, rl_config.useA85
+    pdf_generator.PDF_OPTIONS, rl_config.useA85 = options, use_a85
+    try:
+        sizes = {}
+        unstable = set()
+        for name, render in TEMPLATES.items():
+            lengths = []
+            for payload in payloads(count):
+                first = render(payload).getvalue()
+                if render(payload).getvalue() != first:
+                    unstable.add(name)
+                lengths.append(len(first))
+            sizes[name] = statistics.mean(lengths)
+        return sizes, unstable
+    finally:
+        pdf_generator.PDF_OPTIONS, rl_config.useA85 = saved
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    before, before_unstable = render_sizes({}, 1, count)
+    after, after_unstable = render_sizes(pdf_generator.PDF_OPTIONS, rl_config.useA85, count)
+
+    print(f"{'template':<15}{'default (B)':>14}{'tuned (B)':>12}{'saved':>9}  byte-identical")
+    for name in TEMPLATES:
+        saved = 1 - after[name] / before[name]
+        print(f"{name:<15}{before[name]:>14.0f}{after[name]:>12.0f}{saved:>8.0%}  "
+              f"{'no' if name in before_unstable else 'yes'} -> {'no' if name in after_unstable else 'yes'}")
+    total_before = statistics.mean(before.values())
+    total_after = statistics.mean(after.values())
+    print(f"{'average':<15}{total_before:>14.0f}{total_after:>12.0f}{1 - total_after / total_before:>8.0%}")
+
+    if after_unstable:
+        print(f"\nnon-deterministic output: {', '.join(sorted(after_unstable))}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
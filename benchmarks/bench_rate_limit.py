@@ -0,0 +1,251 @@
+"""
+Admission control check for the public verification endpoints.
+
+Runs app.py against a scratch SQLite database, with token buckets in a
+shared SQLite file and a stand-in contract that counts getter calls (each
+one a chain RPC in production) and takes CHAIN_LATENCY to answer:
+
+  scraper      one IP floods /verify with unknown files: admitted requests,
+               and chain calls, stay within burst + rate x elapsed
+  distributed  many IPs (X-Forwarded-For behind one trusted proxy) stay
+               within the global anonymous bucket
+  early        a request over its budget, or over the upload limit, is
+               refused without reading a byte of the upload
+  priority     while anonymous clients fill every slot they may use, an
+               institution session and an API key are still admitted
+  api key      an unknown X-API-Key is refused (401)
+  shared       two bucket stores on the same file (two workers) share one
+               budget; cost per decision, memory vs SQLite
+
+Exits 1 when any of these does not hold.
+
+Usage: python benchmarks/bench_rate_limit.py
+"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IP_RATE, GLOBAL_RATE, BURST_SECONDS = 2, 10, 5
+MAX_INFLIGHT, RESERVED = 4, 2
+API_KEY = 'bench-key'
+CHAIN_LATENCY = 0.05
+
+
+class StandInContract:
+    """contract.functions.certificates(id).call(): always 'not found', counted"""
+
+    def __init__(self, latency=CHAIN_LATENCY):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.functions = self
+
+    def certificates(self, cert_id):
+        return self
+
+    def call(self):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return '', '', 0, False
+
+
+class CountingStream(io.BytesIO):
+    """Upload body that records how many bytes the server read"""
+
+    def read(self, *args):
+        data = super().read(*args)
+        self.consumed = getattr(self, 'consumed', 0) + len(data)
+        return data
+
+    def readline(self, *args):
+        data = super().readline(*args)
+        self.consumed = getattr(self, 'consumed', 0) + len(data)
+        return data
+
+
+def load_app(workdir):
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['RATE_LIMIT_URL'] = f"sqlite:///{os.path.join(workdir, 'buckets.db')}"
+    os.environ.setdefault('IPFS_SWEEP_INTERVAL', '0')
+    os.environ.update({
+        'VERIFY_RATE_PER_IP': str(IP_RATE), 'VERIFY_GLOBAL_RATE': str(GLOBAL_RATE),
+        'VERIFY_BURST_SECONDS': str(BURST_SECONDS), 'VERIFY_MAX_INFLIGHT': str(MAX_INFLIGHT),
+        'VERIFY_RESERVED_SLOTS': str(RESERVED), 'VERIFY_API_KEYS': API_KEY,
+        'VERIFY_MAX_UPLOAD_MB': '1', 'TRUSTED_PROXIES': '1',
+    })
+    import app as certichain
+    from models import db, Institution
+
+    certichain.app.config['TESTING'] = True
+    with certichain.app.app_context():
+        db.drop_all()
+        certichain.migrations.upgrade()
+        institution = Institution(name='Bench', email='ratelimit@bench.local')
+        institution.set_password('bench')
+        db.session.add(institution)
+        db.session.commit()
+        return certichain, institution.id
+
+
+def verify(client, ip, n, headers=None):
+    data = {'file': (io.BytesIO(f'unknown certificate {ip} {n}'.encode()), 'probe.pdf')}
+    return client.post('/verify', data=data, content_type='multipart/form-data',
+                       headers={'X-Forwarded-For': ip, **(headers or {})})
+
+
+def reset(certichain):
+    """Fresh buckets between scenarios"""
+    certichain.verify_limiter.buckets._connect().execute('DELETE FROM rate_buckets')
+
+
+def check_scraper(certichain, contract, failures):
+    reset(certichain)
+    client = certichain.app.test_client()
+    calls = contract.calls
+    codes = []
+    start = time.perf_counter()
+    for n in range(200):
+        codes.append(verify(client, '203.0.113.7', n).status_code)
+    elapsed = time.perf_counter() - start
+    admitted = codes.count(200)
+    ceiling = IP_RATE * BURST_SECONDS + IP_RATE * elapsed + 1
+    print(f"scraper: {admitted}/200 admitted in {elapsed:.1f}s (ceiling {ceiling:.0f}), "
+          f"{codes.count(429)} shed, {contract.calls - calls} chain calls")
+    if not IP_RATE * BURST_SECONDS <= admitted <= ceiling or contract.calls - calls != admitted:
+        failures.append(f'scraper: {admitted} admitted, {contract.calls - calls} chain calls, ceiling {ceiling:.0f}')
+
+
+def check_distributed(certichain, failures):
+    reset(certichain)
+    client = certichain.app.test_client()
+    codes = []
+    start = time.perf_counter()
+    for n in range(300):
+        codes.append(verify(client, f'198.51.100.{n % 150}', n).status_code)
+    elapsed = time.perf_counter() - start
+    admitted = codes.count(200)
+    ceiling = GLOBAL_RATE * BURST_SECONDS + GLOBAL_RATE * elapsed + 1
+    print(f"distributed: 150 IPs, {admitted}/300 admitted in {elapsed:.1f}s (ceiling {ceiling:.0f})")
+    if admitted > ceiling:
+        failures.append(f'distributed: {admitted} admitted, ceiling {ceiling:.0f}')
+
+
+def check_early(certichain, failures):
+    reset(certichain)
+    client = certichain.app.test_client()
+    n = 0
+    while verify(client, '192.0.2.1', n).status_code != 429:  # spend the IP's burst
+        n += 1
+
+    for label, ip, size in (('over budget', '192.0.2.1', 512 * 1024), ('too large', '192.0.2.2', 2 * 1024 * 1024)):
+        stream = CountingStream(b'x' * size)
+        response = client.post('/verify', input_stream=stream,
+                               content_type='multipart/form-data; boundary=x', headers={'X-Forwarded-For': ip})
+        read = getattr(stream, 'consumed', 0)
+        print(f"early ({label}): {response.status_code}, {read} bytes of the upload read")
+        if response.status_code not in (413, 429) or read:
+            failures.append(f'early ({label}): status {response.status_code}, {read} bytes read')
+
+
+def check_priority(certichain, contract, institution_id, failures):
+    reset(certichain)
+    contract.latency = 0.2
+    stop = threading.Event()
+    anonymous = []
+
+    def flood(worker):
+        client = certichain.app.test_client()
+        n = 0
+        while not stop.is_set():
+            anonymous.append(verify(client, f'192.0.2.{100 + worker}', n).status_code)
+            n += 1
+
+    threads = [threading.Thread(target=flood, args=(w,)) for w in range(6)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.3)
+
+    institution = certichain.app.test_client()
+    with institution.session_transaction() as session:
+        session['institution_id'] = institution_id
+    keyed = certichain.app.test_client()
+    priority = [verify(institution, '192.0.2.200', n).status_code for n in range(5)]
+    priority += [verify(keyed, '192.0.2.201', n, {'X-API-Key': API_KEY}).status_code for n in range(5)]
+    stop.set()
+    for thread in threads:
+        thread.join()
+    contract.latency = CHAIN_LATENCY
+
+    busy = anonymous.count(503)
+    print(f"priority: anonymous {anonymous.count(200)} admitted, {busy} shed as busy; "
+          f"institution + API key {priority.count(200)}/10 admitted")
+    if priority.count(200) != 10 or not busy:
+        failures.append(f'priority: {priority} for the priority lanes, {busy} anonymous shed as busy')
+
+
+def check_api_key(certichain, failures):
+    response = verify(certichain.app.test_client(), '192.0.2.50', 0, {'X-API-Key': 'guessed'})
+    print(f"api key: unknown key -> {response.status_code}")
+    if response.status_code != 401:
+        failures.append(f'api key: unknown key got {response.status_code}')
+
+
+def check_shared(workdir, failures):
+    import rate_limit
+
+    path = f"sqlite:///{os.path.join(workdir, 'shared.db')}"
+    workers = [rate_limit.make_buckets(path), rate_limit.make_buckets(path)]
+    admitted = [0, 0]
+
+    def take(index):
+        for _ in range(100):
+            admitted[index] += workers[index].take('ip:shared', 0.001, 20)[0]
+
+    threads = [threading.Thread(target=take, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"\nshared: two stores on one file admitted {admitted[0]} + {admitted[1]} = {sum(admitted)} (burst 20)")
+    if sum(admitted) != 20:
+        failures.append(f'shared: {sum(admitted)} admitted for a burst of 20')
+
+    print(f"{'store':<10}{'us/decision':>13}")
+    for name, store in (('memory', rate_limit.make_buckets('')), ('sqlite', workers[0])):
+        count = 20000
+        start = time.perf_counter()
+        for n in range(count):
+            store.take(f'ip:{n % 500}', 1, 10)
+        print(f"{name:<10}{(time.perf_counter() - start) / count * 1e6:>13.1f}")
+
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # uploads saved by /verify land in workdir/certs/uploads
+        certichain, institution_id = load_app(workdir)
+        contract = StandInContract()
+        certichain.services.contract = contract
+        check_scraper(certichain, contract, failures)
+        check_distributed(certichain, failures)
+        check_early(certichain, failures)
+        check_priority(certichain, contract, institution_id, failures)
+        check_api_key(certichain, failures)
+        check_shared(workdir, failures)
+        os.chdir(ROOT)
+
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,280 @@
+"""
+RPC provider pool check and benchmark.
+
+Starts local stand-in JSON-RPC nodes with injected latency and failures and
+drives rpc_pool.RPCPool through web3 against them. Fails (exit 1) unless:
+
+  - requests are routed to the fastest healthy node;
+  - HTTP 5xx, rate-limit errors, dead and lagging nodes fail over without
+    surfacing an error;
+  - eth_call at a finalized block is answered from the cache (single and
+    batch), while eth_call at 'latest' always reaches a node;
+  - a rebroadcast eth_sendRawTransaction answered "already known" returns
+    the transaction hash.
+
+Then reports request latency through a single flaky endpoint versus the pool.
+
+Usage: python benchmarks/bench_rpc_pool.py [requests]
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eth_hash.auto import keccak
+from web3 import Web3
+
+import rpc_pool
+from rpc_pool import RPCPool
+
+HEAD = 1000
+
+
+class FakeNode:
+    """Minimal JSON-RPC node: fixed head, canned eth_call answers, counted requests"""
+
+    def __init__(self, latency=0.0, failure_rate=0.0, failure_status=503, rpc_error=None,
+                 head=HEAD, known_txs=()):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.rpc_error = rpc_error  # {'code': ..., 'message': ...} returned for every call
+        self.head = head
+        self.known_txs = set(known_txs)
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, method=None):
+        with self.lock:
+            return sum(n for m, n in self.calls.items() if method in (None, m))
+
+    def answer(self, request):
+        method, params = request['method'], request.get('params', [])
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        reply = {'jsonrpc': '2.0', 'id': request['id']}
+        if self.rpc_error and method != 'eth_blockNumber':
+            reply['error'] = self.rpc_error
+        elif method == 'eth_blockNumber':
+            reply['result'] = hex(self.head)
+        elif method == 'eth_chainId':
+            reply['result'] = hex(11155111)
+        elif method == 'eth_call':
+            # Deterministic answer for (calldata, block)
+            digest = keccak(json.dumps(params, sort_keys=True).encode())
+            reply['result'] = '0x' + digest.hex()
+        elif method == 'eth_sendRawTransaction':
+            if params[0] in self.known_txs:
+                reply['error'] = {'code': -32000, 'message': 'already known'}
+            else:
+                self.known_txs.add(params[0])
+                reply['result'] = '0x' + keccak(bytes.fromhex(params[0][2:])).hex()
+        else:
+            reply['error'] = {'code': -32601, 'message': 'method not found'}
+        return reply
+
+    def _handler(self):
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # headers and body are separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if node.latency:
+                    time.sleep(node.latency)
+                if random.random() < node.failure_rate:
+                    self.send_response(node.failure_status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                request = json.loads(body)
+                if isinstance(request, list):
+                    reply = [node.answer(r) for r in request]
+                else:
+                    reply = node.answer(request)
+                data = json.dumps(reply).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_pool(nodes, **options):
+    options.setdefault('timeout', 2)
+    options.setdefault('health_interval', 3600)
+    options.setdefault('finality_depth', 64)
+    return RPCPool([node.url for node in nodes], **options)
+
+
+def check_routing(failures):
+    fast, slow = FakeNode(latency=0.002).start(), FakeNode(latency=0.03).start()
+    try:
+        w3 = Web3(make_pool([slow, fast]))
+        for _ in range(50):
+            w3.eth.block_number
+        share = fast.count('eth_blockNumber') / (fast.count('eth_blockNumber') + slow.count('eth_blockNumber'))
+        print(f"routing: {share:.0%} of requests to the fastest node")
+        if share < 0.9:
+            failures.append(f'routing: only {share:.0%} to the fastest node')
+    finally:
+        fast.stop()
+        slow.stop()
+
+
+def check_failover(failures):
+    scenarios = {
+        'http 503': FakeNode(latency=0.001, failure_rate=1.0),
+        'rate limit': FakeNode(latency=0.001, rpc_error={'code': -32005, 'message': 'daily request count exceeded'}),
+        'lagging node': FakeNode(latency=0.001, head=HEAD - 50),
+        'dead node': FakeNode(latency=0.001)
+    }
+    for name, bad in scenarios.items():
+        good = FakeNode(latency=0.02).start()
+        bad.start()
+        if name == 'dead node':
+            bad.stop()  # connection refused on every attempt
+        pool = make_pool([bad, good])
+        w3 = Web3(pool)
+        errors = 0
+        for _ in range(20):
+            try:
+                w3.eth.chain_id
+                pool.cache.clear()  # eth_chainId is cached: make every call reach a node
+            except Exception:
+                errors += 1
+        served = good.count() - good.count('eth_blockNumber')
+        print(f"failover ({name}): {errors} error(s), {served}/20 served by the healthy node")
+        if errors or served < 20:
+            failures.append(f'failover ({name}): {errors} error(s), {served}/20 served by the healthy node')
+        good.stop()
+        if name != 'dead node':
+            bad.stop()
+
+
+def check_cache(failures):
+    node = FakeNode().start()
+    try:
+        pool = make_pool([node])
+        w3 = Web3(pool)
+        tx = {'to': Web3.to_checksum_address('0x' + '22' * 20), 'data': '0x1234'}
+        finalized = HEAD - pool.finality_depth
+
+        for block in ('finalized', finalized, finalized - 10, 'latest', HEAD):
+            w3.eth.call(tx, block_identifier=block)
+        before = node.count('eth_call')
+        for block in ('finalized', finalized, finalized - 10, 'latest', HEAD):
+            w3.eth.call(tx, block_identifier=block)
+        reached = node.count('eth_call') - before
+        print(f"cache: {reached}/5 repeated eth_call reached the node (expected 2, 'latest' and head)")
+        if reached != 2:
+            failures.append(f'cache: {reached} repeated eth_call reached the node, expected 2')
+
+        calls = [('eth_call', [{'to': tx['to'], 'data': hex(i)}, hex(finalized)]) for i in range(1, 11)]
+        first = pool.batch(calls)
+        before = node.count('eth_call')
+        second = pool.batch(calls + [('eth_call', [{'to': tx['to'], 'data': '0x99'}, 'latest'])])
+        reached = node.count('eth_call') - before
+        print(f"cache: {reached}/11 batched eth_call reached the node (expected 1)")
+        if reached != 1 or second[:10] != first:
+            failures.append(f'cache: batch sent {reached} call(s) or returned different results')
+    finally:
+        node.stop()
+
+
+def check_rebroadcast(failures):
+    raw = '0x' + 'ab' * 100
+    first = FakeNode(latency=0.001).start()
+    second = FakeNode(latency=0.02, known_txs=[raw]).start()
+    try:
+        pool = make_pool([first, second])
+        pool.check_health()
+        first.failure_rate = 1.0  # broadcast lost behind a failing node
+        tx_hash = Web3(pool).eth.send_raw_transaction(raw)
+        expected = keccak(bytes.fromhex(raw[2:]))
+        print(f"rebroadcast: {'hash returned' if bytes(tx_hash) == expected else 'wrong result'}")
+        if bytes(tx_hash) != expected:
+            failures.append('rebroadcast: "already known" did not return the transaction hash')
+    finally:
+        first.stop()
+        second.stop()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return {q: samples[min(len(samples) - 1, int(len(samples) * q / 100))] * 1000 for q in (50, 99)}
+
+
+def bench_latency(count):
+    """Single flaky endpoint (10% 503, retried by the caller) versus a pool of three"""
+    flaky = FakeNode(latency=0.005, failure_rate=0.1).start()
+    slow = FakeNode(latency=0.03).start()
+    fast = FakeNode(latency=0.01, failure_rate=0.02).start()
+    try:
+        single = Web3(Web3.HTTPProvider(flaky.url))
+        pool = Web3(make_pool([flaky, slow, fast]))
+        results = {}
+        for name, w3 in (('single endpoint', single), ('pool of 3', pool)):
+            samples, errors = [], 0
+            for _ in range(count):
+                start = time.perf_counter()
+                try:
+                    w3.eth.block_number
+                except Exception:
+                    errors += 1
+                samples.append(time.perf_counter() - start)
+            results[name] = (percentiles(samples), errors)
+
+        print(f"\n{'provider':<18}{'p50 (ms)':>10}{'p99 (ms)':>10}{'errors':>8}")
+        for name, (p, errors) in results.items():
+            print(f"{name:<18}{p[50]:>10.1f}{p[99]:>10.1f}{errors:>8}")
+    finally:
+        for node in (flaky, slow, fast):
+            node.stop()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    rpc_pool.COOLDOWN = 0.5
+    failures = []
+    check_routing(failures)
+    check_failover(failures)
+    check_cache(failures)
+    check_rebroadcast(failures)
+    bench_latency(count)
+
+    if failures:
+        print('\n' + '\n'.join(f'FAIL {f}' for f in failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
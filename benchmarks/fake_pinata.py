@@ -0,0 +1,119 @@
+"""
+Local stand-in for the Pinata pinning API, for tests and benchmarks.
+
+Serves POST /pinning/pinFileToIPFS and can inject latency and failures
+(at random, or the first `fail_first` requests, optionally with Retry-After):
+
+    server = FakePinata(latency=0.05, failure_rate=0.2).start()
+    client = IPFSClient('k', 's', base_url=server.url)
+    ...
+    server.stop()
+
+Run standalone with: python benchmarks/fake_pinata.py [port]
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ipfs_cid import compute_cid
+
+
+def parse_multipart_file(body, content_type):
+    """Content of the first file part of a multipart/form-data body"""
+    boundary = content_type.split('boundary=')[-1].strip('"').encode()
+    for part in body.split(b'--' + boundary):
+        if b'filename=' not in part:
+            continue
+        _, _, content = part.partition(b'\r\n\r\n')
+        return content[:-2] if content.endswith(b'\r\n') else content
+    return b''
+
+
+class FakePinata:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, failure_status=503,
+                 fail_first=0, retry_after=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.fail_first = fail_first
+        self.retry_after = retry_after
+        self.pins = {}  # cid -> content
+        self.requests = 0
+        self.connections = set()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so connection reuse is observable
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                with fake.lock:
+                    fake.requests += 1
+                    fake.connections.add(self.client_address)
+
+                if fake.latency:
+                    time.sleep(fake.latency)
+                if self.path != '/pinning/pinFileToIPFS':
+                    return self._reply(404, {'error': 'not found'})
+                with fake.lock:
+                    fail = fake.fail_first > 0 or random.random() < fake.failure_rate
+                    fake.fail_first = max(0, fake.fail_first - 1)
+                if fail:
+                    headers = {'Retry-After': str(fake.retry_after)} if fake.retry_after is not None else None
+                    return self._reply(fake.failure_status, {'error': 'injected failure'}, headers)
+                if not self.headers.get('pinata_api_key'):
+                    return self._reply(401, {'error': 'missing api key'})
+
+                content = parse_multipart_file(body, self.headers.get('Content-Type', ''))
+                cid = compute_cid(content)
+                with fake.lock:
+                    fake.pins[cid] = content
+                self._reply(200, {'IpfsHash': cid, 'PinSize': len(content)})
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5099
+    server = FakePinata(port=port)
+    print(f"Fake Pinata listening on {server.url}")
+    server.httpd.serve_forever()
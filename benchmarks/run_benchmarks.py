@@ -0,0 +1,461 @@
+"""
+Offline benchmark suite for the issuance, verification and storage hot paths.
+
+Everything runs against local stand-ins in a scratch directory: SQLite for the
+app database, eth-tester for the chain (when the Solidity compiler is
+available to py-solc-x), FakePinata for IPFS, and an in-process NetworkServer
+with N StorageNodes.
+
+    python benchmarks/run_benchmarks.py --out results.json
+    python benchmarks/run_benchmarks.py --quick --compare results.json
+
+Sections: pdf, verify, listing, storage, ipfs (--only pdf,verify). With
+--compare, metrics that got worse than --threshold (default 10%) are listed
+and the exit status is 1.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+SECTIONS = ['pdf', 'verify', 'listing', 'storage', 'ipfs']
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds"""
+    ordered = sorted(samples)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50),
+        'p90_ms': pick(0.90),
+        'p99_ms': pick(0.99)
+    }
+
+
+def timed_samples(fn, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ==================== PDF ====================
+
+def bench_pdf(args):
+    import pdf_generator
+
+    payload = {
+        'recipient_name': 'Amina Diallo',
+        'domain': 'Informatique',
+        'mention': 'Très bien',
+        'graduation_date': '01/07/2025',
+        'institution_name': 'Université de Bench',
+        'cert_number': 'CERT-2025-00001',
+        'duration': '180 crédits',
+        'blockchain_hash': '0x' + 'ab' * 10 + '...'
+    }
+    templates = {
+        'diplome': pdf_generator.create_diploma_pdf,
+        'certification': pdf_generator.create_certification_pdf,
+        'badge': pdf_generator.create_badge_pdf
+    }
+    results = {}
+    for name, render in templates.items():
+        render(payload)  # warm-up: font and module caches
+        count = 0
+        size = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < args.duration:
+            size = len(render(payload).getvalue())
+            count += 1
+        elapsed = time.perf_counter() - start
+        results[name] = {'renders_per_sec': count / elapsed, 'pdf_bytes': size}
+    return results
+
+
+# ==================== App (verify, listing) ====================
+
+def load_app(workdir):
+    """Import app.py against a scratch SQLite database"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('IPFS_SWEEP_INTERVAL', '0')
+    # Latency is measured here, not admission: see bench_rate_limit.py
+    for name in ('VERIFY_RATE_PER_IP', 'VERIFY_GLOBAL_RATE', 'VERIFY_MAX_INFLIGHT'):
+        os.environ.setdefault(name, '0')
+    import app as certichain
+    from models import db
+
+    certichain.app.config['TESTING'] = True
+    with certichain.app.app_context():
+        db.drop_all()
+        certichain.migrations.upgrade()
+    return certichain
+
+
+def _institution(certichain, email):
+    from models import db, Institution
+
+    with certichain.app.app_context():
+        institution = Institution(name='Bench', email=email)
+        institution.set_password('bench')
+        db.session.add(institution)
+        db.session.commit()
+        return institution.id
+
+
+def _bulk_certificates(certichain, institution_id, count, prefix):
+    from models import db, Certificate
+
+    rows = [{
+        'institution_id': institution_id,
+        'certificate_type': 'diplome',
+        'recipient_name': f'Recipient {i}',
+        'domain': 'Informatique',
+        'data': {'recipient_name': f'Recipient {i}', 'domain': 'Informatique'},
+        'file_hash': hashlib.sha256(f'{prefix}-{i}'.encode()).hexdigest(),
+        'blockchain_hash': '0x' + hashlib.sha256(f'tx-{prefix}-{i}'.encode()).hexdigest(),
+        'status': 'issued',
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    } for i in range(count)]
+    with certichain.app.app_context():
+        for start in range(0, count, 5000):
+            db.session.execute(Certificate.__table__.insert(), rows[start:start + 5000])
+        db.session.commit()
+
+
+def _chain_standin(certichain):
+    """eth-tester chain with the registry deployed; raises if it can't be compiled"""
+    from web3 import Web3, EthereumTesterProvider
+    import solcx
+    import bench_contract
+
+    if not solcx.get_installed_solc_versions():
+        raise RuntimeError('no solc compiler installed for py-solc-x')
+    abi, bytecode = bench_contract.compile_registry()
+    w3 = Web3(EthereumTesterProvider())
+    w3.eth.default_account = w3.eth.accounts[0]
+    return w3, bench_contract.deploy(w3, abi, bytecode)
+
+
+def bench_verify(args, certichain, workdir):
+    from models import db, Certificate, ChainCertificate
+
+    institution_id = _institution(certichain, 'verify@bench.local')
+    _bulk_certificates(certichain, institution_id, args.verify_rows, 'verify')
+
+    files = {}
+    for kind in ('db', 'index', 'chain', 'miss'):
+        files[kind] = f'{kind} certificate body'.encode() * 64
+    hashes = {kind: hashlib.sha256(data).hexdigest() for kind, data in files.items()}
+
+    with certichain.app.app_context():
+        db.session.add(Certificate(institution_id=institution_id, certificate_type='badge',
+                                   recipient_name='DB hit', file_hash=hashes['db'], status='issued'))
+        cert_id = certichain.services.w3.solidity_keccak(['string'], [hashes['index']])
+        db.session.add(ChainCertificate(certificate_id=certichain.services.w3.to_hex(cert_id), ipfs_hash='bafy',
+                                        recipient_name='Index hit', issue_date=int(time.time()),
+                                        block_number=1, block_hash='0x0', tx_hash='0x0', log_index=0))
+        db.session.commit()
+
+    cases = ['db', 'index', 'miss']
+    saved = certichain.services.contract, certichain.services.w3
+    notes = {}
+    try:
+        w3, contract = _chain_standin(certichain)
+        contract.functions.issueCertificate(
+            w3.solidity_keccak(['string'], [hashes['chain']]), 'bafy', 'Chain hit'
+        ).transact()
+        certichain.services.w3, certichain.services.contract = w3, contract
+        cases.insert(2, 'chain')
+    except Exception as e:
+        certichain.services.contract = None
+        notes['chain'] = f'skipped: {e}'
+
+    client = certichain.app.test_client()
+    results = {}
+    try:
+        for kind in cases:
+            def request():
+                response = client.post('/verify', data={'file': (io.BytesIO(files[kind]), f'{kind}.pdf')},
+                                       content_type='multipart/form-data')
+                assert response.get_json()['verified'] == (kind != 'miss'), response.get_json()
+            request()
+            results[kind] = percentiles(timed_samples(request, args.requests))
+    finally:
+        certichain.services.contract, certichain.services.w3 = saved
+    results.update(notes)
+    return results
+
+
+def bench_listing(args, certichain, workdir):
+    results = {}
+    for rows in args.listing_rows:
+        institution_id = _institution(certichain, f'list{rows}@bench.local')
+        _bulk_certificates(certichain, institution_id, rows, f'list{rows}')
+
+        client = certichain.app.test_client()
+        with client.session_transaction() as session:
+            session['institution_id'] = institution_id
+
+        def request():
+            response = client.get('/api/certificates')
+            assert response.status_code == 200
+            return response
+
+        body = request().get_data()
+        results[str(rows)] = dict(percentiles(timed_samples(request, args.listing_requests)),
+                                  response_bytes=len(body))
+    return results
+
+
+# ==================== Storage network ====================
+
+def bench_storage(args, workdir):
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    from network_server import NetworkServer
+    from storage_node import StorageNode
+    import backend_api
+
+    port = free_port()
+    server = NetworkServer(host='127.0.0.1', port=port, metrics_port=None)
+    threading.Thread(target=server.start, daemon=True).start()
+    time.sleep(0.3)
+
+    nodes = []
+    for i in range(args.nodes):
+        node = StorageNode(network_port=port, node_port=free_port(),
+                           storage_path=os.path.join(workdir, f'node{i}'), capacity_gb=50)
+        threading.Thread(target=node.start, daemon=True).start()
+        nodes.append(node)
+    backend_api.NETWORK_PORT = port
+    backend_api.UPLOAD_FOLDER = backend_api.Path(workdir)
+
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        online = backend_api.communicate_with_network({'type': 'get_available_nodes'}).get('nodes', [])
+        if len(online) == args.nodes:
+            break
+        time.sleep(0.1)
+    else:
+        raise RuntimeError(f'only {len(online)}/{args.nodes} storage nodes registered')
+
+    size = args.file_mb * 1024 * 1024
+    source = os.path.join(workdir, 'payload.bin')
+    with open(source, 'wb') as f:
+        f.write(os.urandom(size))
+
+    file_ids = [f'bench-{i}' for i in range(args.files)]
+    start = time.perf_counter()
+    for file_id in file_ids:
+        result = backend_api.store_single_copy('bench', file_id, f'{file_id}.bin', source, size)
+        assert result['status'] == 'success', result
+        backend_api.communicate_with_network({
+            'type': 'register_file', 'file_id': file_id, 'user_id': 'bench',
+            'node_ids': result['node_ids'], 'file_info': result['file_info']
+        })
+    upload_time = time.perf_counter() - start
+
+    dest = os.path.join(workdir, 'download.bin')
+    start = time.perf_counter()
+    for file_id in file_ids:
+        locations = backend_api.communicate_with_network({
+            'type': 'download_request', 'file_id': file_id, 'user_id': 'bench'
+        })
+        backend_api._track_transfer(locations['transfer_id'], direction='download')
+        result = backend_api.fetch_file_from_node(locations['nodes'][0], file_id, dest, locations['transfer_id'])
+        assert result['status'] == 'success', result
+    download_time = time.perf_counter() - start
+
+    for node in nodes:
+        node.stop()
+    server.running = False
+
+    total_mb = args.files * args.file_mb
+    return {
+        'nodes': args.nodes,
+        'files': args.files,
+        'file_mb': args.file_mb,
+        'upload_mb_per_sec': total_mb / upload_time,
+        'download_mb_per_sec': total_mb / download_time
+    }
+
+
+# ==================== IPFS ====================
+
+def bench_ipfs(args, workdir):
+    from fake_pinata import FakePinata
+    from ipfs_client import IPFSClient
+
+    server = FakePinata(latency=args.pinata_latency).start()
+    client = IPFSClient('bench', 'bench', base_url=server.url, max_workers=8)
+    paths = []
+    for i in range(args.pins):
+        path = os.path.join(workdir, f'pin{i}.pdf')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(64 * 1024))
+        paths.append(path)
+
+    start = time.perf_counter()
+    results = client.pin_many(paths)
+    elapsed = time.perf_counter() - start
+    client.close()
+    server.stop()
+
+    failures = sum(1 for r in results.values() if not isinstance(r, str))
+    return {
+        'pins': args.pins,
+        'simulated_latency_ms': args.pinata_latency * 1000,
+        'pins_per_sec': args.pins / elapsed,
+        'failures': failures,
+        'connections': len(server.connections)
+    }
+
+
+# ==================== Comparison ====================
+
+def _flatten(tree, prefix=''):
+    for key, value in tree.items():
+        path = f'{prefix}.{key}' if prefix else key
+        if isinstance(value, dict):
+            yield from _flatten(value, path)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield path, value
+
+
+def _direction(path):
+    """+1 if higher is better, -1 if lower is better, 0 if informational"""
+    leaf = path.rsplit('.', 1)[-1]
+    if leaf.endswith('_per_sec'):
+        return 1
+    if leaf.endswith('_ms'):
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold):
+    """Metrics that moved the wrong way by more than threshold"""
+    before = dict(_flatten(baseline['results']))
+    regressions = []
+    for path, value in _flatten(current['results']):
+        direction = _direction(path)
+        if not direction or not before.get(path):
+            continue
+        change = (value - before[path]) / before[path]
+        if change * direction < -threshold:
+            regressions.append((path, before[path], value, change))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10)
+    parser.add_argument('--only', help='comma-separated sections: ' + ','.join(SECTIONS))
+    parser.add_argument('--quick', action='store_true', help='smaller sizes for a smoke run')
+    args = parser.parse_args()
+
+    args.duration = 1.0 if args.quick else 3.0
+    args.requests = 50 if args.quick else 300
+    args.verify_rows = 1000 if args.quick else 10_000
+    args.listing_rows = [1000, 10_000] if args.quick else [10_000, 100_000]
+    args.listing_requests = 3 if args.quick else 10
+    args.nodes = 3
+    args.files = 4 if args.quick else 10
+    args.file_mb = 4 if args.quick else 16
+    args.pins = 50 if args.quick else 200
+    args.pinata_latency = 0.02
+    sections = args.only.split(',') if args.only else SECTIONS
+    args.out = args.out and os.path.abspath(args.out)
+    args.compare = args.compare and os.path.abspath(args.compare)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # app.py resolves contract_abi.json and certs/uploads from the working directory
+        os.symlink(os.path.join(ROOT, 'contract_abi.json'), os.path.join(workdir, 'contract_abi.json'))
+        os.makedirs(os.path.join(workdir, 'certs', 'uploads'))
+        os.chdir(workdir)
+
+        certichain = None
+        for section in sections:
+            print(f"▶ {section}...", flush=True)
+            start = time.perf_counter()
+            if section == 'pdf':
+                results['pdf'] = bench_pdf(args)
+            elif section in ('verify', 'listing'):
+                certichain = certichain or load_app(workdir)
+                bench = bench_verify if section == 'verify' else bench_listing
+                results[section] = bench(args, certichain, workdir)
+            elif section == 'storage':
+                results['storage'] = bench_storage(args, workdir)
+            elif section == 'ipfs':
+                results['ipfs'] = bench_ipfs(args, workdir)
+            else:
+                parser.error(f'unknown section {section}')
+            print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat() + 'Z',
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick
+        },
+        'results': results
+    }
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.threshold)
+        for path, old, new, change in regressions:
+            print(f"REGRESSION {path}: {old:.2f} -> {new:.2f} ({change:+.1%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
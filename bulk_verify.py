@@ -0,0 +1,259 @@
+"""
+Vérification en masse : résolution par lots avec une requête IN (...) par
+tranche, puis l'index local des événements, puis des lectures blockchain
+regroupées : getCertificates(bytes32[]) du contrat, ou des requêtes
+JSON-RPC batch pour un contrat déployé avant ce getter (choix fait d'après
+le bytecode déployé, services.contract_functions ; une erreur RPC remonte). Les certificats
+révoqués sont signalés (revoked: True) sans requête supplémentaire.
+
+Derrière un pool RPC (rpc_pool), les certificats sont d'abord lus au bloc
+finalisé, dont les réponses sont en cache ; seuls les absents sont relus au
+dernier bloc. Un certificat émis ne disparaît pas, seule sa révocation
+change, et elle est suivie à part.
+"""
+
+import requests
+from hexbytes import HexBytes
+
+from models import Certificate, ChainCertificate
+
+CHUNK_SIZE = 500
+RPC_BATCH_SIZE = 100
+GETTER_BATCH_SIZE = 200
+MAX_ITEMS = 5000
+
+_rpc_session = requests.Session()
+
+
+def rpc_batch(url, calls, timeout=30):
+    """Envoie [(méthode, params)] en une requête JSON-RPC batch, renvoie les résultats dans l'ordre"""
+    payload = [
+        {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    response = _rpc_session.post(url, json=payload, timeout=timeout)
+    response.raise_for_status()
+    replies = response.json()
+    if not isinstance(replies, list):
+        raise ValueError(f"Batch JSON-RPC refusé: {replies}")
+    by_id = {reply['id']: reply for reply in replies}
+    return [by_id.get(i, {}).get('result') for i in range(len(calls))]
+
+
+def _db_result(query, kind, cert):
+    return {
+        'query': query,
+        'type': kind,
+        'verified': True,
+        'source': 'db',
+        'certificate_id': cert.id,
+        'recipient': cert.recipient_name,
+        'issueDate': int(cert.created_at.timestamp()),
+        'ipfs': cert.ipfs_hash,
+        'certificate_type': cert.certificate_type
+    }
+
+
+def _chain_result(query, kind, source, recipient, issue_date, ipfs):
+    return {
+        'query': query,
+        'type': kind,
+        'verified': True,
+        'source': source,
+        'recipient': recipient,
+        'issueDate': issue_date,
+        'ipfs': ipfs
+    }
+
+
+def _miss(query, kind):
+    return {'query': query, 'type': kind, 'verified': False}
+
+
+def _revoked(query, kind, source):
+    return {'query': query, 'type': kind, 'verified': False, 'revoked': True, 'source': source}
+
+
+class BulkVerifier:
+    def __init__(self, w3, contract, rpc_url=None, revocations=None, batch=None, functions=()):
+        self.w3 = w3
+        self.contract = contract
+        self.has_getter = 'getCertificates' in functions  # fonctions présentes dans le contrat déployé
+        self.rpc_url = rpc_url
+        self.revocations = revocations
+        # batch(calls) : celui du pool RPC, sinon une requête vers rpc_url
+        self.batch = batch or ((lambda calls: rpc_batch(rpc_url, calls)) if rpc_url else None)
+
+    def _cert_id(self, file_hash):
+        return self.w3.to_hex(self.w3.solidity_keccak(['string'], [file_hash]))
+
+    def _is_revoked(self, cert_id, cert=None):
+        if cert is not None and cert.status == 'revoked':
+            return True
+        return self.revocations is not None and cert_id is not None and self.revocations.is_revoked(cert_id)
+
+    def _finalized_block(self):
+        """Bloc finalisé connu du pool RPC, ou None (fournisseur simple)"""
+        return getattr(self.w3.provider, 'finalized_block', None)
+
+    def _pinned(self, cert_ids, read):
+        """read(ids, bloc) au bloc finalisé, puis au dernier bloc pour les ids absents"""
+        finalized = self._finalized_block()
+        results = read(cert_ids, finalized) if finalized is not None else {}
+        recent = [cid for cid in cert_ids if cid not in results]
+        if recent:
+            results.update(read(recent, 'latest'))
+        return results
+
+    def chain_certificates(self, cert_ids):
+        """{id: (destinataire, date, ipfs)} des ids présents sur le contrat : getCertificates par lot, sinon certificates(id) en batch JSON-RPC"""
+        read = self._getter_certificates if self.has_getter else self._rpc_certificates
+        return self._pinned(cert_ids, read)
+
+    def _getter_certificates(self, cert_ids, block):
+        results = {}
+        for start in range(0, len(cert_ids), GETTER_BATCH_SIZE):
+            batch = cert_ids[start:start + GETTER_BATCH_SIZE]
+            ipfs_hashes, recipients, issue_dates, exists = \
+                self.contract.functions.getCertificates(batch).call(block_identifier=block)
+            for i, cid in enumerate(batch):
+                if exists[i]:
+                    results[cid] = (recipients[i], issue_dates[i], ipfs_hashes[i])
+        return results
+
+    def _rpc_certificates(self, cert_ids, block):
+        """Lit certificates(id) pour plusieurs ids en quelques requêtes batch"""
+        results = {}
+        if self.batch is None:
+            return results
+        tag = block if isinstance(block, str) else hex(block)
+        for start in range(0, len(cert_ids), RPC_BATCH_SIZE):
+            batch = cert_ids[start:start + RPC_BATCH_SIZE]
+            calls = [
+                ('eth_call', [{
+                    'to': self.contract.address,
+                    'data': self.contract.encodeABI(fn_name='certificates', args=[cid])
+                }, tag])
+                for cid in batch
+            ]
+            for cid, raw in zip(batch, self.batch(calls)):
+                if not raw or raw == '0x':
+                    continue
+                ipfs, recipient, issue_date, exists = self.w3.codec.decode(
+                    ['string', 'string', 'uint256', 'bool'], bytes.fromhex(raw[2:])
+                )
+                if exists:
+                    results[cid] = (recipient, issue_date, ipfs)
+        return results
+
+    def _chain_receipts(self, tx_hashes):
+        """Décode les événements CertificateIssued de plusieurs transactions en lots"""
+        event = self.contract.events.CertificateIssued()
+        results = {}
+        for start in range(0, len(tx_hashes), RPC_BATCH_SIZE):
+            batch = tx_hashes[start:start + RPC_BATCH_SIZE]
+            receipts = self.batch([('eth_getTransactionReceipt', [h]) for h in batch])
+            for tx_hash, receipt in zip(batch, receipts):
+                if not receipt:
+                    continue
+                for log in receipt.get('logs', []):
+                    if log['address'].lower() != self.contract.address.lower():
+                        continue
+                    try:
+                        decoded = event.process_log(_format_log(self.w3, log))
+                    except Exception:
+                        continue  # autre événement du contrat
+                    args = decoded['args']
+                    results[tx_hash] = (self.w3.to_hex(args['certificateId']),
+                                        args['recipientName'], args['issueDate'], args['ipfsHash'])
+                    break
+        return results
+
+    def verify_file_hashes(self, file_hashes):
+        """Résultats dans l'ordre, tranche par tranche"""
+        for start in range(0, len(file_hashes), CHUNK_SIZE):
+            chunk = file_hashes[start:start + CHUNK_SIZE]
+            found = {
+                cert.file_hash: cert for cert in
+                Certificate.query.filter(Certificate.file_hash.in_(chunk)).all()
+            }
+
+            cert_ids = {h: self._cert_id(h) for h in chunk}
+            missing = [h for h in chunk if h not in found]
+            indexed = {
+                row.certificate_id: row for row in
+                ChainCertificate.query.filter(ChainCertificate.certificate_id.in_(list(cert_ids.values()))).all()
+            } if cert_ids else {}
+
+            unresolved = [cert_ids[h] for h in missing
+                          if cert_ids[h] not in indexed and not self._is_revoked(cert_ids[h])]
+            on_chain = {}
+            if unresolved and self.contract is not None:
+                on_chain = self.chain_certificates(unresolved)
+
+            for h in chunk:
+                if self._is_revoked(cert_ids[h], found.get(h)):
+                    yield _revoked(h, 'file_hash', 'db' if h in found else 'revocations')
+                elif h in found:
+                    yield _db_result(h, 'file_hash', found[h])
+                elif cert_ids[h] in indexed:
+                    row = indexed[cert_ids[h]]
+                    yield _chain_result(h, 'file_hash', 'index', row.recipient_name, row.issue_date, row.ipfs_hash)
+                elif cert_ids[h] in on_chain:
+                    yield _chain_result(h, 'file_hash', 'chain', *on_chain[cert_ids[h]])
+                else:
+                    yield _miss(h, 'file_hash')
+
+    def verify_tx_hashes(self, tx_hashes):
+        for start in range(0, len(tx_hashes), CHUNK_SIZE):
+            chunk = tx_hashes[start:start + CHUNK_SIZE]
+            found = {
+                cert.blockchain_hash: cert for cert in
+                Certificate.query.filter(Certificate.blockchain_hash.in_(chunk)).all()
+            }
+            missing = [h for h in chunk if h not in found]
+            indexed = {
+                row.tx_hash: row for row in
+                ChainCertificate.query.filter(ChainCertificate.tx_hash.in_([h.lower() for h in missing])).all()
+            } if missing else {}
+
+            unresolved = [h for h in missing if h.lower() not in indexed]
+            on_chain = {}
+            if unresolved and self.contract is not None and self.batch is not None:
+                on_chain = self._chain_receipts(unresolved)
+
+            for h in chunk:
+                if h in found:
+                    cert = found[h]
+                    cert_id = self._cert_id(cert.file_hash) if cert.file_hash else None
+                    if self._is_revoked(cert_id, cert):
+                        yield _revoked(h, 'tx_hash', 'db')
+                    else:
+                        yield _db_result(h, 'tx_hash', cert)
+                elif h.lower() in indexed:
+                    row = indexed[h.lower()]
+                    if self._is_revoked(row.certificate_id):
+                        yield _revoked(h, 'tx_hash', 'index')
+                    else:
+                        yield _chain_result(h, 'tx_hash', 'index', row.recipient_name, row.issue_date, row.ipfs_hash)
+                elif h in on_chain:
+                    if self._is_revoked(on_chain[h][0]):
+                        yield _revoked(h, 'tx_hash', 'chain')
+                    else:
+                        yield _chain_result(h, 'tx_hash', 'chain', *on_chain[h][1:])
+                else:
+                    yield _miss(h, 'tx_hash')
+
+
+def _format_log(w3, log):
+    """Convertit un log JSON-RPC brut au format attendu par process_log"""
+    return {
+        'address': w3.to_checksum_address(log['address']),
+        'topics': [HexBytes(t) for t in log['topics']],
+        'data': HexBytes(log['data']),
+        'blockNumber': int(log['blockNumber'], 16),
+        'blockHash': HexBytes(log['blockHash']),
+        'transactionHash': HexBytes(log['transactionHash']),
+        'transactionIndex': int(log['transactionIndex'], 16),
+        'logIndex': int(log['logIndex'], 16)
+    }
@@ -0,0 +1,243 @@
+"""
+Indexeur des événements CertificateIssued et CertificateRevoked du contrat
+CertificateRegistry.
+
+Les logs sont lus par plages de blocs avec eth_getLogs et copiés dans les
+tables chain_certificates et revocations. Seuls les blocs ayant CONFIRMATIONS confirmations sont
+indexés ; le hash du dernier bloc traité est conservé pour détecter une
+réorganisation plus profonde et revenir en arrière. L'indexeur reprend au
+dernier bloc traité après un redémarrage.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from models import db, ChainCertificate, IndexerState, Revocation
+
+STATE_NAME = 'certificate_issued'
+# Nombre de retours en arrière (dans last_block) : les workers rechargent alors leurs révocations
+REWINDS_STATE = 'certificate_issued_rewinds'
+BATCH_SIZE = 2000
+MIN_BATCH_SIZE = 10
+CONFIRMATIONS = 12
+REORG_REWIND = 64
+POLL_INTERVAL = 15
+ISSUED_LOOKUP_BLOCKS = 1000  # blocs lus après le premier bloc de la date d'émission
+
+
+def deployment_block(w3, address):
+    """
+    Premier bloc où `address` porte du code, par dichotomie sur eth_getCode
+    (une vingtaine d'appels). Lever si le nœud n'a pas l'état historique :
+    INDEXER_START_BLOCK doit alors être renseigné.
+    """
+    head = w3.eth.block_number
+    try:
+        if not w3.eth.get_code(address, head):
+            raise RuntimeError(f"Aucun contrat à l'adresse {address}")
+        low, high = 0, head
+        while low < high:
+            middle = (low + high) // 2
+            if w3.eth.get_code(address, middle):
+                high = middle
+            else:
+                low = middle + 1
+    except RuntimeError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"Bloc de déploiement introuvable ({e}) : renseignez INDEXER_START_BLOCK") from e
+    return low
+
+
+class ChainIndexer:
+    def __init__(self, app, w3, contract, start_block=None, batch_size=BATCH_SIZE,
+                 confirmations=CONFIRMATIONS, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.w3 = w3
+        self.contract = contract
+        self.start_block = start_block  # None : bloc de déploiement du contrat, cherché au premier passage
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.event = contract.events.CertificateIssued()
+        self.topic = w3.to_hex(w3.keccak(text='CertificateIssued(bytes32,string,string,uint256)'))
+        self.revoked_event = contract.events.CertificateRevoked()
+        self.revoked_topic = w3.to_hex(w3.keccak(text='CertificateRevoked(bytes32,string,uint256)'))
+        self.running = False
+
+    def _state(self):
+        state = db.session.get(IndexerState, STATE_NAME)
+        if state is None:
+            state = IndexerState(name=STATE_NAME, last_block=self.start_block - 1)
+            db.session.add(state)
+            db.session.commit()
+        return state
+
+    def _check_reorg(self, state):
+        """Recule si le dernier bloc indexé n'est plus dans la chaîne canonique"""
+        if not state.last_block_hash or state.last_block < 0:
+            return
+        block = self.w3.eth.get_block(state.last_block)
+        if self.w3.to_hex(block['hash']) == state.last_block_hash:
+            return
+
+        rewind_to = max(self.start_block - 1, state.last_block - REORG_REWIND)
+        print(f"⚠️  Réorganisation détectée au bloc {state.last_block}, retour au bloc {rewind_to}")
+        ChainCertificate.query.filter(ChainCertificate.block_number > rewind_to).delete()
+        Revocation.query.filter(Revocation.source == 'chain', Revocation.block_number > rewind_to).delete()
+        rewinds = db.session.get(IndexerState, REWINDS_STATE)
+        if rewinds is None:
+            rewinds = IndexerState(name=REWINDS_STATE, last_block=0)
+            db.session.add(rewinds)
+        rewinds.last_block += 1
+        state.last_block = rewind_to
+        state.last_block_hash = None
+        db.session.commit()
+
+    def _fetch_logs(self, from_block, to_block):
+        return self.w3.eth.get_logs({
+            'address': self.contract.address,
+            'topics': [[self.topic, self.revoked_topic]],
+            'fromBlock': from_block,
+            'toBlock': to_block
+        })
+
+    def _store(self, logs):
+        """Insère les événements absents des tables"""
+        issued = [log for log in logs if self.w3.to_hex(log['topics'][0]) == self.topic]
+        revoked = [log for log in logs if self.w3.to_hex(log['topics'][0]) == self.revoked_topic]
+        self._store_revocations(revoked)
+
+        events = [self.event.process_log(log) for log in issued]
+        ids = [self.w3.to_hex(e['args']['certificateId']) for e in events]
+        existing = {
+            row.certificate_id for row in
+            ChainCertificate.query.filter(ChainCertificate.certificate_id.in_(ids)).all()
+        } if ids else set()
+
+        for cert_id, event in zip(ids, events):
+            if cert_id in existing:
+                continue
+            existing.add(cert_id)
+            db.session.add(ChainCertificate(
+                certificate_id=cert_id,
+                ipfs_hash=event['args']['ipfsHash'],
+                recipient_name=event['args']['recipientName'],
+                issue_date=event['args']['issueDate'],
+                block_number=event['blockNumber'],
+                block_hash=self.w3.to_hex(event['blockHash']),
+                tx_hash=self.w3.to_hex(event['transactionHash']),
+                log_index=event['logIndex']
+            ))
+        return len(events) + len(revoked)
+
+    def _store_revocations(self, logs):
+        events = [self.revoked_event.process_log(log) for log in logs]
+        ids = [self.w3.to_hex(e['args']['certificateId']) for e in events]
+        existing = {
+            row.certificate_id: row for row in
+            Revocation.query.filter(Revocation.certificate_id.in_(ids)).all()
+        } if ids else {}
+
+        for cert_id, event in zip(ids, events):
+            if cert_id in existing:
+                # Révocation faite par l'application : sa transaction est minée
+                row = existing[cert_id]
+                if row.chain_pending:
+                    row.tx_hash = self.w3.to_hex(event['transactionHash'])
+                    row.chain_pending = False
+                continue
+            existing[cert_id] = Revocation(
+                certificate_id=cert_id,
+                reason=event['args']['reason'],
+                source='chain',
+                revoked_at=datetime.utcfromtimestamp(event['args']['revokedAt']),
+                tx_hash=self.w3.to_hex(event['transactionHash']),
+                block_number=event['blockNumber']
+            )
+            db.session.add(existing[cert_id])
+
+    def run_once(self):
+        """Indexe jusqu'au dernier bloc confirmé, renvoie le nombre d'événements"""
+        if self.start_block is None:
+            self.start_block = deployment_block(self.w3, self.contract.address)
+            print(f"Indexeur: contrat déployé au bloc {self.start_block}")
+        with self.app.app_context():
+            state = self._state()
+            self._check_reorg(state)
+
+            safe_head = self.w3.eth.block_number - self.confirmations
+            indexed = 0
+            batch = self.batch_size
+
+            while state.last_block < safe_head:
+                from_block = state.last_block + 1
+                to_block = min(from_block + batch - 1, safe_head)
+                try:
+                    logs = self._fetch_logs(from_block, to_block)
+                except Exception as e:
+                    # Trop de résultats ou plage refusée par le fournisseur : plage plus petite
+                    if batch <= MIN_BATCH_SIZE:
+                        raise
+                    batch = max(MIN_BATCH_SIZE, batch // 2)
+                    print(f"eth_getLogs {from_block}-{to_block} refusé ({e}), plage réduite à {batch}")
+                    continue
+
+                indexed += self._store(logs)
+                state.last_block = to_block
+                state.last_block_hash = self.w3.to_hex(self.w3.eth.get_block(to_block)['hash'])
+                db.session.commit()
+                batch = min(self.batch_size, batch * 2)
+
+            return indexed
+
+    def _loop(self):
+        while self.running:
+            try:
+                indexed = self.run_once()
+                if indexed:
+                    print(f"Indexeur: {indexed} événement(s) indexé(s)")
+            except Exception as e:
+                print(f"Erreur indexeur: {e}")
+            time.sleep(self.poll_interval)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+
+def block_at(w3, timestamp):
+    """Premier bloc d'horodatage >= timestamp, par dichotomie sur les en-têtes (pas d'état historique requis)"""
+    low, high = 0, w3.eth.block_number
+    while low < high:
+        middle = (low + high) // 2
+        if w3.eth.get_block(middle)['timestamp'] < timestamp:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def issued_tx_hash(w3, contract, cert_id_hex, issue_date):
+    """
+    Hash de la transaction qui a émis `cert_id_hex`, lu dans l'événement
+    CertificateIssued par RPC (certificat pas encore indexé) ; la date
+    d'émission du contrat situe le bloc. None si l'événement est introuvable.
+    """
+    start = block_at(w3, issue_date)
+    logs = w3.eth.get_logs({
+        'address': contract.address,
+        'topics': [w3.to_hex(w3.keccak(text='CertificateIssued(bytes32,string,string,uint256)')), cert_id_hex],
+        'fromBlock': start,
+        'toBlock': min(start + ISSUED_LOOKUP_BLOCKS, w3.eth.block_number)
+    })
+    return w3.to_hex(logs[0]['transactionHash']) if logs else None
+
+
+def lookup(cert_id_hex):
+    """Certificat indexé pour un identifiant bytes32 (hex), ou None"""
+    return ChainCertificate.query.filter_by(certificate_id=cert_id_hex.lower()).first()
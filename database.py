@@ -0,0 +1,54 @@
+"""
+Configuration du moteur SQLAlchemy : URL de base configurable, pool de
+connexions pour PostgreSQL/MySQL, et pour SQLite le mode WAL avec
+busy_timeout afin que les écritures concurrentes attendent le verrou au
+lieu d'échouer avec « database is locked ».
+"""
+
+from sqlalchemy import event
+
+from models import db
+
+
+def normalize_url(url):
+    """Accepte aussi l'ancien schéma postgres:// (Heroku, Render...)"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(url, pool_size=10, max_overflow=20, pool_timeout=30, pool_recycle=1800):
+    """Options create_engine adaptées au backend"""
+    options = {'pool_pre_ping': True}
+    if not url.startswith('sqlite'):
+        options.update({
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_timeout': pool_timeout,
+            'pool_recycle': pool_recycle
+        })
+    return options
+
+
+def _sqlite_pragmas(busy_timeout_ms):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL : les lecteurs ne bloquent plus l'écrivain et inversement
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+        # Sûr en WAL : seule une coupure de courant peut perdre les derniers commits
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+    return on_connect
+
+
+def init_db(app, url, busy_timeout_ms=5000, **pool_options):
+    """Configure l'URL et le pool, initialise db et règle SQLite à chaque connexion"""
+    url = normalize_url(url)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(url, **pool_options)
+    db.init_app(app)
+
+    if url.startswith('sqlite'):
+        with app.app_context():
+            event.listen(db.engine, 'connect', _sqlite_pragmas(busy_timeout_ms))
@@ -0,0 +1,178 @@
+"""
+Reed-Solomon erasure coding over GF(256), vectorized with NumPy.
+
+A file is cut into stripes; each stripe is split into k data chunks and m
+parity chunks are computed from them. Fragment i is the concatenation of chunk
+i of every stripe, so any k of the k+m fragments are enough to rebuild the file.
+"""
+
+import numpy as np
+
+STRIPE_CHUNK = 1024 * 1024  # bytes of each fragment per stripe
+
+
+def _build_tables():
+    """Exp/log tables and full multiplication table for GF(256), polynomial 0x11d"""
+    exp = np.zeros(512, dtype=np.uint8)
+    log = np.zeros(256, dtype=np.int32)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11d
+    exp[255:510] = exp[:255]
+
+    # mul[a, b] = a * b, so mul[c][data] multiplies a whole chunk by c
+    a = np.arange(256)
+    mul = exp[(log[a][:, None] + log[a][None, :]) % 255].astype(np.uint8)
+    mul[0, :] = 0
+    mul[:, 0] = 0
+    return exp, log, mul
+
+
+GF_EXP, GF_LOG, GF_MUL = _build_tables()
+
+
+def gf_inv(a):
+    """Multiplicative inverse in GF(256)"""
+    if a == 0:
+        raise ZeroDivisionError('0 has no inverse in GF(256)')
+    return int(GF_EXP[255 - GF_LOG[a]])
+
+
+def generator_matrix(k, m):
+    """Systematic (k+m) x k generator: identity on top, Cauchy rows below.
+
+    Every k x k submatrix of it is invertible, which is what makes any k
+    fragments sufficient.
+    """
+    if k < 1 or m < 0 or k + m > 256:
+        raise ValueError('Need 1 <= k and k + m <= 256')
+    matrix = np.zeros((k + m, k), dtype=np.uint8)
+    matrix[:k] = np.eye(k, dtype=np.uint8)
+    for j in range(m):
+        for i in range(k):
+            matrix[k + j, i] = gf_inv((k + j) ^ i)
+    return matrix
+
+
+def gf_matmul(matrix, rows):
+    """Multiply a GF(256) coefficient matrix by a (k, n) uint8 block of chunks"""
+    out = np.zeros((matrix.shape[0], rows.shape[1]), dtype=np.uint8)
+    for j in range(matrix.shape[0]):
+        acc = out[j]
+        for i in range(matrix.shape[1]):
+            c = matrix[j, i]
+            if c == 1:
+                acc ^= rows[i]
+            elif c:
+                acc ^= GF_MUL[c][rows[i]]
+    return out
+
+
+def gf_invert(matrix):
+    """Invert a square GF(256) matrix with Gauss-Jordan elimination"""
+    n = matrix.shape[0]
+    work = np.concatenate([matrix.astype(np.uint8), np.eye(n, dtype=np.uint8)], axis=1)
+    for col in range(n):
+        pivot = next((r for r in range(col, n) if work[r, col]), None)
+        if pivot is None:
+            raise ValueError('Matrix is singular')
+        if pivot != col:
+            work[[col, pivot]] = work[[pivot, col]]
+        work[col] = GF_MUL[gf_inv(int(work[col, col]))][work[col]]
+        for r in range(n):
+            if r != col and work[r, col]:
+                work[r] ^= GF_MUL[work[r, col]][work[col]]
+    return work[:, n:]
+
+
+def stripe_layout(size, k, chunk=STRIPE_CHUNK):
+    """Yield (offset, stripe_bytes, chunk_len) for each stripe of a file"""
+    if size == 0:
+        yield 0, 0, 1
+        return
+    stripe = k * chunk
+    for offset in range(0, size, stripe):
+        stripe_bytes = min(stripe, size - offset)
+        yield offset, stripe_bytes, -(-stripe_bytes // k)
+
+
+def fragment_size(size, k, chunk=STRIPE_CHUNK):
+    """Length of each fragment for a file of `size` bytes"""
+    return sum(chunk_len for _, _, chunk_len in stripe_layout(size, k, chunk))
+
+
+def encode_stripe(data, k, m, matrix=None):
+    """Encode one stripe of bytes into k+m equal-length chunks (numpy rows)"""
+    if matrix is None:
+        matrix = generator_matrix(k, m)
+    chunk_len = max(1, -(-len(data) // k))
+    block = np.zeros(k * chunk_len, dtype=np.uint8)
+    block[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    block = block.reshape(k, chunk_len)
+    parity = gf_matmul(matrix[k:], block)
+    return np.concatenate([block, parity])
+
+
+def decode_stripe(chunks, k, m, stripe_bytes, matrix=None):
+    """Rebuild one stripe from any k chunks given as {index: numpy row}"""
+    if matrix is None:
+        matrix = generator_matrix(k, m)
+    indices = sorted(chunks)[:k]
+    if len(indices) < k:
+        raise ValueError(f'Need {k} fragments, got {len(indices)}')
+    rows = np.stack([chunks[i] for i in indices])
+    if indices == list(range(k)):
+        data = rows
+    else:
+        data = gf_matmul(gf_invert(matrix[indices]), rows)
+    return data.reshape(-1)[:stripe_bytes].tobytes()
+
+
+def encode(data, k, m, chunk=STRIPE_CHUNK):
+    """Encode bytes into a list of k+m fragments"""
+    matrix = generator_matrix(k, m)
+    parts = [[] for _ in range(k + m)]
+    for offset, stripe_bytes, _ in stripe_layout(len(data), k, chunk):
+        rows = encode_stripe(data[offset:offset + stripe_bytes], k, m, matrix)
+        for i in range(k + m):
+            parts[i].append(rows[i].tobytes())
+    return [b''.join(p) for p in parts]
+
+
+def decode(fragments, k, m, size, chunk=STRIPE_CHUNK):
+    """Rebuild the original bytes from any k fragments given as {index: bytes}"""
+    matrix = generator_matrix(k, m)
+    out = []
+    pos = 0
+    for _, stripe_bytes, chunk_len in stripe_layout(size, k, chunk):
+        chunks = {
+            i: np.frombuffer(frag, dtype=np.uint8, count=chunk_len, offset=pos)
+            for i, frag in fragments.items()
+        }
+        out.append(decode_stripe(chunks, k, m, stripe_bytes, matrix))
+        pos += chunk_len
+    return b''.join(out)
+
+
+def encode_file(src, size, k, m, fragment_files, chunk=STRIPE_CHUNK):
+    """Stream-encode an open file into k+m open fragment files, one stripe at a time"""
+    matrix = generator_matrix(k, m)
+    for _, stripe_bytes, _ in stripe_layout(size, k, chunk):
+        rows = encode_stripe(src.read(stripe_bytes), k, m, matrix)
+        for i, f in enumerate(fragment_files):
+            f.write(rows[i].tobytes())
+
+
+def decode_file(fragment_files, k, m, size, dest, chunk=STRIPE_CHUNK):
+    """Stream-decode from any k open fragment files {index: file} into dest"""
+    matrix = generator_matrix(k, m)
+    for _, stripe_bytes, chunk_len in stripe_layout(size, k, chunk):
+        chunks = {
+            i: np.frombuffer(f.read(chunk_len), dtype=np.uint8)
+            for i, f in fragment_files.items()
+        }
+        dest.write(decode_stripe(chunks, k, m, stripe_bytes, matrix))
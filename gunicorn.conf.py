@@ -0,0 +1,39 @@
+"""
+Configuration gunicorn de production : gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers préforkés avec threads (gthread) : les requêtes passent l'essentiel
+de leur temps à attendre le RPC, Pinata ou un reçu de transaction. L'app est
+chargée une fois dans le maître (preload_app) puis partagée par fork.
+"""
+
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import WEB_BIND, WEB_WORKERS, WEB_THREADS, WEB_TIMEOUT
+
+bind = WEB_BIND
+workers = WEB_WORKERS or min(multiprocessing.cpu_count() * 2 + 1, 8)
+worker_class = 'gthread'
+threads = WEB_THREADS
+timeout = WEB_TIMEOUT
+graceful_timeout = 30
+keepalive = 5
+preload_app = True
+
+# Recycle les workers pour borner la mémoire (génération de PDF, caches)
+max_requests = 2000
+max_requests_jitter = 200
+
+
+def when_ready(server):
+    import wsgi
+    wsgi.upgrade_schema()
+
+
+def post_fork(server, worker):
+    import wsgi
+    if wsgi.init_worker():
+        server.log.info("Worker %s: sweeper IPFS, indexeur et file d'emails lancés", worker.pid)
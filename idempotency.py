@@ -0,0 +1,176 @@
+"""
+Requêtes rejouables avec l'en-tête Idempotency-Key.
+
+La première requête enregistre la clé (par institution) à l'état
+'processing' avec l'empreinte de la requête, exécute la route puis conserve
+sa réponse. Une nouvelle tentative avec la même clé reçoit la réponse
+enregistrée sans rien recréer (certificat, PDF, épinglage, transaction) ; un
+doublon concurrent attend la fin de la requête en cours et reçoit son
+résultat. La même clé avec un autre corps est refusée (422).
+
+Seules les réponses 2xx sont conservées : après une erreur, la clé est
+libérée et le client peut réessayer. Une route décorée ne renvoie donc une
+erreur qu'avant tout effet durable, ou après l'avoir annulé ; au-delà, elle
+répond 2xx (create_certificate : dès que le certificat est enregistré). Les clés expirent après `ttl` secondes ;
+une clé restée 'processing' plus de `lock_timeout` secondes (processus
+arrêté) est reprise par la tentative suivante.
+"""
+
+import hashlib
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import jsonify, make_response, request, session
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.2  # secondes entre deux lectures d'une clé en cours
+PURGE_INTERVAL = 600  # secondes entre deux suppressions des clés expirées
+
+IDEMPOTENT_REQUESTS = metrics.REGISTRY.counter(
+    'certichain_idempotent_requests_total',
+    'Requêtes avec Idempotency-Key par résultat (executed, replayed, mismatch, in_progress)', ['result'])
+
+_last_purge = 0.0
+
+
+def fingerprint(req):
+    """sha256 de la méthode, du chemin et du corps (JSON canonique si possible)"""
+    body = req.get_json(silent=True)
+    if body is not None:
+        payload = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    else:
+        payload = req.get_data(as_text=True)
+    return hashlib.sha256(f"{req.method} {req.path}\n{payload}".encode()).hexdigest()
+
+
+def purge_expired(now=None):
+    """Supprime les clés expirées ; renvoie leur nombre"""
+    deleted = IdempotencyKey.query.filter(IdempotencyKey.expires_at < (now or datetime.utcnow())) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+def _maybe_purge(now):
+    global _last_purge
+    if time.monotonic() - _last_purge > PURGE_INTERVAL:
+        _last_purge = time.monotonic()
+        purge_expired(now)
+
+
+def _claim(scope, key, digest, ttl, lock_timeout):
+    """
+    Réserve la clé pour cette requête. Renvoie (owner, None) si elle doit être
+    traitée ici, (None, ligne existante) sinon, (None, None) si la ligne vient
+    de disparaître (à réessayer).
+    """
+    now = datetime.utcnow()
+    owner = uuid.uuid4().hex
+    values = dict(fingerprint=digest, status='processing', owner=owner, locked_at=now,
+                  response_code=None, response_body=None, response_type=None,
+                  expires_at=now + timedelta(seconds=ttl))
+    db.session.add(IdempotencyKey(institution_id=scope, key=key, created_at=now, **values))
+    try:
+        db.session.commit()
+        _maybe_purge(now)
+        return owner, None
+    except IntegrityError:
+        db.session.rollback()
+
+    # Clé expirée, ou abandonnée par une requête morte : reprise atomique
+    taken = IdempotencyKey.query.filter(
+        IdempotencyKey.institution_id == scope,
+        IdempotencyKey.key == key,
+        or_(IdempotencyKey.expires_at < now,
+            (IdempotencyKey.status == 'processing') &
+            (IdempotencyKey.locked_at < now - timedelta(seconds=lock_timeout)) &
+            (IdempotencyKey.fingerprint == digest))
+    ).update(dict(values, created_at=now), synchronize_session=False)
+    db.session.commit()
+    if taken:
+        return owner, None
+    return None, IdempotencyKey.query.filter_by(institution_id=scope, key=key) \
+        .execution_options(populate_existing=True).first()
+
+
+def _store(scope, key, owner, response):
+    IdempotencyKey.query.filter_by(institution_id=scope, key=key, owner=owner).update({
+        'status': 'done',
+        'response_code': response.status_code,
+        'response_body': response.get_data(as_text=True),
+        'response_type': response.mimetype,
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def _release(scope, key, owner):
+    db.session.rollback()
+    IdempotencyKey.query.filter_by(institution_id=scope, key=key, owner=owner) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _replay(row):
+    response = make_response(row.response_body, row.response_code)
+    response.mimetype = row.response_type or 'application/json'
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(ttl, wait, lock_timeout):
+    """Décorateur de route POST : à placer sous @login_required (clés propres à chaque institution)"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get(HEADER)
+            if key is None:
+                return f(*args, **kwargs)
+            key = key.strip()
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({'message': f"{HEADER} invalide (1 à {MAX_KEY_LENGTH} caractères)"}), 400
+
+            scope = session.get('institution_id')
+            digest = fingerprint(request)
+            deadline = time.monotonic() + wait
+            while True:
+                owner, row = _claim(scope, key, digest, ttl, lock_timeout)
+                if owner:
+                    break
+                if row is None:
+                    continue
+                if row.fingerprint != digest:
+                    IDEMPOTENT_REQUESTS.inc(result='mismatch')
+                    return jsonify({'message': f"{HEADER} déjà utilisée pour une autre requête"}), 422
+                if row.status == 'done':
+                    IDEMPOTENT_REQUESTS.inc(result='replayed')
+                    return _replay(row)
+                if time.monotonic() >= deadline:
+                    IDEMPOTENT_REQUESTS.inc(result='in_progress')
+                    response = jsonify({'message': "Requête identique en cours de traitement, réessayez plus tard"})
+                    response.headers['Retry-After'] = str(max(1, int(wait)))
+                    return response, 409
+                db.session.rollback()  # nouvelle lecture au prochain tour
+                time.sleep(POLL_INTERVAL)
+
+            try:
+                response = make_response(f(*args, **kwargs))
+            except Exception:
+                _release(scope, key, owner)
+                raise
+            if 200 <= response.status_code < 300:
+                _store(scope, key, owner, response)
+                IDEMPOTENT_REQUESTS.inc(result='executed')
+            else:
+                _release(scope, key, owner)
+            return response
+        return decorated_function
+    return decorator
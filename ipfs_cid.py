@@ -0,0 +1,84 @@
+"""
+Calcul local du CIDv1 d'un fichier, identique à celui que renvoie un nœud
+IPFS (kubo) ou Pinata avec cidVersion=1 : UnixFS, blocs de 256 Kio,
+feuilles brutes (raw-leaves), DAG équilibré de 174 liens par nœud.
+"""
+
+import base64
+import hashlib
+
+CHUNK_SIZE = 256 * 1024
+MAX_LINKS = 174
+
+CODEC_RAW = 0x55
+CODEC_DAG_PB = 0x70
+SHA2_256 = 0x12
+UNIXFS_FILE = 2
+
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field_bytes(field, value):
+    return _varint(field << 3 | 2) + _varint(len(value)) + value
+
+
+def _field_varint(field, value):
+    return _varint(field << 3) + _varint(value)
+
+
+def _cid_bytes(codec, block):
+    digest = hashlib.sha256(block).digest()
+    return _varint(1) + _varint(codec) + bytes([SHA2_256, len(digest)]) + digest
+
+
+def cid_to_str(cid):
+    """Encodage multibase base32 minuscule (préfixe 'b')"""
+    return 'b' + base64.b32encode(cid).decode('ascii').lower().rstrip('=')
+
+
+def _parent_node(children):
+    """Nœud dag-pb UnixFS reliant des enfants (cid, tsize, filesize)"""
+    unixfs = _field_varint(1, UNIXFS_FILE)
+    unixfs += _field_varint(3, sum(c[2] for c in children))
+    for child in children:
+        unixfs += _field_varint(4, child[2])
+
+    # dag-pb canonique : liens d'abord, puis Data
+    node = b''
+    for cid, tsize, _ in children:
+        link = _field_bytes(1, cid) + _field_bytes(2, b'') + _field_varint(3, tsize)
+        node += _field_bytes(2, link)
+    node += _field_bytes(1, unixfs)
+
+    cid = _cid_bytes(CODEC_DAG_PB, node)
+    return cid, len(node) + sum(c[1] for c in children), sum(c[2] for c in children)
+
+
+def compute_cid(data):
+    """CIDv1 (chaîne base32) d'un contenu"""
+    if len(data) <= CHUNK_SIZE:
+        return cid_to_str(_cid_bytes(CODEC_RAW, data))
+
+    level = []
+    for offset in range(0, len(data), CHUNK_SIZE):
+        chunk = data[offset:offset + CHUNK_SIZE]
+        level.append((_cid_bytes(CODEC_RAW, chunk), len(chunk), len(chunk)))
+
+    while len(level) > 1:
+        level = [_parent_node(level[i:i + MAX_LINKS]) for i in range(0, len(level), MAX_LINKS)]
+    return cid_to_str(level[0][0])
+
+
+def compute_file_cid(file_path):
+    with open(file_path, 'rb') as f:
+        return compute_cid(f.read())
@@ -0,0 +1,107 @@
+"""
+Client Pinata/IPFS : session HTTP persistante, délais configurables,
+reprises avec backoff exponentiel et pool de threads borné pour épingler
+plusieurs fichiers en parallèle.
+"""
+
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+PINATA_API_URL = "https://api.pinata.cloud"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class IPFSError(Exception):
+    """Échec définitif d'un épinglage"""
+
+
+class IPFSClient:
+    def __init__(self, api_key, secret_key, base_url=PINATA_API_URL,
+                 connect_timeout=5, read_timeout=60, max_retries=4,
+                 backoff=0.5, max_workers=8):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        # Une seule session : connexions keep-alive et session TLS réutilisées
+        self.session = requests.Session()
+        self.session.headers.update({
+            "pinata_api_key": api_key or '',
+            "pinata_secret_api_key": secret_key or ''
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ipfs-pin')
+
+    def _sleep_before_retry(self, attempt, response=None):
+        """Backoff exponentiel avec gigue, en respectant Retry-After si présent"""
+        delay = self.backoff * (2 ** attempt)
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            delay = max(delay, int(response.headers['Retry-After']))
+        time.sleep(delay * random.uniform(0.5, 1.5))
+
+    def pin_bytes(self, data, filename='file'):
+        """Épingle un contenu et renvoie son CID"""
+        url = f"{self.base_url}/pinning/pinFileToIPFS"
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self.session.post(
+                    url,
+                    files={"file": (filename, data)},
+                    # CIDv1 + raw-leaves : le même CID que ipfs_cid.compute_cid
+                    data={"pinataOptions": json.dumps({"cidVersion": 1})},
+                    timeout=self.timeout
+                )
+                if response.status_code == 200:
+                    return response.json()["IpfsHash"]
+                last_error = f"HTTP {response.status_code}: {response.text[:200]}"
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = str(e)
+
+            if attempt < self.max_retries:
+                self._sleep_before_retry(attempt, response)
+
+        raise IPFSError(f"IPFS Error: {last_error}")
+
+    def pin_file(self, file_path):
+        """Épingle un fichier local et renvoie son CID"""
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return self.pin_bytes(data, os.path.basename(file_path))
+
+    def pin_async(self, file_path):
+        """Épingle en arrière-plan, renvoie un Future"""
+        return self.executor.submit(self.pin_file, file_path)
+
+    def pin_bytes_async(self, data, filename='file'):
+        """Épingle un contenu en arrière-plan, renvoie un Future"""
+        return self.executor.submit(self.pin_bytes, data, filename)
+
+    def pin_many(self, file_paths):
+        """Épingle plusieurs fichiers en parallèle : {chemin: CID ou exception}"""
+        futures = {path: self.pin_async(path) for path in file_paths}
+        results = {}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                results[path] = e
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
@@ -0,0 +1,312 @@
+"""
+Envoi des emails par une file d'attente en base (table mail_outbox).
+
+enqueue() ajoute le message à la session courante : il est enregistré dans
+la même transaction que le certificat qu'il annonce, et disparaît avec elle
+en cas de rollback. Le Dispatcher, lancé avec les tâches de fond, réserve les
+messages dus par lots et les envoie depuis WORKERS threads ; chacun garde sa
+connexion SMTP authentifiée ouverte d'un lot à l'autre. Le débit est borné
+par fournisseur avec un seau à jetons partagé par les threads.
+
+Une erreur temporaire (4xx, connexion perdue) replanifie le message avec un
+délai qui double à chaque tentative ; une erreur permanente (5xx) ou
+MAX_ATTEMPTS échecs le classent 'dead', avec la dernière erreur.
+"""
+
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+from sqlalchemy import select, update
+
+import metrics
+from models import db, OutboxMessage
+
+BATCH_SIZE = 100
+WORKERS = 2
+MAX_ATTEMPTS = 5
+RETRY_BASE = 30  # secondes, doublé à chaque tentative
+RETRY_MAX = 3600
+MESSAGES_PER_CONNECTION = 100  # reconnexion au-delà, limite courante des fournisseurs
+IDLE_TIMEOUT = 60  # secondes sans envoi avant de vérifier la connexion (NOOP)
+CLAIM_TIMEOUT = 600  # secondes : réservation d'un processus arrêté, remise en file
+POLL_INTERVAL = 5
+SMTP_TIMEOUT = 30
+
+# Messages par seconde par serveur SMTP quand MAIL_RATE_LIMIT n'est pas défini
+PROVIDER_RATES = {
+    'smtp.gmail.com': 1,
+    'smtp-mail.outlook.com': 0.5,
+    'smtp.office365.com': 0.5,
+    'smtp.sendgrid.net': 100,
+    'email-smtp.': 14,  # Amazon SES, email-smtp.<région>.amazonaws.com
+}
+DEFAULT_RATE = 10
+
+MAIL_MESSAGES = metrics.REGISTRY.counter(
+    'certichain_mail_messages_total', 'Emails de la file par résultat (sent, retry, dead)', ['result'])
+
+
+def enqueue(recipient, subject, body, certificate_id=None):
+    """Ajoute un message à la session courante ; envoyé après le commit de l'appelant"""
+    message = OutboxMessage(recipient=recipient, subject=subject, body=body,
+                            certificate_id=certificate_id, next_attempt_at=datetime.utcnow())
+    db.session.add(message)
+    return message
+
+
+def provider_rate(host, override=0):
+    if override:
+        return override
+    for prefix, rate in PROVIDER_RATES.items():
+        if host.startswith(prefix):
+            return rate
+    return DEFAULT_RATE
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Attend qu'un jeton soit disponible et le consomme"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _permanent(error):
+    """Refus définitif du serveur (5xx) ; l'échec d'authentification reste temporaire (configuration)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code >= 500
+    return False
+
+
+def _connection_error(error):
+    """La connexion elle-même est en cause : inutile d'essayer le reste du lot"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError,
+                          smtplib.SMTPAuthenticationError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code == 421
+    # SMTPException hérite d'OSError : un refus du destinataire n'est pas une erreur réseau
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class SMTPConnection:
+    """Connexion SMTP persistante, propre à un thread d'envoi"""
+
+    def __init__(self, host, port, username='', password='', use_tls=True, use_ssl=False,
+                 timeout=SMTP_TIMEOUT, max_messages=MESSAGES_PER_CONNECTION, idle_timeout=IDLE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.idle_timeout = idle_timeout
+        self.smtp = None
+        self.sent = 0
+        self.used_at = 0.0
+        self.connections = 0
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            smtp.ehlo()
+            if self.use_tls and not self.use_ssl:
+                smtp.starttls()
+                smtp.ehlo()
+            if self.username:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.smtp, self.sent, self.used_at = smtp, 0, time.monotonic()
+        self.connections += 1
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            self.smtp.close()
+        self.smtp = None
+
+    def _ready(self):
+        if self.smtp is not None and self.sent >= self.max_messages:
+            self.close()
+        if self.smtp is not None and time.monotonic() - self.used_at > self.idle_timeout:
+            try:
+                if self.smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.smtp.close()
+                self.smtp = None
+        if self.smtp is None:
+            self._connect()
+
+    def send(self, message):
+        self._ready()
+        self.smtp.send_message(message)
+        self.sent += 1
+        self.used_at = time.monotonic()
+
+
+class Dispatcher:
+    def __init__(self, app, host, port=587, username='', password='', use_tls=True, use_ssl=False,
+                 sender='', rate_limit=0, workers=WORKERS, batch_size=BATCH_SIZE,
+                 max_attempts=MAX_ATTEMPTS, poll_interval=POLL_INTERVAL,
+                 messages_per_connection=MESSAGES_PER_CONNECTION):
+        self.app = app
+        self.smtp_options = dict(host=host, port=port, username=username, password=password,
+                                 use_tls=use_tls, use_ssl=use_ssl, max_messages=messages_per_connection)
+        self.sender = sender or username
+        self.bucket = TokenBucket(provider_rate(host, rate_limit))
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.running = False
+        self.threads = []
+
+    def claim(self, token):
+        """Réserve jusqu'à batch_size messages dus pour `token` ; renvoie leurs lignes"""
+        now = datetime.utcnow()
+        OutboxMessage.query.filter(
+            OutboxMessage.status == 'sending',
+            OutboxMessage.claimed_at < now - timedelta(seconds=CLAIM_TIMEOUT)
+        ).update({'status': 'pending', 'claimed_by': None}, synchronize_session=False)
+
+        due = select(OutboxMessage.id).where(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.next_attempt_at, OutboxMessage.id).limit(self.batch_size)
+        # La condition sur status rend la réservation atomique entre threads et processus
+        db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(due.scalar_subquery()), OutboxMessage.status == 'pending')
+            .values(status='sending', claimed_by=token, claimed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return OutboxMessage.query.filter_by(claimed_by=token, status='sending') \
+            .order_by(OutboxMessage.id).all()
+
+    def _message(self, row):
+        message = EmailMessage()
+        message['From'] = self.sender
+        message['To'] = row.recipient
+        message['Subject'] = row.subject
+        message['Date'] = formatdate(localtime=True)
+        message['Message-ID'] = make_msgid(idstring=f'outbox-{row.id}')
+        message.set_content(row.body)
+        return message
+
+    def _failed(self, row, error, now):
+        row.attempts += 1
+        row.last_error = f"{type(error).__name__}: {error}"[:500]
+        row.claimed_by = None
+        if _permanent(error) or row.attempts >= self.max_attempts:
+            row.status = 'dead'
+            MAIL_MESSAGES.inc(result='dead')
+            print(f"📭 Email {row.id} abandonné pour {row.recipient}: {row.last_error}")
+        else:
+            row.status = 'pending'
+            row.next_attempt_at = now + timedelta(seconds=min(RETRY_BASE * 2 ** (row.attempts - 1), RETRY_MAX))
+            MAIL_MESSAGES.inc(result='retry')
+
+    def send_batch(self, connection, rows):
+        """Envoie les lignes réservées sur `connection` ; un seul commit pour le lot. Renvoie le nombre envoyé"""
+        sent = []
+        for i, row in enumerate(rows):
+            self.bucket.acquire()
+            try:
+                connection.send(self._message(row))
+            except Exception as e:
+                now = datetime.utcnow()
+                self._failed(row, e, now)
+                if _connection_error(e):
+                    connection.close()
+                    for rest in rows[i + 1:]:  # remis en file sans compter de tentative
+                        rest.status, rest.claimed_by = 'pending', None
+                    break
+                continue
+            sent.append(row.id)
+
+        if sent:
+            db.session.execute(
+                update(OutboxMessage).where(OutboxMessage.id.in_(sent))
+                .values(status='sent', sent_at=datetime.utcnow(), claimed_by=None,
+                        attempts=OutboxMessage.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+            MAIL_MESSAGES.inc(len(sent), result='sent')
+        db.session.commit()
+        return len(sent)
+
+    def run_once(self):
+        """Envoie tous les messages dus depuis ce thread ; renvoie le nombre envoyé"""
+        connection = SMTPConnection(**self.smtp_options)
+        total = 0
+        try:
+            with self.app.app_context():
+                while True:
+                    rows = self.claim(uuid.uuid4().hex)
+                    if not rows:
+                        return total
+                    sent = self.send_batch(connection, rows)
+                    total += sent
+                    if not sent and connection.smtp is None:
+                        return total  # serveur injoignable : les messages restent en file
+        finally:
+            connection.close()
+
+    def _worker(self):
+        connection = SMTPConnection(**self.smtp_options)
+        while self.running:
+            try:
+                with self.app.app_context():
+                    rows = self.claim(uuid.uuid4().hex)
+                    if rows and (self.send_batch(connection, rows) or connection.smtp is not None):
+                        continue
+            except Exception as e:
+                print(f"⚠️  Envoi des emails: {e}")
+            time.sleep(self.poll_interval)
+        connection.close()
+
+    def start(self):
+        self.running = True
+        self.threads = [threading.Thread(target=self._worker, daemon=True) for _ in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+        print(f"📬 File d'emails: {self.workers} connexion(s) SMTP vers {self.smtp_options['host']}, "
+              f"{self.bucket.rate:g} message(s)/s")
+
+    def stop(self):
+        self.running = False
+        for thread in self.threads:
+            thread.join()
@@ -0,0 +1,277 @@
+"""
+Métriques de l'application : histogrammes de latence par route et par étape
+du pipeline d'émission (render, hash, ipfs, tx_send, receipt_wait,
+db_commit), compteurs d'échecs, exposés au format texte Prometheus.
+
+Les spans OpenTelemetry sont optionnels : si le SDK est installé et
+TRACE_EXPORT_FILE défini, chaque requête et chaque étape produit un span
+exporté dans ce fichier (une ligne JSON par span).
+
+Registry et start_http_server servent aussi aux processus hors Flask
+(network_server, storage_node).
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_str(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _fmt(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            self.values[key] = value
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # labels -> [compteurs par bucket, somme, total]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    labels = _label_str(self.labelnames, key, f'le="{bound}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _label_str(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {total!r}")
+                lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # fonctions appelées avant chaque rendu (jauges calculées)
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collect):
+        self.collectors.append(collect)
+
+    def render(self):
+        """Exposition au format texte Prometheus 0.0.4"""
+        for collect in self.collectors:
+            collect()
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def start_http_server(registry, port, host='0.0.0.0'):
+    """Sert GET /metrics dans un thread ; renvoie le serveur (port 0 = port libre)"""
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+REGISTRY = Registry()
+REQUEST_LATENCY = REGISTRY.histogram(
+    'certichain_http_request_duration_seconds', 'Durée des requêtes HTTP par route', ['method', 'route'])
+REQUESTS = REGISTRY.counter(
+    'certichain_http_requests_total', 'Requêtes HTTP par route et code de statut', ['method', 'route', 'status'])
+STAGE_LATENCY = REGISTRY.histogram(
+    'certichain_stage_duration_seconds', "Durée des étapes du pipeline d'émission", ['stage'])
+FAILURES = REGISTRY.counter(
+    'certichain_failures_total', 'Échecs par étape', ['stage'])
+
+_tracer = None
+
+
+def init_tracing(export_file, service_name='certichain'):
+    """Exporte les spans OpenTelemetry dans export_file si le SDK est disponible"""
+    global _tracer
+    if trace is None or not export_file:
+        return False
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    out = open(export_file, 'a', buffering=1)
+    provider = TracerProvider(resource=Resource.create({'service.name': service_name}))
+    provider.add_span_processor(BatchSpanProcessor(ConsoleSpanExporter(
+        out=out, formatter=lambda span: span.to_json(indent=None) + '\n'
+    )))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer('certichain')
+    return True
+
+
+@contextmanager
+def _span(name):
+    if _tracer is None:
+        yield None
+        return
+    with _tracer.start_as_current_span(name) as span:
+        yield span
+
+
+@contextmanager
+def stage(name):
+    """Mesure une étape ; une exception compte comme échec de l'étape puis est relancée"""
+    start = time.perf_counter()
+    with _span(name):
+        try:
+            yield
+        except Exception:
+            FAILURES.inc(stage=name)
+            raise
+        finally:
+            STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+
+
+def record_failure(stage_name):
+    FAILURES.inc(stage=stage_name)
+
+
+def _route():
+    from flask import request
+    # Gabarit de la route (/certificate/<int:cert_id>) pour borner la cardinalité
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_app(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+        if _tracer is not None:
+            # Span courant : les étapes de la requête en deviennent les enfants
+            g.metrics_span = _tracer.start_as_current_span(f"{request.method} {_route()}")
+            g.metrics_span.__enter__().set_attribute('http.route', _route())
+
+    @app.after_request
+    def _status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # teardown_request s'exécute même quand une exception saute after_request :
+    # la requête est comptée (500) et son span refermé, sinon il resterait courant
+    @app.teardown_request
+    def _record(error=None):
+        status = g.pop('metrics_status', 500)
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = _route()
+            REQUEST_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route)
+            REQUESTS.inc(method=request.method, route=route, status=status)
+        span = g.pop('metrics_span', None)
+        if span is not None:
+            trace.get_current_span().set_attribute('http.status_code', status)
+            if error is None:
+                span.__exit__(None, None, None)
+            else:
+                span.__exit__(type(error), error, error.__traceback__)
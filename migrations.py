@@ -0,0 +1,139 @@
+"""
+Migrations du schéma, appliquées dans l'ordre et enregistrées dans la table
+schema_migrations. Chaque migration est idempotente : elle inspecte la base
+avant d'ajouter une colonne ou un index, ce qui permet de reprendre une base
+créée auparavant par db.create_all().
+
+    flask migrate-db           # applique les migrations en attente
+    flask migrate-db --status  # liste les migrations appliquées / en attente
+"""
+
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+
+from models import db, Certificate, IdempotencyKey, OutboxMessage, Revocation
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.String(100), primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+def _columns(conn, table):
+    return {column['name'] for column in inspect(conn).get_columns(table)}
+
+
+def _create_indexes(conn, table):
+    """Crée les index déclarés sur le modèle qui manquent dans la base"""
+    existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing:
+            index.create(conn)
+
+
+def initial_schema(conn):
+    """Tables manquantes, telles que déclarées dans models.py"""
+    db.metadata.create_all(conn)
+
+
+def certificate_ipfs_pinned(conn):
+    """Colonne ajoutée avec le calcul local des CID"""
+    if 'ipfs_pinned' not in _columns(conn, 'certificates'):
+        conn.execute(text("ALTER TABLE certificates ADD COLUMN ipfs_pinned BOOLEAN DEFAULT FALSE"))
+
+
+def certificate_indexes(conn):
+    """Index de /verify, /verify-hash, get_certificates et delete_certificate"""
+    _create_indexes(conn, Certificate.__table__)
+
+
+def revocations(conn):
+    """Table des certificats révoqués"""
+    Revocation.__table__.create(conn, checkfirst=True)
+
+
+def mail_outbox(conn):
+    """File d'envoi des notifications par email"""
+    OutboxMessage.__table__.create(conn, checkfirst=True)
+
+
+def idempotency_keys(conn):
+    """Réponses enregistrées des requêtes avec Idempotency-Key"""
+    IdempotencyKey.__table__.create(conn, checkfirst=True)
+
+
+def revocation_chain_pending(conn):
+    """Révocations ancrées restant à envoyer au contrat ; reprend celles dont l'envoi a échoué"""
+    if 'chain_pending' not in _columns(conn, 'revocations'):
+        conn.execute(text("ALTER TABLE revocations ADD COLUMN chain_pending BOOLEAN DEFAULT FALSE"))
+        conn.execute(text(
+            "UPDATE revocations SET chain_pending = TRUE WHERE source = 'app' AND tx_hash IS NULL "
+            "AND file_hash IN (SELECT file_hash FROM certificates WHERE blockchain_hash IS NOT NULL)"
+        ))
+
+
+MIGRATIONS = [
+    ('0001_initial_schema', initial_schema),
+    ('0002_certificate_ipfs_pinned', certificate_ipfs_pinned),
+    ('0003_certificate_indexes', certificate_indexes),
+    ('0004_revocations', revocations),
+    ('0005_mail_outbox', mail_outbox),
+    ('0006_idempotency_keys', idempotency_keys),
+    ('0007_revocation_chain_pending', revocation_chain_pending),
+]
+
+
+def applied_versions():
+    SchemaMigration.__table__.create(db.engine, checkfirst=True)
+    return {row.version for row in SchemaMigration.query.all()}
+
+
+def pending():
+    applied = applied_versions()
+    return [version for version, _ in MIGRATIONS if version not in applied]
+
+
+def upgrade():
+    """Applique les migrations en attente, chacune dans sa transaction ; renvoie leurs versions"""
+    done = []
+    for version in pending():
+        migrate = dict(MIGRATIONS)[version]
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(version=version, applied_at=datetime.utcnow()))
+        print(f"Migration {version} appliquée")
+        done.append(version)
+    return done
+
+
+def hot_queries():
+    """Requêtes des chemins critiques sur certificates"""
+    return {
+        'verify (file_hash)': Certificate.query.filter_by(file_hash='0' * 64),
+        'verify-hash (blockchain_hash)': Certificate.query.filter_by(blockchain_hash='0x' + '0' * 64),
+        'get_certificates (institution_id)': Certificate.query.filter_by(institution_id=1),
+        'delete_certificate (id, institution_id)': Certificate.query.filter_by(id=1, institution_id=1),
+    }
+
+
+def query_plans():
+    """EXPLAIN QUERY PLAN (SQLite) de chaque requête critique : {nom: [étapes]}"""
+    plans = {}
+    # Connexion neuve : une transaction de la session ouverte avant upgrade() verrait l'ancien schéma
+    with db.engine.connect() as conn:
+        for name, query in hot_queries().items():
+            sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            rows = conn.execute(text('EXPLAIN QUERY PLAN ' + sql)).all()
+            plans[name] = [row[-1] for row in rows]
+    return plans
+
+
+def unindexed_queries():
+    """Requêtes dont le plan parcourt toute la table certificates"""
+    return {
+        name: steps for name, steps in query_plans().items()
+        if any(step.startswith('SCAN') and 'USING' not in step for step in steps)
+    }
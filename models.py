@@ -40,18 +40,19 @@ class Certificate(db.Model):
     __tablename__ = 'certificates'
     
     id = db.Column(db.Integer, primary_key=True)
-    institution_id = db.Column(db.Integer, db.ForeignKey('institutions.id'), nullable=False)
+    institution_id = db.Column(db.Integer, db.ForeignKey('institutions.id'), nullable=False, index=True)
     certificate_type = db.Column(db.String(50), nullable=False)  # diplome, certification, badge
     recipient_name = db.Column(db.String(255), nullable=False)
     recipient_email = db.Column(db.String(255))
     domain = db.Column(db.String(255))
     mention = db.Column(db.String(100))
     data = db.Column(db.JSON)  # Données JSON pour flexibilité
-    file_hash = db.Column(db.String(255))
+    file_hash = db.Column(db.String(255), index=True)
     ipfs_hash = db.Column(db.String(255))
-    blockchain_hash = db.Column(db.String(255))
-    status = db.Column(db.String(50), default='created')  # created, issued, verified
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ipfs_pinned = db.Column(db.Boolean, default=False)  # CID calculé localement confirmé par Pinata
+    blockchain_hash = db.Column(db.String(255), index=True)
+    status = db.Column(db.String(50), default='created', index=True)  # created, issuing, issued, verified, revoked
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relation inversée
@@ -69,7 +70,98 @@ class Certificate(db.Model):
             'created_at': self.created_at.isoformat(),
             'file_hash': self.file_hash,
             'ipfs_hash': self.ipfs_hash,
+            'ipfs_pinned': self.ipfs_pinned,
             'blockchain_hash': self.blockchain_hash,
             'data': self.data
         }
 
+
+
+
+class ChainCertificate(db.Model):
+    """Copie locale des événements CertificateIssued confirmés"""
+    __tablename__ = 'chain_certificates'
+
+    id = db.Column(db.Integer, primary_key=True)
+    certificate_id = db.Column(db.String(66), unique=True, nullable=False, index=True)  # bytes32 en hex 0x...
+    ipfs_hash = db.Column(db.String(255))
+    recipient_name = db.Column(db.String(255))
+    issue_date = db.Column(db.Integer)
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    block_hash = db.Column(db.String(66))
+    tx_hash = db.Column(db.String(66), index=True)
+    log_index = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'certificate_id': self.certificate_id,
+            'ipfs_hash': self.ipfs_hash,
+            'recipient_name': self.recipient_name,
+            'issue_date': self.issue_date,
+            'block_number': self.block_number,
+            'tx_hash': self.tx_hash
+        }
+
+
+class Revocation(db.Model):
+    """Certificats révoqués : par l'application ('app') ou par un événement CertificateRevoked indexé ('chain')"""
+    __tablename__ = 'revocations'
+
+    id = db.Column(db.Integer, primary_key=True)
+    certificate_id = db.Column(db.String(66), unique=True, nullable=False, index=True)  # bytes32 en hex 0x...
+    file_hash = db.Column(db.String(255), index=True)
+    reason = db.Column(db.String(255))
+    source = db.Column(db.String(10), nullable=False, default='app')
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow)
+    tx_hash = db.Column(db.String(66))
+    block_number = db.Column(db.Integer, index=True)
+    chain_pending = db.Column(db.Boolean, default=False)  # certificat ancré, revokeCertificate pas encore miné
+
+
+class IndexerState(db.Model):
+    """Progression de l'indexeur de la blockchain"""
+    __tablename__ = 'indexer_state'
+
+    name = db.Column(db.String(50), primary_key=True)
+    last_block = db.Column(db.Integer, nullable=False)
+    last_block_hash = db.Column(db.String(66))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class OutboxMessage(db.Model):
+    """Emails en attente d'envoi : écrits dans la même transaction que le changement qu'ils annoncent"""
+    __tablename__ = 'mail_outbox'
+    __table_args__ = (db.Index('ix_mail_outbox_due', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    certificate_id = db.Column(db.Integer, db.ForeignKey('certificates.id', ondelete='SET NULL'), index=True)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(64))
+    claimed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+class IdempotencyKey(db.Model):
+    """Clés Idempotency-Key d'une institution : empreinte de la requête et réponse à rejouer"""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (db.UniqueConstraint('institution_id', 'key', name='uq_idempotency_keys_institution_key'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    institution_id = db.Column(db.Integer, db.ForeignKey('institutions.id', ondelete='CASCADE'), nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # sha256 de la méthode, du chemin et du corps
+    status = db.Column(db.String(10), nullable=False, default='processing')  # processing, done
+    owner = db.Column(db.String(32))  # requête qui traite la clé
+    locked_at = db.Column(db.DateTime)
+    response_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
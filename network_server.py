@@ -3,20 +3,106 @@ import threading
 import json
 import time
 from datetime import datetime
+from collections import deque
 from typing import Dict, List, Set
 import uuid
 
+from metrics import Registry, start_http_server
+from node_logging import get_logger
+
+log = get_logger('network')
+
+THROUGHPUT_WINDOW = 30  # seconds covered by the rolling throughput windows
+DEFAULT_NODE_BANDWIDTH = 100 * 1024 * 1024  # bytes/s assumed when a node doesn't report one
+SATURATION_RATIO = 0.9  # a node above this fraction of its bandwidth is considered saturated
+TRANSFER_RETENTION = 60  # seconds a finished transfer stays visible
+TRANSFER_STALL_TIMEOUT = 300  # seconds without progress before a transfer is dropped
+HOT_THRESHOLD = 20  # decayed download count that makes an object hot
+MAX_REPLICAS = 3  # replicas a hot object can be promoted to
+METRICS_PORT = 9100  # HTTP port serving /metrics, None to disable
+LOCK_WAIT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+MESSAGE_TYPES = {  # metric labels; anything else is counted as 'unknown'
+    'register_node', 'heartbeat', 'get_available_nodes', 'register_file',
+    'get_file_locations', 'upload_request', 'upload_fragments_request',
+    'download_request', 'get_user_files', 'delete_file', 'transfer_progress',
+    'get_transfers', 'finish_transfers', 'get_node_stats'
+}
+
+
+class RollingWindow:
+    """Bytes moved over the last `window` seconds, bucketed per second"""
+
+    def __init__(self, window=THROUGHPUT_WINDOW):
+        self.window = window
+        self.buckets = deque()  # (second, bytes)
+        self.total = 0
+
+    def add(self, nbytes, now=None):
+        second = int(now if now is not None else time.time())
+        if self.buckets and self.buckets[-1][0] == second:
+            self.buckets[-1][1] += nbytes
+        else:
+            self.buckets.append([second, nbytes])
+        self.total += nbytes
+        self._expire(second)
+
+    def _expire(self, second):
+        while self.buckets and self.buckets[0][0] <= second - self.window:
+            self.total -= self.buckets.popleft()[1]
+
+    def rate(self, now=None):
+        """Average bytes/s over the window"""
+        self._expire(int(now if now is not None else time.time()))
+        return self.total / self.window
+
+
+class TimedLock:
+    """Lock that records how long callers waited to acquire it"""
+
+    def __init__(self, histogram):
+        self._lock = threading.Lock()
+        self.histogram = histogram
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self.histogram.observe(time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
 class NetworkServer:
-    def __init__(self, host='0.0.0.0', port=9000):
+    def __init__(self, host='0.0.0.0', port=9000, metrics_port=METRICS_PORT):
         self.host = host
         self.port = port
+        self.metrics_port = metrics_port
         self.nodes: Dict[str, dict] = {}  # node_id -> node_info
         self.file_registry: Dict[str, List[str]] = {}  # file_id -> [node_ids]
         self.user_files: Dict[str, List[dict]] = {}  # user_id -> [file_info]
-        self.active_transfers: Dict[str, dict] = {}
-        self.lock = threading.Lock()
+        self.active_transfers: Dict[str, dict] = {}  # transfer_id -> transfer_info
+        self.node_throughput: Dict[str, RollingWindow] = {}  # node_id -> window
+        self.user_throughput: Dict[str, RollingWindow] = {}  # user_id -> window
+        self.file_sizes: Dict[str, int] = {}  # stored object id -> size in bytes
+        self.download_counts: Dict[str, float] = {}  # file_id -> decayed download count
+        self.promotions: Set[str] = set()  # file_ids being replicated
         self.running = False
         
+        self.metrics = Registry()
+        self.messages = self.metrics.counter(
+            'network_messages_total', 'Messages received per type', ['type'])
+        self.message_errors = self.metrics.counter(
+            'network_message_errors_total', 'Handler exceptions and error responses per type', ['type'])
+        self.handler_latency = self.metrics.histogram(
+            'network_handler_duration_seconds', 'Message handler latency per type', ['type'])
+        self.lock_wait = self.metrics.histogram(
+            'network_lock_wait_seconds', 'Time spent waiting for the registry lock', buckets=LOCK_WAIT_BUCKETS)
+        self.node_gauge = self.metrics.gauge('network_nodes', 'Registered nodes per status', ['status'])
+        self.registry_gauge = self.metrics.gauge('network_registry_entries', 'Entries per registry', ['registry'])
+        self.metrics.add_collector(self._collect_metrics)
+        self.lock = TimedLock(self.lock_wait)
+        
     def start(self):
         """Start the network server"""
         self.running = True
@@ -33,6 +119,10 @@ class NetworkServer:
         print(f"║  Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S'):<50} ║")
         print(f"╚{'═'*60}╝\n")
         
+        if self.metrics_port is not None:
+            start_http_server(self.metrics, self.metrics_port)
+            log.info(f"📊 Metrics on http://{self.host}:{self.metrics_port}/metrics")
+        
         # Start health check thread
         threading.Thread(target=self._health_check_loop, daemon=True).start()
         
@@ -47,7 +137,7 @@ class NetworkServer:
                     ).start()
                 except Exception as e:
                     if self.running:
-                        print(f"❌ Error accepting connection: {e}")
+                        log.error(f"❌ Error accepting connection: {e}")
         finally:
             server_socket.close()
     
@@ -62,16 +152,30 @@ class NetworkServer:
                 message = json.loads(data.decode('utf-8'))
                 response = self._process_message(message)
                 
-                client_socket.send(json.dumps(response).encode('utf-8'))
+                client_socket.sendall(json.dumps(response).encode('utf-8'))
         except Exception as e:
-            print(f"⚠️  Connection error from {address}: {e}")
+            log.warning(f"⚠️  Connection error from {address}: {e}")
         finally:
             client_socket.close()
     
     def _process_message(self, message: dict) -> dict:
-        """Process incoming message"""
+        """Process incoming message, counting and timing it per type"""
         msg_type = message.get('type')
-        
+        label = msg_type if msg_type in MESSAGE_TYPES else 'unknown'
+        self.messages.inc(type=label)
+        start = time.perf_counter()
+        try:
+            response = self._dispatch(msg_type, message)
+        except Exception:
+            self.message_errors.inc(type=label)
+            raise
+        finally:
+            self.handler_latency.observe(time.perf_counter() - start, type=label)
+        if response.get('status') == 'error':
+            self.message_errors.inc(type=label)
+        return response
+    
+    def _dispatch(self, msg_type: str, message: dict) -> dict:
         if msg_type == 'register_node':
             return self._register_node(message)
         elif msg_type == 'heartbeat':
@@ -84,12 +188,22 @@ class NetworkServer:
             return self._get_file_locations(message)
         elif msg_type == 'upload_request':
             return self._handle_upload_request(message)
+        elif msg_type == 'upload_fragments_request':
+            return self._handle_fragments_upload_request(message)
         elif msg_type == 'download_request':
             return self._handle_download_request(message)
         elif msg_type == 'get_user_files':
             return self._get_user_files(message)
         elif msg_type == 'delete_file':
             return self._delete_file(message)
+        elif msg_type == 'transfer_progress':
+            return self._handle_transfer_progress(message)
+        elif msg_type == 'finish_transfers':
+            return self._finish_transfers(message)
+        elif msg_type == 'get_transfers':
+            return self._get_transfers(message)
+        elif msg_type == 'get_node_stats':
+            return self._get_node_stats(message)
         else:
             return {'status': 'error', 'message': 'Unknown message type'}
     
@@ -103,15 +217,20 @@ class NetworkServer:
                 'port': message.get('port'),
                 'storage_capacity': message.get('storage_capacity', 0),
                 'used_storage': message.get('used_storage', 0),
+                'bandwidth_capacity': message.get('bandwidth_capacity', DEFAULT_NODE_BANDWIDTH),
                 'last_heartbeat': time.time(),
                 'status': 'online'
             }
             
             self.nodes[node_id] = node_info
+            self.node_throughput.setdefault(node_id, RollingWindow())
             
-            print(f"✅ Node registered: {node_id}")
-            print(f"   └─ IP: {node_info['ip']}:{node_info['port']}")
-            print(f"   └─ Capacity: {node_info['storage_capacity'] / (1024**3):.2f} GB\n")
+            log.info(
+                f"✅ Node registered: {node_id} at {node_info['ip']}:{node_info['port']}, "
+                f"{node_info['storage_capacity'] / (1024**3):.2f} GB",
+                extra={'fields': {'event': 'node_registered', 'node_id': node_id,
+                                  'capacity': node_info['storage_capacity']}}
+            )
             
             return {'status': 'success', 'node_id': node_id, 'node_info': node_info}
     
@@ -147,15 +266,25 @@ class NetworkServer:
             if file_id not in self.file_registry:
                 self.file_registry[file_id] = []
             self.file_registry[file_id].extend(node_ids)
+            self.file_sizes[file_id] = file_info.get('file_size', 0)
+            
+            # Erasure-coded files are located fragment by fragment
+            for fragment in file_info.get('fragments', []):
+                self.file_registry.setdefault(fragment['fragment_id'], []).append(fragment['node_id'])
+                self.file_sizes[fragment['fragment_id']] = file_info['fragment_size']
+                node_ids = node_ids + [fragment['node_id']]
             
             # Update user files
             if user_id not in self.user_files:
                 self.user_files[user_id] = []
             self.user_files[user_id].append(file_info)
             
-            print(f"📄 File registered: {file_info['file_name']}")
-            print(f"   └─ Size: {file_info['file_size'] / (1024**2):.2f} MB")
-            print(f"   └─ Nodes: {', '.join(node_ids)}\n")
+            log.info(
+                f"📄 File registered: {file_info['file_name']} "
+                f"({file_info['file_size'] / (1024**2):.2f} MB) on {', '.join(node_ids)}",
+                extra={'fields': {'event': 'file_registered', 'file_id': file_id,
+                                  'size': file_info['file_size'], 'nodes': node_ids}}
+            )
             
             return {'status': 'success'}
     
@@ -167,31 +296,244 @@ class NetworkServer:
             nodes = [self.nodes[nid] for nid in node_ids if nid in self.nodes and self.nodes[nid]['status'] == 'online']
             return {'status': 'success', 'nodes': nodes}
     
+    def _rank_nodes(self, file_size: int) -> List[dict]:
+        """Online nodes with room for file_size, least loaded first (lock held)"""
+        now = time.time()
+        suitable_nodes = [
+            node for node in self.nodes.values()
+            if node['status'] == 'online' and 
+            (node['storage_capacity'] - node['used_storage']) >= file_size
+        ]
+        
+        # Saturated nodes go last; among the rest, most free space as tie-breaker
+        return sorted(suitable_nodes, key=lambda n: (
+            self._node_load(n, now) >= SATURATION_RATIO,
+            round(self._node_load(n, now), 2),
+            -(n['storage_capacity'] - n['used_storage'])
+        ))
+    
     def _handle_upload_request(self, message: dict) -> dict:
         """Handle upload request - select best node"""
         file_size = message.get('file_size')
         with self.lock:
-            # Find node with enough space
-            suitable_nodes = [
-                node for node in self.nodes.values()
-                if node['status'] == 'online' and 
-                (node['storage_capacity'] - node['used_storage']) >= file_size
-            ]
+            ranked = self._rank_nodes(file_size)
             
-            if not suitable_nodes:
+            if not ranked:
                 return {'status': 'error', 'message': 'No available storage nodes'}
             
-            # Select node with most free space
-            best_node = max(suitable_nodes, key=lambda n: n['storage_capacity'] - n['used_storage'])
+            best_node = ranked[0]
+            transfer = self._start_transfer('upload', best_node['node_id'], message, file_size)
+            
+            log.debug(f"📤 Upload request assigned to: {best_node['node_id']}")
+            
+            return {'status': 'success', 'node': best_node, 'transfer_id': transfer['transfer_id']}
+    
+    def _handle_fragments_upload_request(self, message: dict) -> dict:
+        """Select distinct nodes for the fragments of an erasure-coded file"""
+        fragment_size = message.get('fragment_size')
+        fragment_ids = message.get('fragment_ids', [])
+        with self.lock:
+            ranked = self._rank_nodes(fragment_size)
+            
+            if len(ranked) < len(fragment_ids):
+                return {
+                    'status': 'error',
+                    'message': f'Need {len(fragment_ids)} distinct nodes, {len(ranked)} available'
+                }
+            
+            placements = []
+            for fragment_id, node in zip(fragment_ids, ranked):
+                transfer = self._start_transfer('upload', node['node_id'], {
+                    'user_id': message.get('user_id'),
+                    'file_id': fragment_id
+                }, fragment_size)
+                placements.append({
+                    'fragment_id': fragment_id,
+                    'node': node,
+                    'transfer_id': transfer['transfer_id']
+                })
             
-            print(f"📤 Upload request assigned to: {best_node['node_id']}\n")
+            log.debug(f"📤 {len(placements)} fragments assigned to: {', '.join(p['node']['node_id'] for p in placements)}")
             
-            return {'status': 'success', 'node': best_node}
+            return {'status': 'success', 'placements': placements}
     
     def _handle_download_request(self, message: dict) -> dict:
         """Handle download request"""
         file_id = message.get('file_id')
-        return self._get_file_locations({'file_id': file_id})
+        response = self._get_file_locations({'file_id': file_id})
+        if response['nodes']:
+            with self.lock:
+                now = time.time()
+                # Least loaded replica first so clients spread reads
+                response['nodes'].sort(key=lambda n: self._node_load(n, now))
+                transfer = self._start_transfer('download', response['nodes'][0]['node_id'], message, None)
+                promotion = self._count_download(file_id, response['nodes'])
+            response['transfer_id'] = transfer['transfer_id']
+            if promotion:
+                threading.Thread(target=self._promote_hot_file, args=promotion, daemon=True).start()
+        return response
+    
+    def _count_download(self, file_id: str, holders: List[dict]):
+        """Count a download; returns (file_id, source, target, transfer_id) if the object should get a replica (lock held)"""
+        count = self.download_counts.get(file_id, 0) + 1
+        self.download_counts[file_id] = count
+        
+        replicas = len(self.file_registry.get(file_id, []))
+        if count < HOT_THRESHOLD or replicas >= MAX_REPLICAS or file_id in self.promotions:
+            return None
+        
+        holder_ids = set(self.file_registry.get(file_id, []))
+        size = self.file_sizes.get(file_id, 0)
+        targets = [n for n in self._rank_nodes(size) if n['node_id'] not in holder_ids]
+        if not targets:
+            return None
+        
+        self.promotions.add(file_id)
+        target = targets[0]
+        transfer = self._start_transfer('replicate', target['node_id'], {'file_id': file_id}, size)
+        return file_id, holders[0], target, transfer['transfer_id']
+    
+    def _promote_hot_file(self, file_id: str, source: dict, target: dict, transfer_id: str):
+        """Ask a holder of a hot object to copy it to another node"""
+        response = {}
+        try:
+            sock = socket.create_connection((source['ip'], source['port']), timeout=60)
+            sock.sendall(json.dumps({
+                'type': 'replicate',
+                'file_id': file_id,
+                'target': target,
+                'transfer_id': transfer_id
+            }).encode('utf-8'))
+            response = json.loads(sock.recv(4096).decode('utf-8'))
+            sock.close()
+        except Exception as e:
+            log.warning(f"⚠️  Promotion of {file_id} failed: {e}")
+        
+        with self.lock:
+            self.promotions.discard(file_id)
+            if response.get('status') == 'success' and file_id in self.file_registry:
+                self.file_registry[file_id].append(target['node_id'])
+                log.info(f"🔥 Hot object {file_id} promoted to {target['node_id']}",
+                         extra={'fields': {'event': 'promoted', 'file_id': file_id, 'node_id': target['node_id']}})
+                return
+            transfer = self.active_transfers.get(transfer_id)
+            if transfer and transfer['status'] == 'in_progress':
+                transfer['status'] = 'failed'
+                transfer['finished_at'] = time.time()
+    
+    def _node_load(self, node: dict, now: float) -> float:
+        """Fraction of a node's bandwidth used by recent and in-flight transfers (lock held)"""
+        window = self.node_throughput.get(node['node_id'])
+        rate = window.rate(now) if window else 0
+        in_flight = sum(
+            1 for t in self.active_transfers.values()
+            if t['node_id'] == node['node_id'] and t['status'] == 'in_progress'
+        )
+        capacity = node.get('bandwidth_capacity') or DEFAULT_NODE_BANDWIDTH
+        # Each in-flight transfer counts as a small share even before it reports bytes
+        return rate / capacity + in_flight * 0.05
+    
+    def _start_transfer(self, direction: str, node_id: str, message: dict, file_size) -> dict:
+        """Record a new transfer (lock held)"""
+        transfer_id = str(uuid.uuid4())
+        now = time.time()
+        transfer = {
+            'transfer_id': transfer_id,
+            'direction': direction,
+            'node_id': node_id,
+            'user_id': message.get('user_id'),
+            'file_id': message.get('file_id'),
+            'file_size': file_size,
+            'bytes_transferred': 0,
+            'status': 'in_progress',
+            'started_at': now,
+            'last_update': now,
+            'finished_at': None
+        }
+        self.active_transfers[transfer_id] = transfer
+        return transfer
+    
+    def _handle_transfer_progress(self, message: dict) -> dict:
+        """Apply byte counts reported by a node for its transfers"""
+        node_id = message.get('node_id')
+        now = time.time()
+        with self.lock:
+            node_window = self.node_throughput.setdefault(node_id, RollingWindow())
+            for update in message.get('updates', []):
+                nbytes = update.get('bytes', 0)
+                node_window.add(nbytes, now)
+                
+                transfer = self.active_transfers.get(update.get('transfer_id'))
+                if not transfer:
+                    continue
+                transfer['bytes_transferred'] += nbytes
+                transfer['last_update'] = now
+                if transfer.get('file_size') is None and update.get('file_size') is not None:
+                    transfer['file_size'] = update['file_size']
+                if transfer['user_id']:
+                    self.user_throughput.setdefault(transfer['user_id'], RollingWindow()).add(nbytes, now)
+                if update.get('done'):
+                    transfer['status'] = update.get('status', 'completed')
+                    transfer['finished_at'] = now
+            return {'status': 'success'}
+    
+    def _finish_transfers(self, message: dict) -> dict:
+        """Close transfers the gateway gave up on (the node never reports them done)"""
+        now = time.time()
+        with self.lock:
+            for transfer_id in message.get('transfer_ids', []):
+                transfer = self.active_transfers.get(transfer_id)
+                if transfer and transfer['status'] == 'in_progress':
+                    transfer['status'] = message.get('status', 'failed')
+                    transfer['finished_at'] = now
+            return {'status': 'success'}
+    
+    def _transfer_view(self, transfer: dict, now: float) -> dict:
+        """Transfer info with progress and average rate"""
+        view = dict(transfer)
+        size = transfer.get('file_size')
+        view['progress'] = (transfer['bytes_transferred'] / size) if size else None
+        elapsed = (transfer['finished_at'] or now) - transfer['started_at']
+        view['rate'] = transfer['bytes_transferred'] / elapsed if elapsed > 0 else 0
+        return view
+    
+    def _get_transfers(self, message: dict) -> dict:
+        """Get live transfers, optionally filtered by user or transfer id"""
+        user_id = message.get('user_id')
+        transfer_id = message.get('transfer_id')
+        now = time.time()
+        with self.lock:
+            transfers = [
+                self._transfer_view(t, now) for t in self.active_transfers.values()
+                if (not user_id or t['user_id'] == user_id)
+                and (not transfer_id or t['transfer_id'] == transfer_id)
+            ]
+            user_window = self.user_throughput.get(user_id) if user_id else None
+            return {
+                'status': 'success',
+                'transfers': transfers,
+                'user_throughput': user_window.rate(now) if user_window else 0
+            }
+    
+    def _get_node_stats(self, message: dict) -> dict:
+        """Get per-node throughput and load"""
+        now = time.time()
+        with self.lock:
+            stats = []
+            for node in self.nodes.values():
+                window = self.node_throughput.get(node['node_id'])
+                stats.append({
+                    'node_id': node['node_id'],
+                    'status': node['status'],
+                    'throughput': window.rate(now) if window else 0,
+                    'bandwidth_capacity': node.get('bandwidth_capacity', DEFAULT_NODE_BANDWIDTH),
+                    'load': self._node_load(node, now),
+                    'active_transfers': sum(
+                        1 for t in self.active_transfers.values()
+                        if t['node_id'] == node['node_id'] and t['status'] == 'in_progress'
+                    )
+                })
+            return {'status': 'success', 'nodes': stats, 'window': THROUGHPUT_WINDOW}
     
     def _get_user_files(self, message: dict) -> dict:
         """Get all files for a user"""
@@ -209,18 +551,44 @@ class NetworkServer:
             # Remove from registry
             if file_id in self.file_registry:
                 del self.file_registry[file_id]
+            self.file_sizes.pop(file_id, None)
+            self.download_counts.pop(file_id, None)
             
             # Remove from user files
             if user_id in self.user_files:
+                for f in self.user_files[user_id]:
+                    if f['file_id'] == file_id:
+                        for fragment in f.get('fragments', []):
+                            self.file_registry.pop(fragment['fragment_id'], None)
+                            self.file_sizes.pop(fragment['fragment_id'], None)
+                            self.download_counts.pop(fragment['fragment_id'], None)
                 self.user_files[user_id] = [
                     f for f in self.user_files[user_id] 
                     if f['file_id'] != file_id
                 ]
             
-            print(f"🗑️  File deleted: {file_id}\n")
+            log.info(f"🗑️  File deleted: {file_id}", extra={'fields': {'event': 'file_deleted', 'file_id': file_id}})
             
             return {'status': 'success'}
     
+    def _collect_metrics(self):
+        """Refresh node and registry gauges before a scrape"""
+        with self.lock:
+            statuses = {'online': 0, 'offline': 0}
+            for node in self.nodes.values():
+                statuses[node['status']] = statuses.get(node['status'], 0) + 1
+            sizes = {
+                'files': len(self.file_registry),
+                'users': len(self.user_files),
+                'user_files': sum(len(files) for files in self.user_files.values()),
+                'active_transfers': len(self.active_transfers),
+                'hot_candidates': len(self.download_counts)
+            }
+        for status, count in statuses.items():
+            self.node_gauge.set(count, status=status)
+        for name, size in sizes.items():
+            self.registry_gauge.set(size, registry=name)
+    
     def _health_check_loop(self):
         """Periodically check node health"""
         while self.running:
@@ -232,7 +600,22 @@ class NetworkServer:
                     if current_time - node_info['last_heartbeat'] > 30:
                         if node_info['status'] == 'online':
                             node_info['status'] = 'offline'
-                            print(f"⚠️  Node offline: {node_id}\n")
+                            log.warning(f"⚠️  Node offline: {node_id}",
+                                        extra={'fields': {'event': 'node_offline', 'node_id': node_id}})
+                
+                # Halve download counts so popularity fades
+                for file_id in list(self.download_counts):
+                    self.download_counts[file_id] /= 2
+                    if self.download_counts[file_id] < 1:
+                        del self.download_counts[file_id]
+                
+                # Drop finished transfers after a while, and stalled ones
+                for transfer_id, transfer in list(self.active_transfers.items()):
+                    if transfer['status'] != 'in_progress':
+                        if current_time - transfer['finished_at'] > TRANSFER_RETENTION:
+                            del self.active_transfers[transfer_id]
+                    elif current_time - transfer['last_update'] > TRANSFER_STALL_TIMEOUT:
+                        del self.active_transfers[transfer_id]
 
 if __name__ == '__main__':
     server = NetworkServer(host='0.0.0.0', port=9000)
@@ -0,0 +1,66 @@
+"""
+Leveled, optionally JSON, logging for the network server and storage nodes.
+
+    LOG_LEVEL=WARNING   silences the per-file INFO lines in production
+    LOG_FORMAT=json     one JSON object per line, with the event's fields
+
+Structured fields are passed as extra={'fields': {...}}.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+_configured = False
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+def configure(level=None, fmt=None):
+    """Install the handler on the 'certichain' logger (once per process)"""
+    global _configured
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = (fmt or os.getenv('LOG_FORMAT', 'text')).lower()
+
+    root = logging.getLogger('certichain')
+    root.setLevel(level)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    handler = logging.StreamHandler(sys.stdout)
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter('%(asctime)s %(levelname)-7s %(message)s', '%H:%M:%S'))
+    root.addHandler(handler)
+    _configured = True
+
+
+def get_logger(name):
+    if not _configured:
+        configure()
+    return logging.getLogger(f'certichain.{name}')
@@ -2,12 +2,55 @@
 Module pour générer des certificats PDF avec champs remplis à partir des données fournies.
 """
 
+from reportlab import rl_config
 from reportlab.lib.pagesizes import landscape, A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from io import BytesIO
 from datetime import datetime
 
+# Rendu déterministe (dates et identifiant du document figés) et flux de page
+# compressés : un même payload donne les mêmes octets, donc le même file_hash
+# et le même CID. Seules les polices standard (non embarquées) sont utilisées.
+PDF_OPTIONS = {'invariant': 1, 'pageCompression': 1}
+
+# Flux compressés en binaire plutôt qu'en ASCII85 (+25 % de taille)
+rl_config.useA85 = 0
+
+
+# Ligne du hash blockchain : (x, y, taille Courier, couleur du fond, préfixe).
+# Partagée par le rendu et par stamp_blockchain_hash, qui l'écrit après
+# l'ancrage par une mise à jour incrémentale au lieu d'un second rendu.
+HASH_SLOTS = {
+    'diplome': (landscape(A4)[0] - 7*cm, 0.8*cm, 7, (0.98, 0.98, 0.98), 'Hash: '),
+    'certification': (1.5*cm, 0.4*cm, 7, (0.98, 0.98, 0.98), 'Hash: '),
+    'badge': (1.8*cm, A4[1] - 12.2*cm, 8, (0.95, 0.95, 0.98), ''),
+}
+HASH_COLOR = (0.4, 0.49, 0.92)
+PENDING_HASH = 'En cours...'
+
+
+def _new_canvas(buffer, pagesize):
+    return canvas.Canvas(buffer, pagesize=pagesize, **PDF_OPTIONS)
+
+
+def _draw_hash(c, template, blockchain_hash):
+    x, y, _, _, prefix = HASH_SLOTS[template]
+    c.drawString(x, y, f"{prefix}{blockchain_hash}")
+
+
+def stamp_blockchain_hash(pdf_bytes, template, tx_hash):
+    """Section incrémentale à ajouter au PDF rendu avec PENDING_HASH pour y écrire le hash de transaction"""
+    from pdf_incremental import stamp_text
+
+    x, y, size, background, prefix = HASH_SLOTS[template]
+    return stamp_text(
+        pdf_bytes, f"{prefix}{tx_hash[:20]}...", x, y, font='Courier', size=size,
+        color=HASH_COLOR, background=background,
+        clear_width=stringWidth(f"{prefix}{PENDING_HASH}", 'Courier', size)
+    )
+
 
 def create_diploma_pdf(data=None):
     """Crée un modèle de diplôme PDF avec champs remplis.
@@ -28,7 +71,7 @@ def create_diploma_pdf(data=None):
     blockchain_hash = data.get('blockchain_hash', '0x...')
 
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=landscape(A4))
+    c = _new_canvas(buffer, landscape(A4))
     width, height = landscape(A4)
 
     # Background
@@ -121,7 +164,7 @@ def create_diploma_pdf(data=None):
     # Blockchain hash
     c.setFont("Courier", 7)
     c.setFillColorRGB(0.4, 0.49, 0.92)
-    c.drawString(width - 7*cm, 0.8*cm, f"Hash: {blockchain_hash}")
+    _draw_hash(c, 'diplome', blockchain_hash)
 
     c.save()
     buffer.seek(0)
@@ -141,7 +184,7 @@ def create_certification_pdf(data=None):
     blockchain_hash = data.get('blockchain_hash', '0x...')
 
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    c = _new_canvas(buffer, A4)
     width, height = A4
 
     # Background and top bar
@@ -225,7 +268,7 @@ def create_certification_pdf(data=None):
     c.setFont("Courier", 7)
     c.setFillColorRGB(0.4, 0.49, 0.92)
     c.drawString(1.5*cm, 0.7*cm, cert_number)
-    c.drawString(1.5*cm, 0.4*cm, f"Hash: {blockchain_hash}")
+    _draw_hash(c, 'certification', blockchain_hash)
 
     c.save()
     buffer.seek(0)
@@ -246,7 +289,7 @@ def create_badge_pdf(data=None):
     blockchain_hash = data.get('blockchain_hash', '0x...')
 
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+    c = _new_canvas(buffer, A4)
     width, height = A4
 
     # Background
@@ -299,7 +342,7 @@ def create_badge_pdf(data=None):
     c.drawString(1.8*cm, y_pos - 0.3*cm, "🔐 Vérifiable sur Blockchain")
     c.setFont("Courier", 8)
     c.setFillColorRGB(0.4, 0.49, 0.92)
-    c.drawString(1.8*cm, y_pos - 0.7*cm, blockchain_hash)
+    _draw_hash(c, 'badge', blockchain_hash)
 
     c.save()
     buffer.seek(0)
@@ -0,0 +1,152 @@
+"""
+Mises à jour incrémentales de PDF : une ligne de texte est ajoutée à la
+première page par une section écrite à la fin du fichier (nouveaux objets,
+table xref, trailer /Prev), sans toucher aux octets existants.
+
+Le PDF d'origine, dont le file_hash est ancré sur la blockchain, reste donc
+un préfixe exact du fichier tamponné. revisions() retrouve ces préfixes.
+"""
+
+import hashlib
+import re
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+_EOF = re.compile(rb'%%EOF[ \t]*(?:\r\n|\r|\n)?')
+
+
+def _escape(text):
+    data = text.encode('latin-1', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _startxref(pdf):
+    return int(re.findall(rb'startxref\s+(\d+)', pdf[-1024:])[-1])
+
+
+def _read_xref(pdf):
+    """Offsets des objets (la section la plus récente l'emporte) et dernier trailer"""
+    pos = _startxref(pdf)
+    offsets = {}
+    trailer = None
+    while pos is not None:
+        end = pdf.index(b'trailer', pos)
+        lines = pdf[pos:end].split(b'\n')[1:]  # saute 'xref'
+        i = 0
+        while i < len(lines):
+            fields = lines[i].split()
+            i += 1
+            if len(fields) != 2:
+                continue
+            first, count = int(fields[0]), int(fields[1])
+            for number in range(first, first + count):
+                offset, _, kind = lines[i].split()[:3]
+                i += 1
+                if kind == b'n':
+                    offsets.setdefault(number, int(offset))
+        section = pdf[end:pdf.index(b'startxref', end)]
+        trailer = trailer or section
+        prev = re.search(rb'/Prev\s+(\d+)', section)
+        pos = int(prev.group(1)) if prev else None
+    return offsets, trailer
+
+
+def _object_body(pdf, offsets, number):
+    start = pdf.index(b'obj', offsets[number]) + 3
+    return pdf[start:pdf.index(b'endobj', start)].strip()
+
+
+def _ref(body, key):
+    match = re.search(rb'/' + key + rb'\s+(\d+)\s+0\s+R', body)
+    return int(match.group(1)) if match else None
+
+
+def _first_page(pdf, offsets, trailer):
+    node = _ref(_object_body(pdf, offsets, _ref(trailer, b'Root')), b'Pages')
+    while True:
+        body = _object_body(pdf, offsets, node)
+        if not re.search(rb'/Type\s*/Pages\b', body):
+            return node, body
+        node = int(re.search(rb'/Kids\s*\[\s*(\d+)\s+0\s+R', body).group(1))
+
+
+def stamp_text(pdf, text, x, y, font='Courier', size=7, color=(0, 0, 0),
+               background=None, clear_width=0):
+    """
+    Section à ajouter à la fin de `pdf` pour écrire `text` en (x, y) sur la
+    première page. Avec `background`, un rectangle de cette couleur efface
+    d'abord clear_width points (le texte provisoire du modèle).
+    """
+    offsets, trailer = _read_xref(pdf)
+    size_entry = int(re.search(rb'/Size\s+(\d+)', trailer).group(1))
+    page_number, page = _first_page(pdf, offsets, trailer)
+
+    font_number, content_number = size_entry, size_entry + 1
+    font_name = f'FStamp{font_number}'.encode()
+    objects = {}
+
+    # Police du tampon : ajoutée au dictionnaire /Font de la page (indirect ou en ligne)
+    font_ref = _ref(page, b'Font')
+    entry = b'/' + font_name + b' %d 0 R' % font_number
+    if font_ref is not None:
+        fonts = _object_body(pdf, offsets, font_ref)
+        objects[font_ref] = fonts[:fonts.rindex(b'>>')] + entry + b'\n>>'
+    else:
+        page = re.sub(rb'/Font\s*<<', lambda m: b'/Font << ' + entry, page, count=1)
+
+    contents = re.search(rb'/Contents\s*(\[[^\]]*\]|\d+\s+0\s+R)', page)
+    previous = contents.group(1).strip(b'[] ')
+    page = (page[:contents.start()]
+            + b'/Contents [ ' + previous + b' %d 0 R ]' % content_number
+            + page[contents.end():])
+    objects[page_number] = page
+
+    ops = [b'q']
+    width = max(clear_width, stringWidth(text, font, size))
+    if background:
+        ops.append(b'%.3f %.3f %.3f rg' % tuple(background))
+        ops.append(b'%.2f %.2f %.2f %.2f re f' % (x - 1, y - size * 0.3, width + 2, size * 1.3))
+    ops.append(b'%.3f %.3f %.3f rg' % tuple(color))
+    ops.append(b'BT /%s %g Tf %.2f %.2f Td (%s) Tj ET' % (font_name, size, x, y, _escape(text)))
+    ops.append(b'Q')
+    stream = b'\n'.join(ops)
+
+    objects[font_number] = (b'<< /BaseFont /' + font.encode() +
+                            b' /Encoding /WinAnsiEncoding /Subtype /Type1 /Type /Font >>')
+    objects[content_number] = b'<< /Length %d >>\nstream\n%s\nendstream' % (len(stream), stream)
+
+    out = bytearray(b'' if pdf.endswith((b'\n', b'\r')) else b'\n')
+    written = {}
+    for number in sorted(objects):
+        written[number] = len(pdf) + len(out)
+        out += b'%d 0 obj\n%s\nendobj\n' % (number, objects[number])
+
+    xref_offset = len(pdf) + len(out)
+    out += b'xref\n0 1\n0000000000 65535 f \n'
+    for number in sorted(written):
+        out += b'%d 1\n%010d 00000 n \n' % (number, written[number])
+
+    out += b'trailer\n<<\n/Size %d\n' % (content_number + 1)
+    for key in (rb'/Root\s+\d+\s+0\s+R', rb'/Info\s+\d+\s+0\s+R', rb'/ID\s*\[[^\]]*\]'):
+        match = re.search(key, trailer)
+        if match:
+            out += match.group(0) + b'\n'
+    out += b'/Prev %d\n>>\nstartxref\n%d\n%%%%EOF\n' % (_startxref(pdf), xref_offset)
+    return bytes(out)
+
+
+def revisions(pdf, limit=8):
+    """Longueur et SHA-256 de chaque révision (préfixe terminé par %%EOF), de la plus ancienne à la complète"""
+    result = []
+    digest = hashlib.sha256()
+    done = 0
+    for match in _EOF.finditer(pdf):
+        digest.update(pdf[done:match.end()])
+        done = match.end()
+        result.append((done, digest.copy().hexdigest()))
+        if len(result) >= limit:
+            break
+    if done < len(pdf) and len(result) < limit:
+        digest.update(pdf[done:])
+        result.append((len(pdf), digest.hexdigest()))
+    return result
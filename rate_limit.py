@@ -0,0 +1,268 @@
+"""
+Limitation de débit et contrôle d'admission des vérifications publiques.
+
+Chaque requête est rangée dans une voie :
+
+    institution  session d'une institution connectée (prioritaire)
+    api_key      en-tête X-API-Key parmi VERIFY_API_KEYS (prioritaire)
+    anonymous    tout le reste, par adresse IP, plus un seau commun à tous
+                 les anonymes qui protège le quota RPC contre un scraper
+                 réparti sur plusieurs adresses
+
+Les seaux de jetons sont gardés en mémoire du processus ou dans un fichier
+SQLite partagé par les workers de la machine (même URL que CACHE_URL). Un
+nombre borné de vérifications s'exécute à la fois par processus, et les
+anonymes n'ont pas accès aux `reserved` dernières places : une institution
+passe même quand les anonymes saturent le serveur.
+
+Tout est décidé dans before_request, avant la lecture du fichier envoyé ;
+les requêtes refusées reçoivent 411, 413, 401, 429 ou 503 avec Retry-After.
+Un envoi sans Content-Length (chunked) est refusé (411) : sa taille ne peut
+pas être vérifiée avant lecture. Le seau de l'adresse et le seau commun ne
+sont débités que si les deux ont un jeton.
+
+Si le stockage des seaux est indisponible (fichier SQLite verrouillé au-delà
+du délai, disque plein), la requête est admise sans limite de débit (fail
+open) et l'erreur comptée : la vérification reste un service public, et le
+nombre de vérifications simultanées par processus reste borné.
+"""
+
+import hashlib
+import hmac
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, jsonify, request, session
+
+import metrics
+from shared_cache import SQLiteFile
+
+IDLE_BUCKET = 3600  # secondes sans requête avant de supprimer un seau (il serait plein)
+PURGE_EVERY = 1000  # prises de jetons entre deux purges (SQLite)
+
+SHED = metrics.REGISTRY.counter(
+    'certichain_verify_shed_total',
+    'Vérifications publiques refusées, par route et motif '
+    '(ip, api_key, institution, global, busy, too_large, length_required, invalid_key)',
+    ['endpoint', 'reason'])
+ADMITTED = metrics.REGISTRY.counter(
+    'certichain_verify_admitted_total', 'Vérifications publiques admises, par route et voie', ['endpoint', 'lane'])
+STORE_ERRORS = metrics.REGISTRY.counter(
+    'certichain_verify_limiter_errors_total',
+    'Erreurs du stockage des seaux de jetons (requêtes admises sans limite de débit)')
+INFLIGHT = metrics.REGISTRY.gauge(
+    'certichain_verify_inflight', 'Vérifications publiques en cours dans ce processus, par voie', ['lane'])
+
+
+class MemoryBuckets:
+    """Seaux de jetons du processus, bornés en nombre (LRU)"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self.buckets = OrderedDict()  # clé -> (jetons, instant)
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        """Consomme `cost` jetons si possible ; renvoie (accepté, secondes avant d'avoir assez de jetons)"""
+        return self.take_all([(key, rate, burst)], cost)[0]
+
+    def take_all(self, buckets, cost=1):
+        """
+        Consomme `cost` jetons dans chacun des seaux [(clé, débit, capacité)]
+        s'ils en ont tous assez, sinon dans aucun ; renvoie (assez de jetons,
+        secondes d'attente) pour chaque seau
+        """
+        now = time.time()
+        with self.lock:
+            levels = []
+            for key, rate, burst in buckets:
+                tokens, updated = self.buckets.get(key, (burst, now))
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            allowed = all(tokens >= cost for tokens in levels)
+            for (key, _, _), tokens in zip(buckets, levels):
+                self.buckets[key] = (tokens - cost if allowed else tokens, now)
+                self.buckets.move_to_end(key)
+            while len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return _results(buckets, levels, cost)
+
+
+def _results(buckets, levels, cost):
+    return [(tokens >= cost, max(0.0, (cost - tokens) / rate)) for (_, rate, _), tokens in zip(buckets, levels)]
+
+
+class SQLiteBuckets(SQLiteFile):
+    """Seaux de jetons dans un fichier SQLite, partagés par les processus qui l'ouvrent"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._takes = 0
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS rate_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+        )
+
+    def take(self, key, rate, burst, cost=1):
+        return self.take_all([(key, rate, burst)], cost)[0]
+
+    def take_all(self, buckets, cost=1):
+        conn = self._connect()
+        # BEGIN IMMEDIATE : lecture et écriture sous le même verrou, entre processus
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            levels = []
+            for key, rate, burst in buckets:
+                row = conn.execute('SELECT tokens, updated FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+                tokens, updated = row or (burst, now)
+                levels.append(min(burst, tokens + (now - updated) * rate))
+            allowed = all(tokens >= cost for tokens in levels)
+            conn.executemany('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                             [(key, tokens - cost if allowed else tokens, now)
+                              for (key, _, _), tokens in zip(buckets, levels)])
+            self._takes += 1
+            if self._takes % PURGE_EVERY == 0:
+                conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - IDLE_BUCKET,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return _results(buckets, levels, cost)
+
+
+def make_buckets(url):
+    """'' ou 'memory' : seaux du processus ; 'sqlite:///chemin' : seaux partagés"""
+    if not url or url == 'memory':
+        return MemoryBuckets()
+    if url.startswith('sqlite:///'):
+        return SQLiteBuckets(url[len('sqlite:///'):])
+    raise ValueError(f"URL des seaux de jetons non supportée : {url}")
+
+
+class VerifyLimiter:
+    def __init__(self, buckets, ip_rate, key_rate, institution_rate, global_rate=0, burst_seconds=10,
+                 api_keys=(), max_inflight=0, reserved=0, max_upload=0, trusted_proxies=0):
+        self.buckets = buckets
+        self.rates = {'anonymous': ip_rate, 'api_key': key_rate, 'institution': institution_rate}
+        self.global_rate = global_rate
+        self.burst_seconds = burst_seconds
+        self.api_keys = [key.encode() for key in api_keys if key]
+        self.max_inflight = max_inflight
+        self.reserved = min(reserved, max_inflight)
+        self.max_upload = max_upload
+        self.trusted_proxies = trusted_proxies
+        self.inflight = 0
+        self.lock = threading.Lock()
+
+    def client_ip(self, req):
+        """Adresse du client ; derrière `trusted_proxies` proxys, celle qu'a vue le plus éloigné"""
+        if self.trusted_proxies:
+            forwarded = [part.strip() for part in req.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+            if forwarded:
+                return forwarded[-min(self.trusted_proxies, len(forwarded))]
+        return req.remote_addr or 'unknown'
+
+    def _valid_key(self, key):
+        key = key.encode()
+        return any(hmac.compare_digest(key, known) for known in self.api_keys)
+
+    def lane(self, req, sess):
+        """(voie, clé du seau) ; voie None pour une clé d'API inconnue"""
+        if sess.get('institution_id'):
+            return 'institution', f"institution:{sess['institution_id']}"
+        api_key = req.headers.get('X-API-Key')
+        if api_key:
+            if not self._valid_key(api_key):
+                return None, None
+            return 'api_key', f"api_key:{hashlib.sha256(api_key.encode()).hexdigest()[:16]}"
+        return 'anonymous', f"ip:{self.client_ip(req)}"
+
+    def _take(self, limits):
+        """
+        Débite les seaux [(clé, débit)] de débit non nul, tous ou aucun ;
+        renvoie (None, 0) ou (rang du premier seau vide, secondes d'attente)
+        """
+        active = [(i, key, rate) for i, (key, rate) in enumerate(limits) if rate > 0]
+        if not active:
+            return None, 0.0
+        results = self.buckets.take_all([(key, rate, max(1.0, rate * self.burst_seconds)) for _, key, rate in active])
+        for (i, _, _), (allowed, wait) in zip(active, results):
+            if not allowed:
+                return i, wait
+        return None, 0.0
+
+    def _acquire_slot(self, lane):
+        if not self.max_inflight:
+            return True
+        limit = self.max_inflight - (self.reserved if lane == 'anonymous' else 0)
+        with self.lock:
+            if self.inflight >= limit:
+                return False
+            self.inflight += 1
+        return True
+
+    def release(self):
+        lane = g.pop('verify_lane', None)
+        if lane is None:
+            return
+        if self.max_inflight:
+            with self.lock:
+                self.inflight -= 1
+        INFLIGHT.inc(-1, lane=lane)
+
+    def _shed(self, endpoint, reason, code, message, retry_after=None):
+        SHED.inc(endpoint=endpoint, reason=reason)
+        response = jsonify({"verified": False, "error": message})
+        response.status_code = code
+        if retry_after is not None:
+            response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response
+
+    def admit(self, endpoint):
+        """None si la requête peut continuer, sinon la réponse de refus"""
+        if self.max_upload and request.method == 'POST' and request.content_length is None:
+            return self._shed(endpoint, 'length_required', 411, "En-tête Content-Length requis")
+        if self.max_upload and (request.content_length or 0) > self.max_upload:
+            return self._shed(endpoint, 'too_large', 413,
+                              f"Fichier trop volumineux (maximum {self.max_upload // (1024 * 1024)} Mo)")
+
+        lane, key = self.lane(request, session)
+        if lane is None:
+            return self._shed(endpoint, 'invalid_key', 401, "Clé d'API inconnue")
+
+        limits = [(key, self.rates[lane])]
+        if lane == 'anonymous':
+            limits.append(('anonymous', self.global_rate))
+        try:
+            refused, wait = self._take(limits)
+        except Exception as e:
+            STORE_ERRORS.inc()
+            print(f"⚠️  Seaux de jetons indisponibles, vérification admise sans limite de débit: {e}")
+            refused = None
+        if refused == 0:
+            reason = 'ip' if lane == 'anonymous' else lane
+            return self._shed(endpoint, reason, 429, "Trop de vérifications, réessayez plus tard", wait)
+        if refused == 1:
+            return self._shed(endpoint, 'global', 429, "Service de vérification saturé, réessayez plus tard", wait)
+
+        if not self._acquire_slot(lane):
+            return self._shed(endpoint, 'busy', 503, "Service de vérification saturé, réessayez plus tard", 1)
+        g.verify_lane = lane
+        INFLIGHT.inc(lane=lane)
+        ADMITTED.inc(endpoint=endpoint, lane=lane)
+        return None
+
+    def init_app(self, app, endpoints):
+        """Applique la limite aux routes `endpoints` ({nom de la route: méthodes limitées})"""
+        @app.before_request
+        def limit_public_verification():
+            methods = endpoints.get(request.endpoint)
+            if methods and request.method in methods:
+                return self.admit(request.endpoint)
+            return None
+
+        @app.teardown_request
+        def release_verification_slot(error=None):
+            self.release()
@@ -0,0 +1,135 @@
+"""
+Memory-bounded object cache with W-TinyLFU admission for StorageNode reads.
+
+New objects land in a small LRU window. When the window overflows, its oldest
+object only enters the main LRU if it has been requested more often than the
+main LRU's eviction victim, as estimated by a count-min sketch. One-off reads
+(crawlers, bulk exports) therefore can't flush the popular certificates out.
+"""
+
+import threading
+from collections import OrderedDict
+
+WINDOW_RATIO = 0.01  # share of the byte budget given to the admission window
+
+
+class CountMinSketch:
+    """Approximate access counts, halved periodically so old popularity fades"""
+
+    def __init__(self, width=1 << 16, depth=4, sample_size=None):
+        self.width = width
+        self.shift = 64 - (width.bit_length() - 1)  # width must be a power of two
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+        self.sample_size = sample_size or width * 10
+        self.additions = 0
+
+    def _slots(self, key):
+        h = hash(key) & 0xFFFFFFFFFFFFFFFF
+        for i in range(self.depth):
+            # Multiplicative hashing with a different odd constant per row
+            yield i, ((h * (0x9E3779B97F4A7C15 + 2 * i)) & 0xFFFFFFFFFFFFFFFF) >> self.shift
+
+    def add(self, key):
+        for i, slot in self._slots(key):
+            if self.rows[i][slot] < 15:
+                self.rows[i][slot] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key):
+        return min(self.rows[i][slot] for i, slot in self._slots(key))
+
+    def _reset(self):
+        for row in self.rows:
+            for j in range(self.width):
+                row[j] >>= 1
+        self.additions //= 2
+
+
+class TinyLFUCache:
+    """Byte-bounded cache: LRU window + frequency-gated main LRU"""
+
+    def __init__(self, max_bytes, max_object_size=None):
+        self.max_bytes = max_bytes
+        self.max_object_size = max_object_size or max(1, max_bytes // 8)
+        self.window_bytes = max(1, int(max_bytes * WINDOW_RATIO))
+        self.window = OrderedDict()  # key -> bytes
+        self.main = OrderedDict()  # key -> bytes
+        self.window_used = 0
+        self.main_used = 0
+        self.sketch = CountMinSketch()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Cached bytes or None; every call counts as an access"""
+        with self.lock:
+            self.sketch.add(key)
+            for segment in (self.main, self.window):
+                value = segment.get(key)
+                if value is not None:
+                    segment.move_to_end(key)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        """Offer an object to the cache; admission is decided on window eviction"""
+        if len(value) > self.max_object_size:
+            return
+        with self.lock:
+            self._remove(key)
+            self.window[key] = value
+            self.window_used += len(value)
+            while self.window_used > self.window_bytes and self.window:
+                candidate, data = self.window.popitem(last=False)
+                self.window_used -= len(data)
+                self._admit(candidate, data)
+
+    def _admit(self, key, value):
+        """Move a window evictee into main if it beats the victims it would displace (lock held)"""
+        limit = self.max_bytes - self.window_bytes
+        if len(value) > limit:
+            return
+        victims = []
+        freed = 0
+        candidate_freq = self.sketch.estimate(key)
+        for victim in self.main:
+            if self.main_used - freed + len(value) <= limit:
+                break
+            if self.sketch.estimate(victim) >= candidate_freq:
+                return  # not popular enough, drop the candidate
+            victims.append(victim)
+            freed += len(self.main[victim])
+        if self.main_used - freed + len(value) > limit:
+            return
+        for victim in victims:
+            self.main_used -= len(self.main.pop(victim))
+        self.main[key] = value
+        self.main_used += len(value)
+
+    def _remove(self, key):
+        if key in self.window:
+            self.window_used -= len(self.window.pop(key))
+        if key in self.main:
+            self.main_used -= len(self.main.pop(key))
+
+    def invalidate(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self.window) + len(self.main),
+                'bytes': self.window_used + self.main_used,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0
+            }
@@ -0,0 +1,156 @@
+"""
+Certificats révoqués, en mémoire : un filtre de Bloom écarte sans accès à
+la base ni au RPC les identifiants qui ne sont pas révoqués (le cas courant),
+et un ensemble exact élimine ses faux positifs.
+
+Les deux structures sont reconstruites depuis la table revocations au
+premier usage, complétées à chaque révocation faite par ce processus, et
+rattrapent toutes les REFRESH_INTERVAL secondes celles des autres workers
+et de l'indexeur (nouvelles lignes ; reconstruction si des lignes ont été
+supprimées : après un retour en arrière de l'indexeur, ou quand le nombre de
+lignes ou le plus grand id ne correspond plus à ce qui a été chargé).
+"""
+
+import hashlib
+import math
+import threading
+import time
+
+from sqlalchemy import func
+
+from chain_indexer import REWINDS_STATE
+from models import db, IndexerState, Revocation
+
+CAPACITY = 100000
+ERROR_RATE = 0.001
+REFRESH_INTERVAL = 5  # secondes
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # Double hachage (Kirsch-Mitzenmacher) à partir d'un seul digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RevocationRegistry:
+    def __init__(self, app, capacity=CAPACITY, error_rate=ERROR_RATE, refresh_interval=REFRESH_INTERVAL):
+        self.app = app
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.refreshing = threading.Lock()
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.exact = set()
+        self.last_id = 0
+        self.rows = 0  # lignes de la table déjà chargées
+        self.rewinds = 0  # retours en arrière de l'indexeur au dernier chargement
+        self.checked_at = None
+
+    def _rebuild(self, ids):
+        """Remplace filtre et ensemble ; la capacité double quand elle est dépassée"""
+        capacity = self.capacity
+        while capacity < len(ids):
+            capacity *= 2
+        bloom = BloomFilter(capacity, self.error_rate)
+        for cert_id in ids:
+            bloom.add(cert_id)
+        self.capacity = capacity
+        self.bloom, self.exact = bloom, set(ids)
+
+    @staticmethod
+    def _rewinds():
+        state = db.session.get(IndexerState, REWINDS_STATE)
+        return state.last_block if state else 0
+
+    def load(self):
+        """Reconstruit depuis la table revocations"""
+        with self.app.app_context():
+            rewinds = self._rewinds()  # lu d'abord : un retour en arrière pendant la lecture relancera load()
+            rows = db.session.query(Revocation.id, Revocation.certificate_id).all()
+        with self.lock:
+            self._rebuild([cert_id.lower() for _, cert_id in rows])
+            self.last_id = max((row_id for row_id, _ in rows), default=0)
+            self.rows = len(rows)
+            self.rewinds = rewinds
+        self.checked_at = time.monotonic()
+
+    def refresh(self):
+        """Ajoute les révocations enregistrées ailleurs depuis le dernier passage"""
+        with self.app.app_context():
+            rewinds = self._rewinds()
+            count, max_id = db.session.query(func.count(Revocation.id), func.max(Revocation.id)).one()
+            rows = db.session.query(Revocation.id, Revocation.certificate_id) \
+                .filter(Revocation.id > self.last_id).all()
+        # Lignes supprimées : compte ou plus grand id différent de ce qui est chargé, ou
+        # retour en arrière de l'indexeur, seul signe quand des insertions ont repris les
+        # id libérés (SQLite sans AUTOINCREMENT) et rétabli compte et plus grand id
+        expected_max = max([self.last_id] + [row_id for row_id, _ in rows])
+        if rewinds != self.rewinds or self.rows + len(rows) != count or (max_id or 0) != expected_max:
+            self.load()
+            return
+        for row_id, cert_id in rows:
+            self.add(cert_id)
+        with self.lock:
+            self.last_id = max([self.last_id] + [row_id for row_id, _ in rows])
+            self.rows = count
+        self.checked_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.refresh_interval:
+            return
+        # Un seul thread rafraîchit ; les autres lisent l'état courant
+        if not self.refreshing.acquire(blocking=self.checked_at is None):
+            return
+        try:
+            if self.checked_at is None:
+                self.load()
+            elif time.monotonic() - self.checked_at >= self.refresh_interval:
+                self.refresh()
+        finally:
+            self.refreshing.release()
+
+    def add(self, cert_id):
+        cert_id = cert_id.lower()
+        with self.lock:
+            if cert_id in self.exact:
+                return
+            self.exact.add(cert_id)
+            if len(self.exact) > self.capacity:
+                self._rebuild(list(self.exact))
+            else:
+                self.bloom.add(cert_id)
+
+    def is_revoked(self, cert_id):
+        """cert_id : identifiant bytes32 en hex (0x...)"""
+        self._maybe_refresh()
+        cert_id = cert_id.lower()
+        bloom, exact = self.bloom, self.exact
+        if cert_id not in bloom:
+            return False
+        return cert_id in exact
+
+    def stats(self):
+        return {
+            'revoked': len(self.exact),
+            'capacity': self.capacity,
+            'bloom_bytes': len(self.bloom.bits),
+            'bloom_hashes': self.bloom.hashes
+        }
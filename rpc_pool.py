@@ -0,0 +1,328 @@
+"""
+Pool de fournisseurs JSON-RPC pour Web3 : plusieurs URLs (Infura, Alchemy,
+nœud local...), chacune sondée avec eth_blockNumber. Chaque requête part
+vers le nœud sain le plus rapide (moyenne mobile de la latence) et bascule
+sur le suivant en cas d'erreur réseau, de code HTTP 429/5xx ou de limite de
+débit ; un nœud en échec est écarté pendant un délai qui double à chaque
+échec, un nœud en retard de plus de MAX_LAG blocs aussi.
+
+Les résultats d'eth_call lus à un bloc finalisé (numéro de bloc au plus
+tête - FINALITY_DEPTH, ou le tag 'finalized') ne peuvent plus changer : ils
+sont gardés dans un cache LRU, comme eth_chainId et net_version.
+
+Les sondes se relancent toutes les HEALTH_INTERVAL secondes dans un thread
+déclenché par les requêtes, sans thread permanent (compatible avec le fork
+des workers gunicorn).
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from eth_hash.auto import keccak
+from web3.providers.base import JSONBaseProvider
+
+import metrics
+
+TIMEOUT = 10  # secondes
+HEALTH_INTERVAL = 15  # secondes
+FINALITY_DEPTH = 64  # blocs
+MAX_LAG = 5  # blocs de retard tolérés sur la meilleure tête
+COOLDOWN = 5  # secondes, doublé à chaque échec consécutif
+MAX_COOLDOWN = 120
+CACHE_SIZE = 4096
+EWMA_WEIGHT = 0.3
+
+# Erreurs JSON-RPC qui viennent du nœud et non de la requête
+_RETRY_CODES = {-32005, 429}
+_RETRY_MESSAGES = ('rate limit', 'too many requests', 'header not found', 'missing trie node')
+_STATIC_METHODS = {'eth_chainId', 'net_version'}
+
+RPC_LATENCY = metrics.REGISTRY.histogram(
+    'certichain_rpc_request_duration_seconds', 'Durée des requêtes JSON-RPC par nœud', ['endpoint'])
+RPC_REQUESTS = metrics.REGISTRY.counter(
+    'certichain_rpc_requests_total', 'Requêtes JSON-RPC par nœud et résultat', ['endpoint', 'outcome'])
+RPC_CACHE = metrics.REGISTRY.counter(
+    'certichain_rpc_cache_total', 'Lectures du cache eth_call (hit, miss)', ['result'])
+
+
+class RPCUnavailable(ConnectionError):
+    """Aucun nœud du pool n'a répondu"""
+
+
+class Endpoint:
+    def __init__(self, url, timeout):
+        self.url = url
+        # L'URL Infura contient la clé du projet : seul l'hôte sert d'étiquette
+        self.name = urlsplit(url).netloc or url
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.latency = None  # secondes, moyenne mobile
+        self.head = None
+        self.failures = 0
+        self.down_until = 0.0
+
+    def post(self, payload):
+        start = time.perf_counter()
+        response = self.session.post(self.url, data=payload, timeout=self.timeout,
+                                     headers={'Content-Type': 'application/json'})
+        elapsed = time.perf_counter() - start
+        if response.status_code == 429 or response.status_code >= 500:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        response.raise_for_status()
+        self.observe(elapsed)
+        return response.content
+
+    def observe(self, elapsed):
+        self.latency = elapsed if self.latency is None else \
+            EWMA_WEIGHT * elapsed + (1 - EWMA_WEIGHT) * self.latency
+        RPC_LATENCY.observe(elapsed, endpoint=self.name)
+
+    def succeeded(self):
+        self.failures = 0
+        self.down_until = 0.0
+        RPC_REQUESTS.inc(endpoint=self.name, outcome='ok')
+
+    def failed(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + min(COOLDOWN * 2 ** (self.failures - 1), MAX_COOLDOWN)
+        RPC_REQUESTS.inc(endpoint=self.name, outcome='error')
+
+    def is_up(self, now):
+        return now >= self.down_until
+
+    def stats(self, now):
+        return {
+            'endpoint': self.name,
+            'healthy': self.is_up(now),
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'head': self.head,
+            'failures': self.failures
+        }
+
+
+def _retryable(reply):
+    """Réponse d'erreur due au nœud (limite de débit, nœud en retard)"""
+    error = reply.get('error') if isinstance(reply, dict) else None
+    if not error:
+        return False
+    message = str(error.get('message', '')).lower()
+    return error.get('code') in _RETRY_CODES or any(m in message for m in _RETRY_MESSAGES)
+
+
+def _block_number(tag):
+    if isinstance(tag, int):
+        return tag
+    if isinstance(tag, str) and tag.startswith('0x'):
+        return int(tag, 16)
+    return None
+
+
+class RPCPool(JSONBaseProvider):
+    def __init__(self, urls, timeout=TIMEOUT, health_interval=HEALTH_INTERVAL,
+                 finality_depth=FINALITY_DEPTH, max_lag=MAX_LAG, cache_size=CACHE_SIZE):
+        super().__init__()
+        if isinstance(urls, str):
+            urls = [u.strip() for u in urls.split(',')]
+        self.endpoints = [Endpoint(url, timeout) for url in urls if url]
+        if not self.endpoints:
+            raise ValueError("RPCPool: aucune URL")
+        self.health_interval = health_interval
+        self.finality_depth = finality_depth
+        self.max_lag = max_lag
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        self.checking = threading.Lock()
+        self.checked_at = None
+
+    def __str__(self):
+        return f"RPC pool {', '.join(e.name for e in self.endpoints)}"
+
+    # --- Santé des nœuds ---
+
+    def _probe(self, endpoint):
+        payload = json.dumps({'jsonrpc': '2.0', 'id': 0, 'method': 'eth_blockNumber', 'params': []})
+        try:
+            reply = json.loads(endpoint.post(payload))
+            endpoint.head = int(reply['result'], 16)
+            endpoint.succeeded()
+        except Exception:
+            endpoint.failed()
+
+    def check_health(self):
+        """Sonde tous les nœuds en parallèle (latence, tête de chaîne)"""
+        threads = [threading.Thread(target=self._probe, args=(e,), daemon=True) for e in self.endpoints]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.checked_at = time.monotonic()
+
+    def _run_check(self):
+        try:
+            self.check_health()
+        finally:
+            self.checking.release()
+
+    def _maybe_check(self):
+        if self.checked_at is not None and time.monotonic() - self.checked_at < self.health_interval:
+            return
+        first = self.checked_at is None
+        # Première sonde bloquante (pour router), les suivantes en arrière-plan
+        if not self.checking.acquire(blocking=first):
+            return
+        if first and self.checked_at is not None:
+            self.checking.release()  # faite par un autre thread pendant l'attente
+        elif first:
+            self._run_check()
+        else:
+            threading.Thread(target=self._run_check, daemon=True).start()
+
+    @property
+    def head(self):
+        heads = [e.head for e in self.endpoints if e.head is not None]
+        return max(heads) if heads else None
+
+    @property
+    def finalized_block(self):
+        """Plus haut bloc considéré comme définitif, ou None avant la première sonde"""
+        head = self.head
+        return head - self.finality_depth if head is not None and head >= self.finality_depth else None
+
+    def ranked(self):
+        """Nœuds dans l'ordre d'essai : sains et à jour par latence, puis les autres"""
+        now = time.monotonic()
+        head = self.head
+        healthy, others = [], []
+        for endpoint in self.endpoints:
+            lagging = head is not None and endpoint.head is not None and endpoint.head < head - self.max_lag
+            (healthy if endpoint.is_up(now) and not lagging else others).append(endpoint)
+        healthy.sort(key=lambda e: e.latency if e.latency is not None else 0.0)
+        others.sort(key=lambda e: e.down_until)
+        return healthy + others
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'head': self.head,
+            'finalized': self.finalized_block,
+            'cached_calls': len(self.cache),
+            'endpoints': [e.stats(now) for e in self.ranked()]
+        }
+
+    # --- Cache des lectures définitives ---
+
+    def _cache_key(self, method, params):
+        """Clé de cache, ou None si la réponse peut encore changer ; params peut être réécrit"""
+        if method in _STATIC_METHODS:
+            return method, params
+        if method != 'eth_call' or len(params) < 2:
+            return None, params
+        finalized = self.finalized_block
+        if finalized is None:
+            return None, params
+        tag = params[1]
+        if tag == 'finalized':
+            # Même bloc pour tous les nœuds, et une clé stable jusqu'à la sonde suivante
+            params = [params[0], hex(finalized)] + list(params[2:])
+        elif _block_number(tag) is None or _block_number(tag) > finalized:
+            return None, params
+        return json.dumps([method, params], sort_keys=True, default=str), params
+
+    def _cache_get(self, key):
+        with self.cache_lock:
+            reply = self.cache.get(key)
+            if reply is not None:
+                self.cache.move_to_end(key)
+        RPC_CACHE.inc(result='hit' if reply is not None else 'miss')
+        return reply
+
+    def _cache_put(self, key, reply):
+        with self.cache_lock:
+            self.cache[key] = reply
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    # --- Envoi ---
+
+    def _send(self, payload, check=None):
+        """
+        Envoie payload au premier nœud qui répond. check(reply, retry) vrai =
+        essayer le suivant ; retry indique qu'un nœud précédent a échoué.
+        """
+        self._maybe_check()
+        error = None
+        for endpoint in self.ranked():
+            try:
+                reply = json.loads(endpoint.post(payload))
+            except (requests.RequestException, ValueError) as e:
+                endpoint.failed()
+                error = e
+                continue
+            if check is not None and check(reply, error is not None):
+                endpoint.failed()
+                error = RuntimeError(f"{endpoint.name}: {reply}")
+                continue
+            endpoint.succeeded()
+            return reply
+        raise RPCUnavailable(f"Aucun nœud RPC disponible ({len(self.endpoints)} essayé(s)): {error}")
+
+    def make_request(self, method, params):
+        key, params = self._cache_key(method, params)
+        if key is not None:
+            cached = self._cache_get(key)
+            if cached is not None:
+                return cached
+
+        def check(reply, retry):
+            if method == 'eth_sendRawTransaction' and retry and 'error' in reply:
+                # Déjà diffusée par un nœud qui a échoué avant de répondre
+                message = str(reply['error'].get('message', '')).lower()
+                if 'already known' in message or 'known transaction' in message:
+                    reply.pop('error')
+                    reply['result'] = '0x' + keccak(bytes.fromhex(params[0][2:])).hex()
+            return _retryable(reply)
+
+        reply = self._send(self.encode_rpc_request(method, params), check)
+        if key is not None and 'error' not in reply:
+            self._cache_put(key, reply)
+        return reply
+
+    def batch(self, calls):
+        """Même contrat que bulk_verify.rpc_batch : [(méthode, params)] -> résultats dans l'ordre"""
+        results = [None] * len(calls)
+        keys, pending = {}, []
+        for i, (method, params) in enumerate(calls):
+            key, params = self._cache_key(method, params)
+            cached = self._cache_get(key) if key is not None else None
+            if cached is not None:
+                results[i] = cached.get('result')
+            else:
+                keys[i] = key
+                pending.append({'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params})
+        if not pending:
+            return results
+
+        replies = self._send(json.dumps(pending),
+                             lambda r, retry: not isinstance(r, list) or any(_retryable(x) for x in r))
+        for reply in replies:
+            i = reply.get('id')
+            if i not in keys:
+                continue
+            results[i] = reply.get('result')
+            if keys[i] is not None and 'error' not in reply:
+                self._cache_put(keys[i], reply)
+        return results
+
+    def is_connected(self, show_traceback=False):
+        try:
+            return 'result' in self.make_request('eth_blockNumber', [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
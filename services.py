@@ -0,0 +1,150 @@
+"""
+Services de l'application chargés à la première utilisation : Web3 (sur un
+pool de nœuds RPC), le contrat, les adresses vérifiées, les transactions de
+l'émetteur, l'indexeur, la vérification en masse, les révocations, l'envoi
+des emails et le client IPFS. Importer app.py ne charge plus web3 (plus
+d'une seconde d'imports) et ne dépend plus du fournisseur RPC.
+
+Chaque service est construit une seule fois, sous verrou ; il peut être
+remplacé par affectation (services.w3 = ...), par exemple pour un banc
+d'essai sur une chaîne locale.
+"""
+
+import threading
+
+
+class lazy:
+    """Propriété calculée une fois par instance, protégée par le verrou de l'instance"""
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.__doc__ = build.__doc__
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        with instance._lock:
+            if self.name not in instance.__dict__:
+                instance.__dict__[self.name] = self.build(instance)
+        return instance.__dict__[self.name]
+
+
+class Services:
+    def __init__(self, app, rpc_url, contract_address, issuer_address, ipfs_options,
+                 indexer_options=None, revocation_options=None, rpc_options=None, tx_options=None,
+                 mail_options=None):
+        self.app = app
+        self.rpc_url = rpc_url  # une URL ou plusieurs séparées par des virgules
+        self.rpc_options = rpc_options or {}
+        self.tx_options = tx_options or {}
+        self.mail_options = mail_options or {}
+        self.contract_address = contract_address
+        self.issuer_address = issuer_address
+        self.ipfs_options = ipfs_options
+        self.indexer_options = indexer_options or {}
+        self.revocation_options = revocation_options or {}
+        self._lock = threading.RLock()
+
+    @lazy
+    def w3(self):
+        from web3 import Web3
+        from rpc_pool import RPCPool
+
+        w3 = Web3(RPCPool(self.rpc_url, **self.rpc_options))
+        try:
+            from web3.middleware import ExtraDataToPOAMiddleware
+            w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+        except ImportError:
+            from web3.middleware import geth_poa_middleware
+            w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+        return w3
+
+    def _checksum(self, address):
+        from web3 import Web3
+
+        try:
+            return Web3.to_checksum_address(address)
+        except Exception:
+            return None
+
+    @lazy
+    def contract_checksum(self):
+        return self._checksum(self.contract_address)
+
+    @lazy
+    def issuer(self):
+        """Adresse de l'émetteur au format checksum, ou None"""
+        return self._checksum(self.issuer_address)
+
+    @lazy
+    def contract(self):
+        """Contrat CertificateRegistry, ou None s'il n'est pas configuré"""
+        from config import load_contract_abi
+
+        if not (self.contract_checksum and self.issuer):
+            return None
+        return self.w3.eth.contract(address=self.contract_checksum, abi=load_contract_abi())
+
+    @lazy
+    def contract_functions(self):
+        """
+        Noms des fonctions de l'ABI présentes dans le contrat déployé : le
+        dispatcher Solidity compare le sélecteur de l'appel avec un PUSH4 de
+        chaque sélecteur. L'ABI locale peut être plus récente que le contrat.
+        """
+        from eth_utils import function_abi_to_4byte_selector
+
+        if not self.contract:
+            return frozenset()
+        code = bytes(self.w3.eth.get_code(self.contract.address))
+        return frozenset(
+            entry['name'] for entry in self.contract.abi
+            if entry.get('type') == 'function' and b'\x63' + function_abi_to_4byte_selector(entry) in code
+        )
+
+    @lazy
+    def transactions(self):
+        """Envoi des transactions de l'émetteur (frais, nonces, remplacements)"""
+        from tx_manager import TxManager
+
+        return TxManager(self.w3, self.issuer, **self.tx_options)
+
+    @lazy
+    def bulk_verifier(self):
+        import bulk_verify
+
+        return bulk_verify.BulkVerifier(self.w3, self.contract, revocations=self.revocations,
+                                        batch=getattr(self.w3.provider, 'batch', None),
+                                        functions=self.contract_functions)
+
+    @lazy
+    def revocations(self):
+        """Filtre de Bloom + ensemble exact des identifiants révoqués"""
+        from revocation import RevocationRegistry
+
+        return RevocationRegistry(self.app, **self.revocation_options)
+
+    @lazy
+    def indexer(self):
+        """Indexeur des événements, ou None sans contrat"""
+        import chain_indexer
+
+        if not self.contract:
+            return None
+        return chain_indexer.ChainIndexer(self.app, self.w3, self.contract, **self.indexer_options)
+
+    @lazy
+    def mail_dispatcher(self):
+        """Envoi de la file d'emails, ou None sans serveur SMTP"""
+        from mailer import Dispatcher
+
+        if not self.mail_options.get('host'):
+            return None
+        return Dispatcher(self.app, **self.mail_options)
+
+    @lazy
+    def ipfs_client(self):
+        from ipfs_client import IPFSClient
+
+        return IPFSClient(**self.ipfs_options)
@@ -0,0 +1,152 @@
+"""
+Cache des réponses de vérification et des listes de certificats.
+
+    CACHE_URL=                                         mémoire du processus (défaut)
+    CACHE_URL=sqlite:////dev/shm/certichain-cache.db   partagé par les workers de la machine
+
+Les valeurs sont stockées en JSON et expirent après leur TTL. Les connexions
+SQLite sont ouvertes par processus et par thread : le cache peut être créé
+avant le fork des workers (gunicorn --preload).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PURGE_EVERY = 500  # écritures entre deux purges des entrées expirées (SQLite)
+
+
+class MemoryCache:
+    """Cache LRU borné, propre au processus"""
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # clé -> (expiration, JSON)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        item = (time.time() + (ttl or self.ttl), json.dumps(value))
+        with self.lock:
+            self.entries[key] = item
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteFile:
+    """Fichier SQLite (WAL) partagé entre processus : une connexion par processus et par thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self._pid = None
+        self._local = None
+
+    def _connect(self):
+        # Une connexion SQLite ne doit pas traverser un fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._local = threading.local()
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')  # contenu jetable : cache, seaux de jetons
+            self._local.conn = conn
+        return conn
+
+
+class SQLiteCache(SQLiteFile):
+    """Cache dans un fichier SQLite (WAL), visible par tous les processus qui l'ouvrent"""
+
+    def __init__(self, path, ttl):
+        super().__init__(path)
+        self.ttl = ttl
+        self._writes = 0
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS cache '
+            '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)'
+        )
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, value, ttl=None):
+        conn = self._connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time() + (ttl or self.ttl))
+        )
+        self._writes += 1
+        if self._writes % PURGE_EVERY == 0:
+            conn.execute('DELETE FROM cache WHERE expires < ?', (time.time(),))
+
+    def delete(self, *keys):
+        if keys:
+            self._connect().executemany('DELETE FROM cache WHERE key = ?', [(k,) for k in keys])
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+
+
+def make_cache(url, ttl, max_entries=10000):
+    """'' ou 'memory' : cache du processus ; 'sqlite:///chemin' : cache partagé"""
+    if not url or url == 'memory':
+        return MemoryCache(ttl, max_entries)
+    if url.startswith('sqlite:///'):
+        return SQLiteCache(url[len('sqlite:///'):], ttl)
+    raise ValueError(f"CACHE_URL non supportée : {url}")
+
+
+def invalidate_on_commit(cache, model, keys):
+    """Après chaque commit, retire du cache keys(obj) pour les objets `model` ajoutés, modifiés ou supprimés"""
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    info_key = f'stale_cache_keys_{id(cache)}'
+
+    @event.listens_for(Session, 'after_flush')
+    def _collect(session, flush_context):
+        stale = session.info.setdefault(info_key, set())
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if isinstance(obj, model):
+                stale.update(keys(obj))
+
+    @event.listens_for(Session, 'after_commit')
+    def _purge(session):
+        stale = session.info.pop(info_key, None)
+        if stale:
+            cache.delete(*stale)
+
+    @event.listens_for(Session, 'after_soft_rollback')
+    def _discard(session, previous_transaction):
+        session.info.pop(info_key, None)
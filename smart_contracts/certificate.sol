@@ -10,6 +10,8 @@ contract CertificateRegistry {
     }
 
     mapping(bytes32 => Certificate) public certificates;
+    mapping(bytes32 => address) public issuers;
+    mapping(bytes32 => uint256) public revokedAt;
 
     event CertificateIssued(
         bytes32 indexed certificateId,
@@ -18,11 +20,41 @@ contract CertificateRegistry {
         uint256 issueDate
     );
 
+    event CertificateRevoked(
+        bytes32 indexed certificateId,
+        string reason,
+        uint256 revokedAt
+    );
+
     function issueCertificate(
         bytes32 _certificateId,
         string memory _ipfsHash,
         string memory _recipientName
     ) public {
+        _issue(_certificateId, _ipfsHash, _recipientName);
+    }
+
+    function issueCertificates(
+        bytes32[] calldata _certificateIds,
+        string[] calldata _ipfsHashes,
+        string[] calldata _recipientNames
+    ) external {
+        require(
+            _certificateIds.length == _ipfsHashes.length &&
+            _certificateIds.length == _recipientNames.length,
+            "Length mismatch"
+        );
+
+        for (uint256 i = 0; i < _certificateIds.length; i++) {
+            _issue(_certificateIds[i], _ipfsHashes[i], _recipientNames[i]);
+        }
+    }
+
+    function _issue(
+        bytes32 _certificateId,
+        string memory _ipfsHash,
+        string memory _recipientName
+    ) internal {
         require(!certificates[_certificateId].exists, "Certificate already exists");
 
         certificates[_certificateId] = Certificate({
@@ -31,12 +63,26 @@ contract CertificateRegistry {
             issueDate: block.timestamp,
             exists: true
         });
+        issuers[_certificateId] = msg.sender;
 
         emit CertificateIssued(_certificateId, _ipfsHash, _recipientName, block.timestamp);
     }
 
+    function revokeCertificate(bytes32 _certificateId, string memory _reason) public {
+        require(certificates[_certificateId].exists, "Certificate not found");
+        require(issuers[_certificateId] == msg.sender, "Only the issuer can revoke");
+        require(revokedAt[_certificateId] == 0, "Certificate already revoked");
+
+        revokedAt[_certificateId] = block.timestamp;
+        emit CertificateRevoked(_certificateId, _reason, block.timestamp);
+    }
+
+    function isRevoked(bytes32 _certificateId) public view returns (bool) {
+        return revokedAt[_certificateId] != 0;
+    }
+
     function verifyCertificate(bytes32 _certificateId) public view returns (bool) {
-        return certificates[_certificateId].exists;
+        return certificates[_certificateId].exists && revokedAt[_certificateId] == 0;
     }
 
     function getCertificate(bytes32 _certificateId)
@@ -52,4 +98,31 @@ contract CertificateRegistry {
         Certificate memory cert = certificates[_certificateId];
         return (cert.ipfsHash, cert.recipientName, cert.issueDate);
     }
+
+    function getCertificates(bytes32[] calldata _certificateIds)
+        external
+        view
+        returns (
+            string[] memory ipfsHashes,
+            string[] memory recipientNames,
+            uint256[] memory issueDates,
+            bool[] memory exists
+        )
+    {
+        uint256 count = _certificateIds.length;
+        ipfsHashes = new string[](count);
+        recipientNames = new string[](count);
+        issueDates = new uint256[](count);
+        exists = new bool[](count);
+
+        for (uint256 i = 0; i < count; i++) {
+            Certificate storage cert = certificates[_certificateIds[i]];
+            if (cert.exists) {
+                ipfsHashes[i] = cert.ipfsHash;
+                recipientNames[i] = cert.recipientName;
+                issueDates[i] = cert.issueDate;
+                exists[i] = true;
+            }
+        }
+    }
 }
\ No newline at end of file
@@ -0,0 +1,477 @@
+"""
+On-node storage engines for StorageNode.
+
+FlatFileEngine keeps one file per object in the node directory (the original
+layout). SegmentEngine appends objects to large segment files, keeps an
+in-memory offset index persisted as a compact sidecar, serves reads through
+mmap and compacts segments in the background to reclaim deleted space.
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+READ_CHUNK = 8192
+
+
+class StorageEngine:
+    """Interface shared by the on-node storage engines"""
+
+    def open_writer(self, file_id, file_size):
+        """Writer with write(chunk), commit() and abort()"""
+        raise NotImplementedError
+
+    def read_chunks(self, file_id):
+        """Iterate over the object's bytes, None if it doesn't exist"""
+        raise NotImplementedError
+
+    def size(self, file_id):
+        """Object size in bytes, None if it doesn't exist"""
+        raise NotImplementedError
+
+    def delete(self, file_id):
+        """Delete an object, returns freed bytes or None if it didn't exist"""
+        raise NotImplementedError
+
+    def used_bytes(self):
+        """Bytes of live objects"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# ==================== Flat files ====================
+
+class _FlatWriter:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'wb')
+
+    def write(self, chunk):
+        self.f.write(chunk)
+
+    def commit(self):
+        self.f.close()
+
+    def abort(self):
+        self.f.close()
+        self.path.unlink(missing_ok=True)
+
+
+class FlatFileEngine(StorageEngine):
+    """One file per object: storage_path / file_id"""
+
+    def __init__(self, storage_path):
+        self.storage_path = Path(storage_path)
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+
+    def open_writer(self, file_id, file_size):
+        return _FlatWriter(self.storage_path / file_id)
+
+    def read_chunks(self, file_id):
+        file_path = self.storage_path / file_id
+        if not file_path.exists():
+            return None
+
+        def chunks():
+            with open(file_path, 'rb') as f:
+                while True:
+                    chunk = f.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    yield chunk
+        return chunks()
+
+    def size(self, file_id):
+        file_path = self.storage_path / file_id
+        return file_path.stat().st_size if file_path.exists() else None
+
+    def delete(self, file_id):
+        file_path = self.storage_path / file_id
+        if not file_path.exists():
+            return None
+        file_size = file_path.stat().st_size
+        file_path.unlink()
+        return file_size
+
+    def used_bytes(self):
+        total = 0
+        for file_path in self.storage_path.rglob('*'):
+            if file_path.is_file():
+                total += file_path.stat().st_size
+        return total
+
+
+# ==================== Log-structured segments ====================
+
+# Record: magic, kind, id length, data length, crc32 of data, then id, then data
+RECORD_HEADER = struct.Struct('<4sBHQI')
+RECORD_MAGIC = b'CSEG'
+KIND_PUT = 1
+KIND_DELETE = 2
+
+# Sidecar: header, then one entry per live object
+INDEX_HEADER = struct.Struct('<4sIIQ')  # magic, entry count, active segment, scanned offset
+INDEX_ENTRY = struct.Struct('<HIQQ')  # id length, segment, data offset, data length
+INDEX_MAGIC = b'CIDX'
+
+SEGMENT_SIZE = 256 * 1024 * 1024
+SPOOL_IN_MEMORY = 8 * 1024 * 1024  # larger uploads are spooled to a temp file
+COMPACT_RATIO = 0.5  # compact sealed segments with more than this fraction dead
+COMPACT_INTERVAL = 60
+
+
+class _SegmentWriter:
+    """Spools an upload, then appends it to the active segment in one go"""
+
+    def __init__(self, engine, file_id, file_size):
+        self.engine = engine
+        self.file_id = file_id
+        if file_size <= SPOOL_IN_MEMORY:
+            self.spool = BytesIO()
+        else:
+            self.spool = tempfile.TemporaryFile(dir=engine.root)
+        self.crc = 0
+
+    def write(self, chunk):
+        self.spool.write(chunk)
+        self.crc = zlib.crc32(chunk, self.crc)
+
+    def commit(self):
+        try:
+            self.spool.seek(0)
+            self.engine._append_put(self.file_id, self.spool, self.crc)
+        finally:
+            self.spool.close()
+
+    def abort(self):
+        self.spool.close()
+
+
+class SegmentEngine(StorageEngine):
+    """Objects appended to segment files, located through an in-memory index"""
+
+    def __init__(self, storage_path, segment_size=SEGMENT_SIZE, compact_interval=COMPACT_INTERVAL):
+        self.root = Path(storage_path) / 'segments'
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.segment_size = segment_size
+        self.index = {}  # file_id -> (segment, data offset, length)
+        self.verified = set()  # index entries whose CRC32 matched on a read
+        self.corrupt = set()  # file_ids dropped after a CRC32 mismatch
+        self.segment_live = {}  # segment -> live data bytes
+        self.maps = {}  # segment -> mmap
+        self.lock = threading.Lock()
+        self.active = 0
+        self.active_file = None
+        self.dirty = 0  # records appended since the sidecar was written
+        self.running = True
+
+        self._load()
+        if compact_interval:
+            threading.Thread(target=self._compaction_loop, args=(compact_interval,), daemon=True).start()
+
+    # ----- layout -----
+
+    def _segment_path(self, segment):
+        return self.root / f"segment_{segment:06d}.dat"
+
+    def _segments(self):
+        return sorted(int(p.stem.split('_')[1]) for p in self.root.glob('segment_*.dat'))
+
+    # ----- recovery -----
+
+    def _load(self):
+        """Load the sidecar, then replay records appended after it was written"""
+        segment, offset = self._load_sidecar()
+        segments = self._segments()
+        if not segments:
+            segments = [1]
+            self._segment_path(1).touch()
+        for seg in segments:
+            if seg < segment:
+                continue
+            self._scan(seg, offset if seg == segment else 0)
+        self.active = segments[-1]
+        self.active_file = open(self._segment_path(self.active), 'ab')
+
+    def _load_sidecar(self):
+        sidecar = self.root / 'index.bin'
+        if not sidecar.exists():
+            return 0, 0
+        data = sidecar.read_bytes()
+        magic, count, segment, offset = INDEX_HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC:
+            return 0, 0
+        pos = INDEX_HEADER.size
+        for _ in range(count):
+            id_len, seg, data_offset, length = INDEX_ENTRY.unpack_from(data, pos)
+            pos += INDEX_ENTRY.size
+            file_id = data[pos:pos + id_len].decode('utf-8')
+            pos += id_len
+            if self._segment_path(seg).exists():
+                self._index_put(file_id, seg, data_offset, length)
+        return segment, offset
+
+    def _scan(self, segment, offset):
+        """Replay records of a segment from offset, truncating a torn tail.
+        
+        A put whose data doesn't match its CRC32 is a torn write when it is
+        the last record (truncated with the tail), corruption otherwise (the
+        object is dropped and the scan goes on).
+        """
+        path = self._segment_path(segment)
+        file_size = path.stat().st_size
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, kind, id_len, length, crc = RECORD_HEADER.unpack(header)
+                if magic != RECORD_MAGIC:
+                    break
+                file_id = f.read(id_len).decode('utf-8')
+                data_offset = f.tell()
+                if data_offset + length > file_size:
+                    break
+                actual = 0
+                remaining = length
+                while remaining:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    actual = zlib.crc32(chunk, actual)
+                    remaining -= len(chunk)
+                if kind == KIND_PUT and actual != crc:
+                    if f.tell() == file_size:
+                        break
+                    self._index_remove(file_id)
+                    self.corrupt.add(file_id)
+                    print(f"⚠️  Corrupt object {file_id} in segment {segment} (CRC32 mismatch), dropped")
+                elif kind == KIND_PUT:
+                    self._index_put(file_id, segment, data_offset, length)
+                else:
+                    self._index_remove(file_id)
+                offset = f.tell()
+        if offset < file_size:
+            os.truncate(path, offset)
+
+    # ----- index bookkeeping (lock held) -----
+
+    def _index_put(self, file_id, segment, data_offset, length):
+        self._index_remove(file_id)
+        self.index[file_id] = (segment, data_offset, length)
+        self.segment_live[segment] = self.segment_live.get(segment, 0) + length
+
+    def _index_remove(self, file_id):
+        entry = self.index.pop(file_id, None)
+        if entry:
+            self.segment_live[entry[0]] -= entry[2]
+            self.verified.discard(entry)
+        return entry
+
+    def _drop_corrupt(self, file_id, entry):
+        """Forget an object whose bytes don't match their CRC32 (lock held)"""
+        if self.index.get(file_id) == entry:
+            self._index_remove(file_id)
+        self.corrupt.add(file_id)
+        print(f"⚠️  Corrupt object {file_id} in segment {entry[0]} (CRC32 mismatch), dropped")
+
+    def _write_sidecar(self):
+        parts = []
+        for file_id, (segment, data_offset, length) in self.index.items():
+            encoded = file_id.encode('utf-8')
+            parts.append(INDEX_ENTRY.pack(len(encoded), segment, data_offset, length))
+            parts.append(encoded)
+        header = INDEX_HEADER.pack(INDEX_MAGIC, len(self.index), self.active, self.active_file.tell())
+        tmp = self.root / 'index.bin.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(header)
+            f.write(b''.join(parts))
+        os.replace(tmp, self.root / 'index.bin')
+        self.dirty = 0
+
+    # ----- appends -----
+
+    def _append_record(self, kind, file_id, src, length, crc):
+        """Append one record to the active segment (lock held), returns data offset"""
+        if self.active_file.tell() + length > self.segment_size and self.active_file.tell() > 0:
+            self.active_file.close()
+            self.active += 1
+            self.active_file = open(self._segment_path(self.active), 'ab')
+        encoded = file_id.encode('utf-8')
+        self.active_file.write(RECORD_HEADER.pack(RECORD_MAGIC, kind, len(encoded), length, crc))
+        self.active_file.write(encoded)
+        data_offset = self.active_file.tell()
+        if src is not None:
+            while True:
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                self.active_file.write(chunk)
+        self.active_file.flush()
+        self.dirty += 1
+        return data_offset
+
+    def _append_put(self, file_id, src, crc):
+        src.seek(0, os.SEEK_END)
+        length = src.tell()
+        src.seek(0)
+        with self.lock:
+            data_offset = self._append_record(KIND_PUT, file_id, src, length, crc)
+            self._index_put(file_id, self.active, data_offset, length)
+            if self.dirty >= 1000:
+                self._write_sidecar()
+
+    # ----- reads -----
+
+    def _view(self, file_id):
+        """
+        memoryview over an object's bytes, None if it doesn't exist. The
+        CRC32 is checked on the first read of each stored copy; a mismatch
+        drops the object, so the node reports it missing and the gateway
+        falls back to another replica.
+        """
+        with self.lock:
+            entry = self.index.get(file_id)
+            if not entry:
+                return None
+            segment, data_offset, length = entry
+            if length == 0:
+                return memoryview(b'')
+            mapped = self.maps.get(segment)
+            if mapped is None or len(mapped) < data_offset + length:
+                # Segment grew since it was mapped (or never was)
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = mapped
+            verified = entry in self.verified
+        view = memoryview(mapped)[data_offset:data_offset + length]
+        if not verified:
+            header_offset = data_offset - len(file_id.encode('utf-8')) - RECORD_HEADER.size
+            crc = RECORD_HEADER.unpack_from(mapped, header_offset)[4]
+            with self.lock:
+                if zlib.crc32(view) != crc:
+                    self._drop_corrupt(file_id, entry)
+                    return None
+                if self.index.get(file_id) == entry:
+                    self.verified.add(entry)
+        return view
+
+    def open_writer(self, file_id, file_size):
+        return _SegmentWriter(self, file_id, file_size)
+
+    def read_chunks(self, file_id):
+        view = self._view(file_id)
+        if view is None:
+            return None
+        return (view[i:i + READ_CHUNK] for i in range(0, len(view), READ_CHUNK))
+
+    def read(self, file_id):
+        """Whole object as bytes, None if it doesn't exist"""
+        view = self._view(file_id)
+        return None if view is None else bytes(view)
+
+    def size(self, file_id):
+        with self.lock:
+            entry = self.index.get(file_id)
+            return entry[2] if entry else None
+
+    def delete(self, file_id):
+        with self.lock:
+            entry = self._index_remove(file_id)
+            if not entry:
+                return None
+            # Tombstone so the delete survives a restart before the next sidecar
+            self._append_record(KIND_DELETE, file_id, None, 0, 0)
+            return entry[2]
+
+    def used_bytes(self):
+        with self.lock:
+            return sum(self.segment_live.values())
+
+    # ----- compaction -----
+
+    def _compaction_loop(self, interval):
+        while self.running:
+            time.sleep(interval)
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️  Compaction error: {e}")
+
+    def compact(self):
+        """Rewrite live objects out of mostly-dead sealed segments, then drop them"""
+        reclaimed = 0
+        for segment in self._segments():
+            with self.lock:
+                if segment == self.active:
+                    continue
+                size = self._segment_path(segment).stat().st_size
+                live = self.segment_live.get(segment, 0)
+                if size == 0 or live / size > COMPACT_RATIO:
+                    continue
+                moving = [(fid, e) for fid, e in self.index.items() if e[0] == segment]
+
+            for file_id, entry in moving:
+                view, crc = self._view_at(file_id, entry)
+                with self.lock:
+                    # Skip objects deleted or rewritten while we were copying
+                    if self.index.get(file_id) != entry:
+                        continue
+                    # Never rewrite bad bytes under a fresh CRC32
+                    if zlib.crc32(view) != crc:
+                        self._drop_corrupt(file_id, entry)
+                        continue
+                    data_offset = self._append_record(KIND_PUT, file_id, BytesIO(view), entry[2], crc)
+                    self._index_put(file_id, self.active, data_offset, entry[2])
+
+            with self.lock:
+                if any(e[0] == segment for e in self.index.values()):
+                    continue
+                # Persist the new locations before the old copies disappear
+                self.active_file.flush()
+                os.fsync(self.active_file.fileno())
+                self._write_sidecar()
+                self.maps.pop(segment, None)
+                self.segment_live.pop(segment, None)
+                self._segment_path(segment).unlink()
+                reclaimed += size
+        return reclaimed
+
+    def _view_at(self, file_id, entry):
+        """An object's bytes and the CRC32 stored in its record header"""
+        segment, data_offset, length = entry
+        with open(self._segment_path(segment), 'rb') as f:
+            f.seek(data_offset - len(file_id.encode('utf-8')) - RECORD_HEADER.size)
+            crc = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))[4]
+            f.seek(data_offset)
+            return f.read(length), crc
+
+    def close(self):
+        self.running = False
+        with self.lock:
+            if self.active_file.closed:
+                return
+            self.active_file.flush()
+            os.fsync(self.active_file.fileno())
+            self._write_sidecar()
+            self.active_file.close()
+
+
+ENGINES = {
+    'flat': FlatFileEngine,
+    'segment': SegmentEngine,
+}
+
+
+def create_engine(name, storage_path):
+    """Build the storage engine registered under `name`"""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown storage engine: {name}")
+    return ENGINES[name](storage_path)
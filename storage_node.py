@@ -4,19 +4,32 @@ import json
 import time
 import os
 import sys
+import shutil
 import uuid
 from pathlib import Path
 from datetime import datetime
 
+from storage_engine import create_engine
+from read_cache import TinyLFUCache
+from metrics import Registry, start_http_server
+from node_logging import get_logger
+
+log = get_logger('node')
+
+CACHE_MAX_OBJECT = 4 * 1024 * 1024  # larger objects are always streamed from disk
+REQUEST_TYPES = {'upload', 'download', 'delete', 'replicate'}
+
 class StorageNode:
     def __init__(self, network_host='localhost', network_port=9000, 
-                 node_port=None, storage_path=None, capacity_gb=5):
+                 node_port=None, storage_path=None, capacity_gb=5, bandwidth_mb=100,
+                 engine='flat', cache_mb=64, metrics_port=None):
         self.network_host = network_host
         self.network_port = network_port
         self.node_id = str(uuid.uuid4())[:8]
         self.node_port = node_port or (10000 + int(time.time() * 1000) % 10000)
         self.storage_capacity = capacity_gb * 1024 * 1024 * 1024
         self.used_storage = 0
+        self.bandwidth_capacity = bandwidth_mb * 1024 * 1024  # bytes/s
         
         # Setup storage directory
         if storage_path:
@@ -24,18 +37,31 @@ class StorageNode:
         else:
             self.storage_path = Path(f"./node_storage/{self.node_id}")
         self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.engine = create_engine(engine, self.storage_path)
+        self.read_cache = TinyLFUCache(cache_mb * 1024 * 1024, max_object_size=CACHE_MAX_OBJECT)
         
         self.running = False
         self.files = {}  # file_id -> file_info
+        self.pending_progress = {}  # transfer_id -> unreported progress
+        self.progress_lock = threading.Lock()
         self._calculate_used_storage()
         
+        self.metrics_port = metrics_port
+        self.metrics = Registry()
+        self.bytes_in = self.metrics.counter('node_bytes_in_total', 'Bytes received from clients and peers')
+        self.bytes_out = self.metrics.counter('node_bytes_out_total', 'Bytes sent to clients and peers')
+        self.transfer_duration = self.metrics.histogram(
+            'node_transfer_duration_seconds', 'Transfer duration per direction', ['direction'])
+        self.requests = self.metrics.counter('node_requests_total', 'Requests per type', ['type'])
+        self.request_errors = self.metrics.counter(
+            'node_request_errors_total', 'Failed requests per type', ['type'])
+        self.storage_gauge = self.metrics.gauge('node_storage_bytes', 'Storage by kind', ['kind'])
+        self.cache_gauge = self.metrics.gauge('node_read_cache', 'Read cache counters', ['stat'])
+        self.metrics.add_collector(self._collect_metrics)
+        
     def _calculate_used_storage(self):
         """Calculate currently used storage"""
-        total = 0
-        for file_path in self.storage_path.rglob('*'):
-            if file_path.is_file():
-                total += file_path.stat().st_size
-        self.used_storage = total
+        self.used_storage = self.engine.used_bytes()
     
     def start(self):
         """Start the storage node"""
@@ -43,7 +69,7 @@ class StorageNode:
         
         # Register with network
         if not self._register_with_network():
-            print(f"❌ Failed to register with network server")
+            log.error("❌ Failed to register with network server")
             return
         
         # Start node server
@@ -52,12 +78,20 @@ class StorageNode:
         # Start heartbeat
         threading.Thread(target=self._heartbeat_loop, daemon=True).start()
         
+        # Start transfer progress reporting
+        threading.Thread(target=self._progress_report_loop, daemon=True).start()
+        
+        if self.metrics_port is not None:
+            start_http_server(self.metrics, self.metrics_port)
+        
         print(f"\n{'='*60}")
         print(f"Storage Node Running")
         print(f"{'='*60}")
         print(f"Node ID: {self.node_id}")
         print(f"Port: {self.node_port}")
         print(f"Storage: {self.used_storage/(1024**3):.2f}/{self.storage_capacity/(1024**3):.2f} GB")
+        if self.metrics_port is not None:
+            print(f"Metrics: http://0.0.0.0:{self.metrics_port}/metrics")
         print(f"{'='*60}\n")
         
         # Keep running
@@ -82,7 +116,8 @@ class StorageNode:
                 'ip': local_ip,
                 'port': self.node_port,
                 'storage_capacity': self.storage_capacity,
-                'used_storage': self.used_storage
+                'used_storage': self.used_storage,
+                'bandwidth_capacity': self.bandwidth_capacity
             }
             
             sock.send(json.dumps(message).encode('utf-8'))
@@ -91,7 +126,7 @@ class StorageNode:
             
             return response.get('status') == 'success'
         except Exception as e:
-            print(f"❌ Registration error: {e}")
+            log.error(f"❌ Registration error: {e}")
             return False
     
     def _heartbeat_loop(self):
@@ -111,10 +146,50 @@ class StorageNode:
                 sock.recv(1024)
                 sock.close()
             except Exception as e:
-                print(f"⚠️  Heartbeat failed: {e}")
+                log.warning(f"⚠️  Heartbeat failed: {e}")
             
             time.sleep(10)
     
+    def _record_progress(self, transfer_id, nbytes, file_size=None, done=False, status='completed'):
+        """Accumulate bytes moved for a transfer until the next report"""
+        with self.progress_lock:
+            entry = self.pending_progress.setdefault(transfer_id, {
+                'transfer_id': transfer_id,
+                'bytes': 0,
+                'file_size': file_size,
+                'done': False
+            })
+            entry['bytes'] += nbytes
+            if done:
+                entry['done'] = True
+                entry['status'] = status
+    
+    def _progress_report_loop(self):
+        """Send accumulated transfer progress to network server every second"""
+        while self.running:
+            time.sleep(1)
+            with self.progress_lock:
+                updates = list(self.pending_progress.values())
+                self.pending_progress = {}
+            if not updates:
+                continue
+            
+            # Keep each message well under the server's receive buffer
+            for i in range(0, len(updates), 50):
+                try:
+                    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                    sock.connect((self.network_host, self.network_port))
+                    message = {
+                        'type': 'transfer_progress',
+                        'node_id': self.node_id,
+                        'updates': updates[i:i + 50]
+                    }
+                    sock.send(json.dumps(message).encode('utf-8'))
+                    sock.recv(1024)
+                    sock.close()
+                except Exception as e:
+                    log.warning(f"⚠️  Progress report failed: {e}")
+    
     def _start_node_server(self):
         """Start server to handle file operations"""
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -132,10 +207,11 @@ class StorageNode:
                 ).start()
             except Exception as e:
                 if self.running:
-                    print(f"❌ Server error: {e}")
+                    log.error(f"❌ Server error: {e}")
     
     def _handle_request(self, client_socket):
         """Handle incoming requests"""
+        label = 'unknown'
         try:
             # Receive request
             data = b''
@@ -147,6 +223,8 @@ class StorageNode:
             
             request = json.loads(data.decode('utf-8'))
             request_type = request.get('type')
+            label = request_type if request_type in REQUEST_TYPES else 'unknown'
+            self.requests.inc(type=label)
             
             if request_type == 'upload':
                 response = self._handle_upload(request, client_socket)
@@ -154,13 +232,18 @@ class StorageNode:
                 response = self._handle_download(request, client_socket)
             elif request_type == 'delete':
                 response = self._handle_delete(request)
+            elif request_type == 'replicate':
+                response = self._handle_replicate(request)
             else:
                 response = {'status': 'error', 'message': 'Unknown request'}
             
+            if response and response.get('status') == 'error':
+                self.request_errors.inc(type=label)
             if request_type != 'download':  # Download sends file directly
                 client_socket.send(json.dumps(response).encode('utf-8'))
         except Exception as e:
-            print(f"❌ Request handling error: {e}")
+            self.request_errors.inc(type=label)
+            log.error(f"❌ Request handling error: {e}", extra={'fields': {'event': 'request_error', 'type': label}})
             client_socket.send(json.dumps({
                 'status': 'error',
                 'message': str(e)
@@ -173,29 +256,44 @@ class StorageNode:
         file_id = request.get('file_id')
         file_name = request.get('file_name')
         file_size = request.get('file_size')
+        transfer_id = request.get('transfer_id') or f"local-{file_id}"
         
         # Check storage
         if self.used_storage + file_size > self.storage_capacity:
             return {'status': 'error', 'message': 'Insufficient storage'}
         
-        # Prepare to receive file
-        file_path = self.storage_path / file_id
-        
-        print(f"📥 Receiving: {file_name} ({file_size/(1024**2):.2f} MB)")
+        log.debug(f"📥 Receiving: {file_name} ({file_size/(1024**2):.2f} MB)")
         
         # Send ready signal
         client_socket.send(b'READY')
+        started = time.perf_counter()
         
         # Receive file data
         received = 0
-        with open(file_path, 'wb') as f:
+        writer = self.engine.open_writer(file_id, file_size)
+        try:
             while received < file_size:
                 chunk_size = min(8192, file_size - received)
                 chunk = client_socket.recv(chunk_size)
                 if not chunk:
                     break
-                f.write(chunk)
+                writer.write(chunk)
                 received += len(chunk)
+                self._record_progress(transfer_id, len(chunk), file_size)
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            self.bytes_in.inc(received)
+        
+        if received < file_size:
+            writer.abort()
+            self._record_progress(transfer_id, 0, file_size, done=True, status='failed')
+            return {'status': 'error', 'message': 'Incomplete upload', 'bytes_received': received}
+        writer.commit()
+        self.read_cache.invalidate(file_id)
+        self._record_progress(transfer_id, 0, file_size, done=True)
+        self.transfer_duration.observe(time.perf_counter() - started, direction='upload')
         
         # Update storage
         self.used_storage += file_size
@@ -206,26 +304,29 @@ class StorageNode:
             'upload_time': time.time()
         }
         
-        print(f"✅ Uploaded: {file_name} | Storage: {self.used_storage/(1024**3):.2f}/{self.storage_capacity/(1024**3):.2f} GB\n")
+        log.info(
+            f"✅ Uploaded: {file_name} | Storage: {self.used_storage/(1024**3):.2f}/{self.storage_capacity/(1024**3):.2f} GB",
+            extra={'fields': {'event': 'uploaded', 'file_id': file_id, 'size': file_size}}
+        )
         
         return {'status': 'success', 'bytes_received': received}
     
     def _handle_download(self, request, client_socket):
         """Handle file download"""
         file_id = request.get('file_id')
-        file_path = self.storage_path / file_id
+        transfer_id = request.get('transfer_id') or f"local-{file_id}"
+        file_size, chunks = self._read_object(file_id)
         
-        if not file_path.exists():
+        if chunks is None:
             client_socket.send(json.dumps({
                 'status': 'error',
                 'message': 'File not found'
             }).encode('utf-8'))
             return
         
-        file_size = file_path.stat().st_size
         file_name = self.files.get(file_id, {}).get('file_name', 'unknown')
         
-        print(f"📤 Sending: {file_name} ({file_size/(1024**2):.2f} MB)")
+        log.debug(f"📤 Sending: {file_name} ({file_size/(1024**2):.2f} MB)")
         
         # Send file info
         client_socket.send(json.dumps({
@@ -237,48 +338,116 @@ class StorageNode:
         client_socket.recv(1024)
         
         # Send file data
-        with open(file_path, 'rb') as f:
-            while True:
-                chunk = f.read(8192)
-                if not chunk:
-                    break
-                client_socket.send(chunk)
+        started = time.perf_counter()
+        for chunk in chunks:
+            client_socket.sendall(chunk)
+            self.bytes_out.inc(len(chunk))
+            self._record_progress(transfer_id, len(chunk), file_size)
+        self._record_progress(transfer_id, 0, file_size, done=True)
+        self.transfer_duration.observe(time.perf_counter() - started, direction='download')
+        
+        log.info(f"✅ Sent: {file_name}", extra={'fields': {'event': 'sent', 'file_id': file_id, 'size': file_size}})
+    
+    def _read_object(self, file_id):
+        """(size, chunks) of an object, served from the read cache when it is hot; (None, None) if missing"""
+        cached = self.read_cache.get(file_id)
+        if cached is not None:
+            return len(cached), [cached]
+        
+        # Size taken once: the object can be deleted between the two engine calls
+        size = self.engine.size(file_id)
+        if size is None:
+            return None, None
+        chunks = self.engine.read_chunks(file_id)
+        if chunks is None:
+            return None, None
+        if size > CACHE_MAX_OBJECT:
+            return size, chunks
         
-        print(f"✅ Sent: {file_name}\n")
+        # Small enough to cache: read it whole and offer it to the cache
+        data = b''.join(bytes(c) for c in chunks)
+        self.read_cache.put(file_id, data)
+        return len(data), [data]
+    
+    def _handle_replicate(self, request):
+        """Copy an object to another node (hot-object promotion)"""
+        file_id = request.get('file_id')
+        target = request.get('target')
+        file_size, chunks = self._read_object(file_id)
+        if chunks is None:
+            return {'status': 'error', 'message': 'File not found'}
+        
+        sock = socket.create_connection((target['ip'], target['port']), timeout=30)
+        try:
+            sock.sendall(json.dumps({
+                'type': 'upload',
+                'file_id': file_id,
+                'file_name': self.files.get(file_id, {}).get('file_name', file_id),
+                'file_size': file_size,
+                'transfer_id': request.get('transfer_id')
+            }).encode('utf-8'))
+            ready = sock.recv(1024)
+            if ready != b'READY':
+                return json.loads(ready.decode('utf-8'))
+            
+            started = time.perf_counter()
+            for chunk in chunks:
+                sock.sendall(chunk)
+                self.bytes_out.inc(len(chunk))
+            response = json.loads(sock.recv(4096).decode('utf-8'))
+            self.transfer_duration.observe(time.perf_counter() - started, direction='replicate')
+        finally:
+            sock.close()
+        
+        log.info(f"📡 Replicated {file_id} to {target['node_id']}",
+                 extra={'fields': {'event': 'replicated', 'file_id': file_id, 'node_id': target['node_id']}})
+        return response
     
     def _handle_delete(self, request):
         """Handle file deletion"""
         file_id = request.get('file_id')
-        file_path = self.storage_path / file_id
+        self.read_cache.invalidate(file_id)
+        file_size = self.engine.delete(file_id)
         
-        if file_path.exists():
-            file_size = file_path.stat().st_size
-            file_path.unlink()
+        if file_size is not None:
             self.used_storage -= file_size
             
             if file_id in self.files:
                 file_name = self.files[file_id]['file_name']
                 del self.files[file_id]
-                print(f"🗑️  Deleted: {file_name}\n")
+                log.info(f"🗑️  Deleted: {file_name}", extra={'fields': {'event': 'deleted', 'file_id': file_id}})
             
             return {'status': 'success'}
         
         return {'status': 'error', 'message': 'File not found'}
     
+    def _collect_metrics(self):
+        """Refresh storage and cache gauges before a scrape"""
+        self.storage_gauge.set(shutil.disk_usage(self.storage_path).free, kind='disk_free')
+        self.storage_gauge.set(self.used_storage, kind='used')
+        self.storage_gauge.set(self.storage_capacity, kind='capacity')
+        for stat, value in self.read_cache.stats().items():
+            self.cache_gauge.set(value, stat=stat)
+    
     def stop(self):
         """Stop the node"""
         print(f"\n🛑 Stopping node {self.node_id}...")
         self.running = False
+        self.engine.close()
 
 if __name__ == '__main__':
     # Parse command line arguments
     network_host = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
     capacity_gb = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    engine = sys.argv[3] if len(sys.argv) > 3 else 'flat'
+    metrics_port = int(sys.argv[4]) if len(sys.argv) > 4 else None
     
     node = StorageNode(
         network_host=network_host,
         network_port=9000,
-        capacity_gb=capacity_gb
+        capacity_gb=capacity_gb,
+        engine=engine,
+        metrics_port=metrics_port
     )
     
     try:
@@ -0,0 +1,57 @@
+"""
+Shared fixtures: app.py imported once against a scratch SQLite database and
+working directory (uploads land in tmp/certs/uploads), with FakePinata for
+IPFS, no chain and no admission limits.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+
+@pytest.fixture(scope='session')
+def certichain(tmp_path_factory):
+    from fake_pinata import FakePinata
+
+    workdir = tmp_path_factory.mktemp('app')
+    pinata = FakePinata().start()
+    os.environ.update({
+        'DATABASE_URL': f"sqlite:///{workdir / 'test.db'}",
+        'PINATA_API_URL': pinata.url, 'PINATA_API_KEY': 'test', 'PINATA_SECRET_KEY': 'test',
+        'IPFS_SWEEP_INTERVAL': '0', 'INDEXER_ENABLED': 'false', 'CACHE_URL': '',
+        'VERIFY_RATE_PER_IP': '0', 'VERIFY_GLOBAL_RATE': '0', 'VERIFY_MAX_INFLIGHT': '0',
+    })
+    previous = os.getcwd()
+    os.chdir(workdir)
+    import app as certichain
+
+    certichain.app.config['TESTING'] = True
+    certichain.services.contract = None
+    with certichain.app.app_context():
+        certichain.migrations.upgrade()
+    yield certichain
+    os.chdir(previous)
+    pinata.stop()
+
+
+@pytest.fixture
+def institution(certichain):
+    """(institution id, test client logged in as that institution)"""
+    import uuid
+    from models import db, Institution
+
+    with certichain.app.app_context():
+        institution = Institution(name='Test', email=f'{uuid.uuid4().hex}@test.local')
+        institution.set_password('test')
+        db.session.add(institution)
+        db.session.commit()
+        institution_id = institution.id
+    client = certichain.app.test_client()
+    with client.session_transaction() as session:
+        session['institution_id'] = institution_id
+    return institution_id, client
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+from web3 import Web3
+
+from bulk_verify import BulkVerifier
+
+KNOWN, UNKNOWN = '0x' + '01' * 32, '0x' + '02' * 32
+
+
+class StandInContract:
+    """getCertificates(ids) and the ABI encoding of certificates(id); `getter_error` makes the getter fail"""
+
+    address = '0x' + '6d' * 20
+
+    def __init__(self, getter_error=None):
+        self.functions = self
+        self.getter_error = getter_error
+        self.getter_calls = 0
+
+    def getCertificates(self, ids):
+        self.getter_calls += 1
+        return self
+
+    def call(self, block_identifier=None):
+        if self.getter_error:
+            raise self.getter_error
+        return ['ipfs'], ['Ada'], [1700000000], [True]
+
+    def encodeABI(self, fn_name, args):
+        return args[0]
+
+
+def per_id_batch(calls):
+    """JSON-RPC batch of eth_call certificates(id): only KNOWN exists"""
+    w3 = Web3()
+    return ['0x' + w3.codec.encode(['string', 'string', 'uint256', 'bool'],
+                                   ['ipfs', 'Ada', 1700000000, params[0]['data'] == KNOWN]).hex()
+            for _, params in calls]
+
+
+def verifier(contract, functions):
+    w3 = SimpleNamespace(provider=None, codec=Web3().codec)
+    return BulkVerifier(w3, contract, batch=per_id_batch, functions=functions)
+
+
+def test_the_getter_is_used_when_the_deployed_contract_has_it():
+    contract = StandInContract()
+
+    assert verifier(contract, {'getCertificates'}).chain_certificates([KNOWN]) == {KNOWN: ('Ada', 1700000000, 'ipfs')}
+    assert contract.getter_calls == 1
+
+
+def test_an_older_contract_is_read_id_by_id():
+    contract = StandInContract()
+
+    assert verifier(contract, {'certificates'}).chain_certificates([KNOWN, UNKNOWN]) == \
+        {KNOWN: ('Ada', 1700000000, 'ipfs')}
+    assert contract.getter_calls == 0
+
+
+def test_an_rpc_error_from_the_getter_is_not_taken_for_an_older_contract():
+    contract = StandInContract(getter_error=TimeoutError('RPC timeout'))
+
+    with pytest.raises(TimeoutError):
+        verifier(contract, {'getCertificates'}).chain_certificates([KNOWN])
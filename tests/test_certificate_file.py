@@ -0,0 +1,69 @@
+import io
+
+TX_HASH = '0x' + 'ab' * 32
+
+
+def _anchored_certificate(certichain, client):
+    """Certificate created through the API, then stamped as create_certificate does after its receipt"""
+    from models import db, Certificate
+    from pdf_generator import stamp_blockchain_hash
+
+    response = client.post('/api/certificates/create', json={
+        'certificate_type': 'badge', 'recipient_name': 'Ada Lovelace', 'domain': 'Informatique',
+        'badge_name': 'Analyse'})
+    assert response.status_code == 201
+    cert_id = response.get_json()['certificate_id']
+
+    path = certichain.certificate_file_path(cert_id)
+    with open(path, 'rb') as f:
+        original = f.read()
+    with open(path, 'ab') as f:
+        f.write(stamp_blockchain_hash(original, 'badge', TX_HASH))
+    with certichain.app.app_context():
+        cert = db.session.get(Certificate, cert_id)
+        cert.blockchain_hash, cert.status = TX_HASH, 'issued'
+        db.session.commit()
+    return cert_id, original
+
+
+def test_download_serves_the_stamped_file_and_it_verifies(certichain, institution):
+    _, client = institution
+    cert_id, original = _anchored_certificate(certichain, client)
+
+    download = client.get(f'/certificate/{cert_id}/download')
+    assert download.status_code == 200
+    with open(certichain.certificate_file_path(cert_id), 'rb') as f:
+        assert download.data == f.read()
+    assert download.data.startswith(original) and len(download.data) > len(original)
+
+    result = certichain.app.test_client().post(
+        '/verify', data={'file': (io.BytesIO(download.data), 'download.pdf')},
+        content_type='multipart/form-data').get_json()
+    assert result['verified'] is True
+
+
+def test_download_without_stored_file_is_404(certichain, institution):
+    import os
+
+    _, client = institution
+    cert_id, _ = _anchored_certificate(certichain, client)
+    os.remove(certichain.certificate_file_path(cert_id))
+    assert client.get(f'/certificate/{cert_id}/download').status_code == 404
+
+
+def test_sweeper_pins_the_anchored_revision(certichain, institution):
+    from ipfs_cid import compute_cid
+    from models import db, Certificate
+
+    _, client = institution
+    cert_id, original = _anchored_certificate(certichain, client)
+    with certichain.app.app_context():
+        Certificate.query.update({'ipfs_pinned': False})
+        db.session.commit()
+        cert = db.session.get(Certificate, cert_id)
+        assert cert.ipfs_hash == compute_cid(original)
+
+        assert certichain.repin_missing_certificates() >= 1
+        db.session.expire_all()
+        assert db.session.get(Certificate, cert_id).ipfs_pinned is True
+        assert certichain.repin_missing_certificates() == 0
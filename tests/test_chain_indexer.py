@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from web3 import Web3
+
+from chain_indexer import deployment_block, issued_tx_hash
+
+
+class StandInEth:
+    """eth.get_code / eth.block_number for a contract deployed at `deployed`"""
+
+    def __init__(self, deployed, head, archive=True):
+        self.deployed = deployed
+        self.block_number = head
+        self.archive = archive
+        self.calls = 0
+
+    def get_code(self, address, block):
+        self.calls += 1
+        if not self.archive and block < self.block_number - 128:
+            raise ValueError('missing trie node')
+        return b'\x60\x80' if self.deployed is not None and block >= self.deployed else b''
+
+
+class StandInWeb3:
+    def __init__(self, eth):
+        self.eth = eth
+
+
+@pytest.mark.parametrize('deployed', [0, 1, 4_242_424, 5_000_000])
+def test_deployment_block_is_found_by_bisection(deployed):
+    eth = StandInEth(deployed, head=5_000_000)
+
+    assert deployment_block(StandInWeb3(eth), '0xregistry') == deployed
+    assert eth.calls <= 25
+
+
+def test_deployment_block_requires_a_contract():
+    with pytest.raises(RuntimeError, match='Aucun contrat'):
+        deployment_block(StandInWeb3(StandInEth(None, head=100)), '0xregistry')
+
+
+def test_deployment_block_without_archive_state_asks_for_the_setting():
+    with pytest.raises(RuntimeError, match='INDEXER_START_BLOCK'):
+        deployment_block(StandInWeb3(StandInEth(10, head=5_000_000, archive=False)), '0xregistry')
+
+
+class StandInLogChain:
+    """Blocks 12 s apart from t=1_000_000 and one CertificateIssued log at `mined_at`"""
+
+    def __init__(self, mined_at, head=10_000, cert_id='0x' + 'aa' * 32):
+        self.block_number = head
+        self.mined_at = mined_at
+        self.cert_id = cert_id
+        self.queries = []
+
+    def get_block(self, number):
+        return {'timestamp': 1_000_000 + 12 * number}
+
+    def get_logs(self, params):
+        self.queries.append(params)
+        if params['topics'][1] == self.cert_id and params['fromBlock'] <= self.mined_at <= params['toBlock']:
+            return [{'transactionHash': bytes.fromhex('cd' * 32)}]
+        return []
+
+
+def _log_web3(eth):
+    w3 = Web3()
+    return SimpleNamespace(eth=eth, to_hex=w3.to_hex, keccak=w3.keccak)
+
+
+def test_issued_tx_hash_reads_the_event_near_the_issue_date():
+    eth = StandInLogChain(mined_at=7_321)
+    contract = SimpleNamespace(address='0xregistry')
+
+    tx_hash = issued_tx_hash(_log_web3(eth), contract, '0x' + 'aa' * 32, 1_000_000 + 12 * 7_321)
+
+    assert tx_hash == '0x' + 'cd' * 32
+    assert eth.queries[0]['fromBlock'] == 7_321
+    assert eth.queries[0]['topics'][0] == Web3.to_hex(Web3.keccak(text='CertificateIssued(bytes32,string,string,uint256)'))
+
+
+def test_issued_tx_hash_is_none_without_the_event():
+    eth = StandInLogChain(mined_at=7_321)
+
+    assert issued_tx_hash(_log_web3(eth), SimpleNamespace(address='0xregistry'), '0x' + 'bb' * 32,
+                          1_000_000 + 12 * 7_321) is None
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+
+CONCURRENT = 6
+
+
+def payload(name):
+    return {'certificate_type': 'badge', 'recipient_name': name, 'recipient_email': '',
+            'domain': 'Informatique', 'badge_name': f'Badge {name}'}
+
+
+def create(client, body, key):
+    return client.post('/api/certificates/create', json=body, headers={'Idempotency-Key': key})
+
+
+def certificates(certichain, institution_id):
+    from models import Certificate
+
+    with certichain.app.app_context():
+        return Certificate.query.filter_by(institution_id=institution_id).count()
+
+
+def stored_key(certichain, institution_id, key):
+    from models import IdempotencyKey
+
+    with certichain.app.app_context():
+        return IdempotencyKey.query.filter_by(institution_id=institution_id, key=key).first()
+
+
+def test_retries_replay_the_first_response(certichain, institution):
+    institution_id, client = institution
+
+    first = create(client, payload('Ada'), 'retry')
+    retries = [create(client, payload('Ada'), 'retry') for _ in range(2)]
+
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+    for again in retries:
+        assert again.headers['Idempotent-Replayed'] == 'true'
+        assert (again.status_code, again.get_data()) == (first.status_code, first.get_data())
+    assert certificates(certichain, institution_id) == 1
+
+
+def test_concurrent_duplicates_wait_for_the_first_result(certichain, institution):
+    institution_id, _ = institution
+    responses = [None] * CONCURRENT
+    barrier = threading.Barrier(CONCURRENT)
+
+    def send(slot):
+        client = certichain.app.test_client()
+        with client.session_transaction() as session:
+            session['institution_id'] = institution_id
+        barrier.wait()
+        responses[slot] = create(client, payload('Grace'), 'concurrent')
+
+    threads = [threading.Thread(target=send, args=(slot,)) for slot in range(CONCURRENT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [response.status_code for response in responses] == [201] * CONCURRENT
+    assert len({response.get_json()['certificate_id'] for response in responses}) == 1
+    assert sum(response.headers.get('Idempotent-Replayed') == 'true' for response in responses) == CONCURRENT - 1
+    assert certificates(certichain, institution_id) == 1
+
+
+def test_the_same_key_with_another_body_is_refused(certichain, institution):
+    institution_id, client = institution
+    create(client, payload('Ada'), 'mismatch')
+
+    response = create(client, payload('Alan'), 'mismatch')
+
+    assert response.status_code == 422
+    assert certificates(certichain, institution_id) == 1
+
+
+def test_a_failed_request_releases_its_key(certichain, institution):
+    institution_id, client = institution
+
+    failed = create(client, dict(payload('Ada'), certificate_type='unknown'), 'failing')
+
+    assert failed.status_code == 400
+    assert stored_key(certichain, institution_id, 'failing') is None
+    assert create(client, payload('Ada'), 'failing').status_code == 201
+
+
+def test_an_expired_key_is_a_new_request(certichain, institution):
+    from models import db, IdempotencyKey
+
+    institution_id, client = institution
+    create(client, payload('Ada'), 'expiring')
+    with certichain.app.app_context():
+        IdempotencyKey.query.filter_by(institution_id=institution_id, key='expiring') \
+            .update({'expires_at': datetime.utcnow() - timedelta(seconds=1)})
+        db.session.commit()
+
+    again = create(client, payload('Ada'), 'expiring')
+
+    assert again.status_code == 201
+    assert 'Idempotent-Replayed' not in again.headers
+    assert certificates(certichain, institution_id) == 2
+
+
+def test_a_key_abandoned_by_a_dead_request_is_taken_over(certichain, institution):
+    from models import db, IdempotencyKey
+
+    institution_id, client = institution
+    body = payload('Ada')
+    digest = hashlib.sha256(
+        f"POST /api/certificates/create\n{json.dumps(body, sort_keys=True, separators=(',', ':'))}".encode()
+    ).hexdigest()
+    now = datetime.utcnow()
+    with certichain.app.app_context():
+        db.session.add(IdempotencyKey(
+            institution_id=institution_id, key='abandoned', fingerprint=digest, status='processing',
+            owner='dead-worker', created_at=now, expires_at=now + timedelta(days=1),
+            locked_at=now - timedelta(seconds=certichain.IDEMPOTENCY_LOCK_TIMEOUT + 1)))
+        db.session.commit()
+
+    response = create(client, body, 'abandoned')
+
+    assert response.status_code == 201
+    assert stored_key(certichain, institution_id, 'abandoned').status == 'done'
+    assert certificates(certichain, institution_id) == 1
+
+
+def test_a_failure_before_the_certificate_is_recorded_leaves_nothing_behind(certichain, institution, monkeypatch):
+    institution_id, client = institution
+
+    def unreadable(path):
+        raise OSError('disk error')
+
+    monkeypatch.setattr(certichain, 'generate_file_hash', unreadable)
+    failed = create(client, payload('Ada'), 'early-failure')
+    monkeypatch.undo()
+
+    assert failed.status_code == 400
+    assert certificates(certichain, institution_id) == 0
+    assert create(client, payload('Ada'), 'early-failure').status_code == 201
+    assert certificates(certichain, institution_id) == 1
+
+
+def test_a_failure_after_the_certificate_is_recorded_is_replayed_not_redone(certichain, institution, monkeypatch):
+    institution_id, client = institution
+
+    def pinning_down(*args):
+        raise RuntimeError('pin pool shut down')
+
+    monkeypatch.setattr(certichain, 'pin_in_background', pinning_down)
+    first = create(client, payload('Ada'), 'late-failure')
+    monkeypatch.undo()
+    again = create(client, payload('Ada'), 'late-failure')
+
+    assert first.status_code == 201
+    assert again.headers['Idempotent-Replayed'] == 'true'
+    assert again.get_json()['certificate_id'] == first.get_json()['certificate_id']
+    assert certificates(certichain, institution_id) == 1
@@ -0,0 +1,29 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from bench_import import _env, cold_import_ms
+
+# Median cold `import app`; about 0.5 s today, web3 alone would add more than 1 s
+BUDGET_MS = float(os.getenv('IMPORT_BUDGET_MS', '1500'))
+HEAVY_MODULES = ('web3', 'reportlab')
+
+PROBE = (
+    "import json, sys; import app; "
+    f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+)
+
+
+def test_import_app_leaves_heavy_modules_out(tmp_path):
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=tmp_path, env=_env(str(tmp_path)),
+                         capture_output=True, text=True, check=True)
+
+    assert json.loads(out.stdout.strip().splitlines()[-1]) == []
+
+
+def test_import_app_median_is_within_budget(tmp_path):
+    samples = cold_import_ms(5, str(tmp_path))
+
+    assert statistics.median(samples) <= BUDGET_MS, samples
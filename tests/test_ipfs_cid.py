@@ -0,0 +1,86 @@
+"""
+compute_cid against fixed vectors, against dag-pb blocks assembled byte by
+byte from the UnixFS spec, and, where the kubo binary is on PATH, against
+`ipfs add --cid-version=1 --raw-leaves`.
+"""
+
+import base64
+import hashlib
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from ipfs_cid import compute_cid
+
+CHUNK = 256 * 1024
+TWO_CHUNKS = bytes(range(256)) * 1024 + b'tail'  # 256 KiB + 4 bytes
+MANY_CHUNKS = b''.join(hashlib.sha256(str(i).encode()).digest() * (CHUNK // 32) for i in range(176)) + b'!'
+
+
+@pytest.mark.parametrize('data, cid', [
+    (b'', 'bafkreihdwdcefgh4dqkjv67uzcmw7ojee6xedzdetojuzjevtenxquvyku'),
+    (b'hello world', 'bafkreifzjut3te2nhyekklss27nh3k72ysco7y32koao5eei66wof36n5e'),
+])
+def test_known_single_block_cids(data, cid):
+    assert compute_cid(data) == cid
+
+
+def varint(n):
+    out = b''
+    while n >= 0x80:
+        out += bytes([n & 0x7F | 0x80])
+        n >>= 7
+    return out + bytes([n])
+
+
+def raw_cid(block):
+    return b'\x01\x55\x12\x20' + hashlib.sha256(block).digest()  # CIDv1, raw, sha2-256
+
+
+def file_node(children):
+    """dag-pb block of a UnixFS file node over (cid, cumulative size, file size) children"""
+    block = b''
+    for cid, tsize, _ in children:
+        link = b'\x0a' + varint(len(cid)) + cid + b'\x12\x00' + b'\x18' + varint(tsize)  # Hash, Name '', Tsize
+        block += b'\x12' + varint(len(link)) + link
+    filesize = sum(size for _, _, size in children)
+    unixfs = b'\x08\x02' + b'\x18' + varint(filesize) + b''.join(b'\x20' + varint(size) for _, _, size in children)
+    block += b'\x0a' + varint(len(unixfs)) + unixfs
+    cid = b'\x01\x70\x12\x20' + hashlib.sha256(block).digest()  # CIDv1, dag-pb
+    return cid, len(block) + sum(tsize for _, tsize, _ in children), filesize
+
+
+def leaves(data):
+    return [(raw_cid(data[i:i + CHUNK]), len(data[i:i + CHUNK]), len(data[i:i + CHUNK]))
+            for i in range(0, len(data), CHUNK)]
+
+
+def base32(cid):
+    return 'b' + base64.b32encode(cid).decode().lower().rstrip('=')
+
+
+def test_a_file_over_one_chunk_is_a_node_over_raw_leaves():
+    assert compute_cid(TWO_CHUNKS) == base32(file_node(leaves(TWO_CHUNKS))[0])
+
+
+def test_more_than_174_leaves_add_a_level():
+    chunks = leaves(MANY_CHUNKS)
+    assert len(chunks) == 177
+    root = file_node([file_node(chunks[:174]), file_node(chunks[174:])])
+
+    assert compute_cid(MANY_CHUNKS) == base32(root[0])
+
+
+@pytest.mark.skipif(not shutil.which('ipfs'), reason='kubo (ipfs) not installed')
+@pytest.mark.parametrize('data', [b'', b'hello world', TWO_CHUNKS, MANY_CHUNKS], ids=['empty', 'small', '2-chunks', '177-chunks'])
+def test_matches_kubo(data, tmp_path):
+    env = dict(os.environ, IPFS_PATH=str(tmp_path / 'repo'))
+    subprocess.run(['ipfs', 'init', '--profile=test'], env=env, check=True, capture_output=True)
+    path = tmp_path / 'data'
+    path.write_bytes(data)
+    kubo = subprocess.run(['ipfs', 'add', '--only-hash', '--quieter', '--cid-version=1', '--raw-leaves', str(path)],
+                          env=env, check=True, capture_output=True, text=True).stdout.strip()
+
+    assert compute_cid(data) == kubo
@@ -0,0 +1,123 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import ipfs_client
+from fake_pinata import FakePinata
+from ipfs_cid import compute_cid
+from ipfs_client import IPFSClient, IPFSError
+
+BACKOFF = 0.5
+DATA = b'%PDF-1.4 certificate'
+
+
+@pytest.fixture
+def pinata():
+    """Starts FakePinata servers and stops them after the test"""
+    started = []
+
+    def start(**options):
+        started.append(FakePinata(**options).start())
+        return started[-1]
+
+    yield start
+    for server in started:
+        server.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Delays the client waits between attempts, without waiting or jitter"""
+    recorded = []
+    monkeypatch.setattr(ipfs_client, 'time', SimpleNamespace(sleep=recorded.append))
+    monkeypatch.setattr(ipfs_client, 'random', SimpleNamespace(uniform=lambda low, high: 1.0))
+    return recorded
+
+
+def client_for(server, **options):
+    options.setdefault('max_retries', 4)
+    options.setdefault('backoff', BACKOFF)
+    return IPFSClient('key', 'secret', base_url=server.url, **options)
+
+
+def test_transient_failures_are_retried_with_exponential_backoff(pinata, sleeps):
+    server = pinata(fail_first=2)
+
+    cid = client_for(server).pin_bytes(DATA)
+
+    assert cid == compute_cid(DATA)
+    assert server.requests == 3
+    assert sleeps == [BACKOFF, BACKOFF * 2]
+
+
+def test_retry_after_outlasts_the_backoff(pinata, sleeps):
+    server = pinata(fail_first=1, failure_status=429, retry_after=7)
+
+    assert client_for(server).pin_bytes(DATA) == compute_cid(DATA)
+    assert server.requests == 2
+    assert sleeps == [7]
+
+
+def test_a_client_error_is_not_retried(pinata, sleeps):
+    server = pinata()
+    client = IPFSClient('', '', base_url=server.url, backoff=BACKOFF)  # Pinata answers 401
+
+    with pytest.raises(IPFSError, match='HTTP 401'):
+        client.pin_bytes(DATA)
+    assert server.requests == 1
+    assert sleeps == []
+
+
+def test_retries_stop_after_max_retries(pinata, sleeps):
+    server = pinata(failure_rate=1.0)
+
+    with pytest.raises(IPFSError, match='HTTP 503'):
+        client_for(server, max_retries=3).pin_bytes(DATA)
+    assert server.requests == 4
+    assert sleeps == [BACKOFF, BACKOFF * 2, BACKOFF * 4]
+    assert server.pins == {}
+
+
+def test_connection_errors_are_retried(pinata, sleeps):
+    server = pinata()
+    url = server.url
+    server.stop()
+
+    with pytest.raises(IPFSError):
+        IPFSClient('key', 'secret', base_url=url, backoff=BACKOFF, max_retries=2).pin_bytes(DATA)
+    assert len(sleeps) == 2
+
+
+def test_sweeper_repins_once_pinata_recovers(certichain, institution, pinata, monkeypatch):
+    from models import db, Certificate
+
+    _, client = institution
+    response = client.post('/api/certificates/create', json={
+        'certificate_type': 'badge', 'recipient_name': 'Grace Hopper', 'domain': 'Informatique',
+        'badge_name': 'Compilateurs'})
+    cert_id = response.get_json()['certificate_id']
+    with certichain.app.app_context():
+        deadline = time.time() + 5
+        while not db.session.get(Certificate, cert_id).ipfs_pinned:  # background pin at creation
+            assert time.time() < deadline
+            time.sleep(0.05)
+            db.session.expire_all()
+        db.session.get(Certificate, cert_id).ipfs_pinned = False
+        db.session.commit()
+
+    down = pinata(failure_rate=1.0)
+    monkeypatch.setitem(certichain.services.__dict__, 'ipfs_client', client_for(down, max_retries=1, backoff=0))
+    with certichain.app.app_context():
+        certichain.repin_missing_certificates()
+        assert db.session.get(Certificate, cert_id).ipfs_pinned is False
+    assert down.requests >= 2  # each pin tried max_retries + 1 times
+
+    up = pinata()
+    monkeypatch.setitem(certichain.services.__dict__, 'ipfs_client', client_for(up))
+    with certichain.app.app_context():
+        assert certichain.repin_missing_certificates() >= 1
+        db.session.expire_all()
+        cert = db.session.get(Certificate, cert_id)
+        assert cert.ipfs_pinned is True
+        assert up.pins[cert.ipfs_hash]
@@ -0,0 +1,199 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class StandInContract:
+    """contract.functions.issueCertificate(s)(...) -> the call, recorded by StandInTransactions"""
+
+    def __init__(self):
+        self.functions = self
+
+    def issueCertificate(self, cert_id, ipfs, recipient):
+        return ('issueCertificate', [recipient])
+
+    def issueCertificates(self, cert_ids, ipfs_hashes, recipients):
+        return ('issueCertificates', list(recipients))
+
+
+class StandInTransactions:
+    """send() numbers the calls (the `fail_at`-th raises); wait() records what it waited for"""
+
+    def __init__(self, fail_at=None):
+        self.sent = []
+        self.waited = []
+        self.fail_at = fail_at
+
+    def send(self, call):
+        if len(self.sent) + 1 == self.fail_at:
+            raise ConnectionError('RPC node unreachable')
+        self.sent.append(call)
+        return len(self.sent)
+
+    def wait(self, pending):
+        self.waited.append(pending)
+        return {'transactionHash': bytes([pending]) * 32, 'status': 1}
+
+
+class StandInVerifier:
+    def __init__(self, on_chain):
+        self.on_chain = on_chain
+
+    def chain_certificates(self, cert_ids):
+        return {cid: ('', 0, '') for cid in cert_ids if cid in self.on_chain}
+
+
+@pytest.fixture
+def events(monkeypatch):
+    """CertificateIssued events readable over RPC: {certificate id: tx hash}"""
+    import chain_indexer
+
+    found = {}
+    monkeypatch.setattr(chain_indexer, 'issued_tx_hash', lambda w3, contract, cert_id, issue_date: found.get(cert_id))
+    return found
+
+
+@pytest.fixture
+def chain(certichain):
+    from web3 import Web3
+
+    services = certichain.services
+    saved = {name: services.__dict__.get(name) for name in
+             ('w3', 'contract', 'contract_functions', 'transactions', 'bulk_verifier')}
+    transactions = StandInTransactions()
+    services.w3, services.contract, services.transactions = Web3(), StandInContract(), transactions
+    yield services, transactions
+    for name, value in saved.items():
+        if value is None:
+            services.__dict__.pop(name, None)
+        else:
+            services.__dict__[name] = value
+    services.contract = None
+
+
+def _certificates(certichain, institution_id, names, **fields):
+    from models import db, Certificate
+
+    with certichain.app.app_context():
+        certs = [Certificate(institution_id=institution_id, certificate_type='badge', recipient_name=name,
+                             file_hash=f'{name}-{institution_id}', **fields) for name in names]
+        db.session.add_all(certs)
+        db.session.commit()
+        return [cert.id for cert in certs]
+
+
+def _statuses(certichain, ids):
+    from models import db, Certificate
+
+    with certichain.app.app_context():
+        return [db.session.get(Certificate, cert_id).status for cert_id in ids]
+
+
+def _hashes(certichain, ids):
+    from models import db, Certificate
+
+    with certichain.app.app_context():
+        return [db.session.get(Certificate, cert_id).blockchain_hash for cert_id in ids]
+
+
+def _cert_id(services, file_hash):
+    return services.w3.to_hex(services.w3.solidity_keccak(['string'], [file_hash]))
+
+
+def test_legacy_contract_gets_one_issue_per_certificate(certichain, institution, chain, events):
+    services, transactions = chain
+    institution_id, _ = institution
+    ids = _certificates(certichain, institution_id, ['a', 'b', 'c'], status='created')
+    known = _cert_id(services, f'b-{institution_id}')
+    events[known] = '0x' + 'bb' * 32
+    services.contract_functions = frozenset({'issueCertificate', 'certificates'})
+    services.bulk_verifier = StandInVerifier({known})
+
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 3
+    assert [call[0] for call in transactions.sent] == ['issueCertificate', 'issueCertificate']
+    assert _statuses(certichain, ids) == ['issued'] * 3
+    assert _hashes(certichain, ids)[1] == '0x' + 'bb' * 32
+
+
+def test_a_mined_but_unindexed_certificate_waits_for_its_transaction_hash(certichain, institution, chain, events):
+    from models import db, Certificate
+
+    services, transactions = chain
+    institution_id, client = institution
+    services.contract_functions = frozenset({'issueCertificate'})
+    # Created while the chain was unreachable, then mined after create_certificate gave up on its receipt
+    response = client.post('/api/certificates/create', json={
+        'certificate_type': 'badge', 'recipient_name': 'Katherine Johnson', 'domain': 'Informatique',
+        'badge_name': 'Trajectoires'})
+    cert_id = response.get_json()['certificate_id']
+    path = certichain.certificate_file_path(cert_id)
+    with open(path, 'rb') as f:
+        original = f.read()
+    with certichain.app.app_context():
+        known = _cert_id(services, db.session.get(Certificate, cert_id).file_hash)
+    services.bulk_verifier = StandInVerifier({known})
+
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 0  # event not readable yet
+    assert _statuses(certichain, [cert_id]) == ['created']
+    assert _hashes(certichain, [cert_id]) == [None]
+    assert transactions.sent == []
+
+    events[known] = '0x' + 'cd' * 32
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 1
+    assert _statuses(certichain, [cert_id]) == ['issued']
+    assert _hashes(certichain, [cert_id]) == ['0x' + 'cd' * 32]
+    with open(path, 'rb') as f:
+        stamped = f.read()
+    assert stamped.startswith(original) and len(stamped) > len(original)
+
+    result = certichain.app.test_client().post(
+        '/verify', data={'file': (io.BytesIO(stamped), 'cert.pdf')}, content_type='multipart/form-data')
+    assert result.get_json()['verified'] is True
+
+
+def test_a_failed_send_keeps_the_transactions_already_broadcast(certichain, institution, chain):
+    services, _ = chain
+    institution_id, _ = institution
+    transactions = services.transactions = StandInTransactions(fail_at=2)
+    services.contract_functions = frozenset({'issueCertificate'})
+    services.bulk_verifier = StandInVerifier(set())
+    ids = _certificates(certichain, institution_id, ['h', 'i', 'j'], status='created')
+
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 1
+    assert transactions.sent == [('issueCertificate', ['h'])]
+    assert transactions.waited == [1]
+    assert _statuses(certichain, ids) == ['issued', 'created', 'created']
+    assert _hashes(certichain, ids)[0] == '0x' + '01' * 32
+
+
+def test_batch_contract_gets_one_transaction(certichain, institution, chain):
+    services, transactions = chain
+    institution_id, _ = institution
+    ids = _certificates(certichain, institution_id, ['d', 'e'], status='created')
+    services.contract_functions = frozenset({'issueCertificate', 'issueCertificates'})
+    services.bulk_verifier = StandInVerifier(set())
+
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 2
+    assert transactions.sent == [('issueCertificates', ['d', 'e'])]
+    assert _statuses(certichain, ids) == ['issued'] * 2
+
+
+def test_in_flight_certificates_are_left_alone(certichain, institution, chain):
+    services, transactions = chain
+    institution_id, _ = institution
+    services.contract_functions = frozenset({'issueCertificate'})
+    services.bulk_verifier = StandInVerifier(set())
+    in_flight = _certificates(certichain, institution_id, ['f'], status='issuing')
+    stale = _certificates(certichain, institution_id, ['g'], status='issuing',
+                          updated_at=datetime.utcnow() - timedelta(seconds=certichain.ISSUE_CLAIM_TIMEOUT + 1))
+
+    with certichain.app.app_context():
+        assert certichain.issue_pending_certificates(institution_id) == 1
+    assert transactions.sent == [('issueCertificate', ['g'])]
+    assert _statuses(certichain, in_flight + stale) == ['issuing', 'issued']
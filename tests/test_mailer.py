@@ -0,0 +1,131 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('aiosmtpd')
+
+import mailer
+from bench_mail import StandIn, dispatcher_for, enqueue, make_app, start_server, statuses
+from models import db, OutboxMessage
+
+# AUTH without TLS is intended: the stand-in only listens on 127.0.0.1
+pytestmark = pytest.mark.filterwarnings('ignore:Requiring AUTH while not requiring TLS')
+
+
+class FlakyStandIn(StandIn):
+    """Answers 451 to the first DATA for each recipient in `flaky`; records deliveries by recipient"""
+
+    def __init__(self, flaky=()):
+        super().__init__()
+        self.flaky = set(flaky)
+        self.recipients = Counter()
+
+    async def handle_DATA(self, server, session, envelope):
+        with self.lock:
+            recipient = envelope.rcpt_tos[0]
+            if recipient in self.flaky:
+                self.flaky.discard(recipient)
+                return '451 4.3.0 Try again later'
+            self.recipients[recipient] += 1
+            self.delivered[envelope.content] += 1
+        return '250 Message accepted'
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    return make_app(str(tmp_path))
+
+
+@pytest.fixture
+def smtp():
+    """Starts stand-in SMTP servers and stops them after the test"""
+    started = []
+
+    def start(handler):
+        started.append(start_server(handler))
+        return started[-1]
+
+    yield start
+    for controller in started:
+        controller.stop()
+
+
+def rows(app):
+    with app.app_context():
+        return {row.recipient: (row.status, row.attempts, row.last_error)
+                for row in OutboxMessage.query.order_by(OutboxMessage.id)}
+
+
+def test_queued_messages_are_delivered_once(outbox, smtp):
+    handler = FlakyStandIn()
+    controller = smtp(handler)
+    enqueue(outbox, 5)
+
+    sent = dispatcher_for(outbox, controller).run_once()
+
+    assert sent == 5
+    assert statuses(outbox) == {'sent': 5}
+    assert handler.recipients == {f'recipient{i}@example.test': 1 for i in range(5)}
+    content = next(iter(handler.delivered)).decode()
+    assert 'Subject: Votre certificat est disponible' in content
+    assert 'From: noreply@certichain.test' in content
+
+
+def test_a_451_is_retried_later_and_delivered_once(outbox, smtp):
+    handler = FlakyStandIn(flaky={'recipient1@example.test'})
+    controller = smtp(handler)
+    enqueue(outbox, 3)
+    dispatcher = dispatcher_for(outbox, controller)
+
+    dispatcher.run_once()
+    status, attempts, error = rows(outbox)['recipient1@example.test']
+    assert (status, attempts) == ('pending', 1)  # scheduled RETRY_BASE seconds later
+    assert '451' in error
+    assert handler.recipients['recipient1@example.test'] == 0
+
+    with outbox.app_context():  # the retry falls due
+        OutboxMessage.query.update({'next_attempt_at': datetime.utcnow()})
+        db.session.commit()
+    dispatcher.run_once()
+
+    assert statuses(outbox) == {'sent': 3}
+    assert rows(outbox)['recipient1@example.test'][:2] == ('sent', 2)
+    assert set(handler.recipients.values()) == {1}
+
+
+def test_a_550_is_dead_lettered_without_retry(outbox, smtp, monkeypatch):
+    monkeypatch.setattr(mailer, 'RETRY_BASE', 0)  # a retry would be due immediately
+    handler = FlakyStandIn()
+    controller = smtp(handler)
+    enqueue(outbox, 4, bounce_every=2)  # recipient0 and recipient2 bounce
+
+    dispatcher_for(outbox, controller, max_attempts=5).run_once()
+
+    result = rows(outbox)
+    assert statuses(outbox) == {'sent': 2, 'dead': 2}
+    for bounced in ('recipient0@bounce.test', 'recipient2@bounce.test'):
+        status, attempts, error = result[bounced]
+        assert (status, attempts) == ('dead', 1)
+        assert '550' in error
+    assert sum(handler.recipients.values()) == 2
+
+
+def test_a_stale_claim_is_requeued_and_sent_once(outbox, smtp):
+    handler = FlakyStandIn()
+    controller = smtp(handler)
+    enqueue(outbox, 2)
+    now = datetime.utcnow()
+    with outbox.app_context():
+        # recipient0 claimed by a worker that died, recipient1 by one still sending
+        for i, claimed_at in ((0, now - timedelta(seconds=mailer.CLAIM_TIMEOUT + 1)), (1, now)):
+            OutboxMessage.query.filter_by(recipient=f'recipient{i}@example.test').update(
+                {'status': 'sending', 'claimed_by': f'worker-{i}', 'claimed_at': claimed_at})
+        db.session.commit()
+
+    dispatcher_for(outbox, controller).run_once()
+
+    result = rows(outbox)
+    assert result['recipient0@example.test'][:2] == ('sent', 1)
+    assert result['recipient1@example.test'][:2] == ('sending', 0)
+    assert handler.recipients == {'recipient0@example.test': 1}
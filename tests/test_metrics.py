@@ -0,0 +1,86 @@
+import pytest
+from flask import Flask, request
+
+import metrics
+
+
+class StandInSpan:
+    def __init__(self, name, exits):
+        self.name = name
+        self.exits = exits
+        self.attributes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.exits.append((self.name, exc_info[0]))
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class StandInTracer:
+    """start_as_current_span() / trace.get_current_span(), recording every span exit"""
+
+    def __init__(self):
+        self.exits = []
+        self.current = None
+
+    def start_as_current_span(self, name):
+        self.current = StandInSpan(name, self.exits)
+        return self.current
+
+    def get_current_span(self):
+        return self.current
+
+
+@pytest.fixture
+def traced_app(monkeypatch):
+    tracer = StandInTracer()
+    monkeypatch.setattr(metrics, '_tracer', tracer)
+    monkeypatch.setattr(metrics, 'trace', tracer)
+    app = Flask('test_metrics')
+    metrics.init_app(app)
+
+    @app.route('/ok')
+    def ok():
+        return 'ok'
+
+    @app.route('/broken-after')
+    def broken_after():
+        return 'ok'
+
+    @app.after_request
+    def fail_for_one_route(response):  # runs before metrics' after_request
+        if request.path == '/broken-after':
+            raise RuntimeError('after_request failed')
+        return response
+
+    return app, tracer
+
+
+def requests_total(route, status):
+    return metrics.REQUESTS.values.get(('GET', route, status), 0)
+
+
+def test_request_is_recorded_and_its_span_closed(traced_app):
+    app, tracer = traced_app
+    before = requests_total('/ok', 200)
+
+    assert app.test_client().get('/ok').status_code == 200
+
+    assert requests_total('/ok', 200) == before + 1
+    assert tracer.exits == [('GET /ok', None)]
+    assert tracer.current.attributes['http.status_code'] == 200
+
+
+def test_span_is_closed_when_after_request_raises(traced_app):
+    app, tracer = traced_app
+    before = requests_total('/broken-after', 500)
+
+    assert app.test_client().get('/broken-after').status_code == 500
+
+    assert requests_total('/broken-after', 500) == before + 1
+    assert len(tracer.exits) == 1
+    assert tracer.exits[0][0] == 'GET /broken-after'
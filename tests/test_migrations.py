@@ -0,0 +1,42 @@
+import pytest
+from flask import Flask
+from sqlalchemy import inspect, text
+
+import migrations
+from database import init_db
+from models import db
+
+
+@pytest.fixture
+def scratch_db(tmp_path):
+    app = Flask('test_migrations')
+    init_db(app, f"sqlite:///{tmp_path / 'scratch.db'}")
+    with app.app_context():
+        yield app
+
+
+def assert_hot_queries_use_indexes():
+    plans = migrations.query_plans()
+    assert migrations.unindexed_queries() == {}
+    for name in ('verify (file_hash)', 'verify-hash (blockchain_hash)', 'get_certificates (institution_id)'):
+        assert any('USING' in step and 'INDEX' in step for step in plans[name]), (name, plans[name])
+
+
+def test_migrations_index_the_hot_certificate_lookups(scratch_db):
+    migrations.upgrade()
+
+    assert migrations.pending() == []
+    assert_hot_queries_use_indexes()
+
+
+def test_migrations_add_missing_indexes_to_an_existing_database(scratch_db):
+    db.create_all()
+    with db.engine.begin() as conn:
+        for index in inspect(conn).get_indexes('certificates'):
+            conn.execute(text(f'DROP INDEX {index["name"]}'))
+        conn.execute(text('DELETE FROM schema_migrations'))
+    assert migrations.unindexed_queries()
+
+    migrations.upgrade()
+
+    assert_hot_queries_use_indexes()
@@ -0,0 +1,51 @@
+import re
+import time
+
+import pytest
+
+import pdf_generator
+
+TEMPLATES = {
+    'diplome': pdf_generator.create_diploma_pdf,
+    'certification': pdf_generator.create_certification_pdf,
+    'badge': pdf_generator.create_badge_pdf,
+}
+
+PAYLOAD = {
+    'recipient_name': 'Amina Diallo',
+    'domain': 'Informatique',
+    'mention': 'Très bien',
+    'graduation_date': '01/07/2025',
+    'institution_name': 'Université de Test',
+    'cert_number': 'CERT-2025-00001',
+    'duration': '180 crédits',
+    'blockchain_hash': '0x' + 'ab' * 32,
+}
+
+
+@pytest.fixture(scope='module')
+def renders():
+    """Each template rendered twice, more than a second apart (PDF dates have 1 s resolution)"""
+    first = {name: render(dict(PAYLOAD)).getvalue() for name, render in TEMPLATES.items()}
+    time.sleep(1.1)
+    second = {name: render(dict(PAYLOAD)).getvalue() for name, render in TEMPLATES.items()}
+    return first, second
+
+
+def dates(pdf):
+    return re.findall(rb'/(?:CreationDate|ModDate) *\(([^)]*)\)', pdf)
+
+
+@pytest.mark.parametrize('name', TEMPLATES)
+def test_template_renders_are_byte_identical(renders, name):
+    first, second = renders
+
+    assert first[name] == second[name]
+
+
+@pytest.mark.parametrize('name', TEMPLATES)
+def test_template_renders_share_creation_date(renders, name):
+    first, second = renders
+
+    assert re.search(rb'/CreationDate', first[name])
+    assert dates(first[name]) == dates(second[name])
@@ -0,0 +1,45 @@
+import pytest
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # backend_api creates ./uploads on import
+    from backend_api import QuotaLedger
+
+    return QuotaLedger({'u': {'storage_quota': 1000, 'used_storage': 100}})
+
+
+def test_reconcile_skips_while_an_upload_is_registered_but_not_committed(ledger):
+    network = [{'file_size': 100}]
+    reservation = ledger.reserve('u', 50)
+    network.append({'file_size': 50})  # register_file reached the network
+
+    assert ledger.reconcile('u', lambda user_id: network) is None
+    ledger.commit(reservation)
+    assert ledger.usage('u')['used_storage'] == 150
+    assert ledger.reconcile('u', lambda user_id: network) == 150
+
+
+def test_reconcile_skips_while_a_delete_is_under_way(ledger):
+    network = [{'file_size': 60}, {'file_size': 40}]
+    with ledger.mutation('u'):
+        network.pop()  # delete_file reached the network
+        assert ledger.reconcile('u', lambda user_id: network) is None
+        ledger.free('u', 40)
+    assert ledger.usage('u')['used_storage'] == 60
+    assert ledger.reconcile('u', lambda user_id: network) == 60
+
+
+def test_reconcile_retries_when_a_commit_lands_during_the_fetch(ledger):
+    reservation = ledger.reserve('u', 30)
+    ledger.commit(reservation)
+
+    def fetch(user_id):
+        if not fetch.calls:
+            ledger.commit(ledger.reserve('u', 20))  # stored + committed while listing
+        fetch.calls += 1
+        return [{'file_size': 130 + (20 if fetch.calls > 1 else 0)}]
+    fetch.calls = 0
+
+    assert ledger.reconcile('u', fetch) == 150
+    assert fetch.calls == 2
@@ -0,0 +1,92 @@
+import io
+import sqlite3
+
+import pytest
+from flask import Flask, jsonify
+
+import rate_limit
+from bench_rate_limit import CountingStream
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def buckets(request, tmp_path):
+    url = 'memory' if request.param == 'memory' else f"sqlite:///{tmp_path / 'buckets.db'}"
+    return rate_limit.make_buckets(url)
+
+
+class BrokenBuckets:
+    """A bucket store whose file is locked past its timeout"""
+
+    def take_all(self, buckets, cost=1):
+        raise sqlite3.OperationalError('database is locked')
+
+
+def limited_app(buckets, **options):
+    app = Flask('test_rate_limit')
+    app.secret_key = 'test'
+
+    @app.route('/verify', methods=['POST'])
+    def verify():
+        return jsonify({'verified': True})
+
+    options.setdefault('ip_rate', 1)
+    options.setdefault('burst_seconds', 2)
+    limiter = rate_limit.VerifyLimiter(buckets, key_rate=0, institution_rate=0, **options)
+    limiter.init_app(app, {'verify': {'POST'}})
+    return app, limiter
+
+
+def post(client, ip):
+    return client.post('/verify', data=b'x', environ_base={'REMOTE_ADDR': ip})
+
+
+def test_take_all_debits_every_bucket_or_none(buckets):
+    assert buckets.take_all([('ip:a', 1, 5), ('global', 1, 1)]) == [(True, 0.0), (True, 0.0)]
+
+    results = buckets.take_all([('ip:a', 1, 5), ('global', 1, 1)])
+
+    assert [allowed for allowed, _ in results] == [True, False]
+    assert 0 < results[1][1] <= 1
+    assert [buckets.take('ip:a', 0.001, 5)[0] for _ in range(5)] == [True] * 4 + [False]  # 4 tokens left
+
+
+def test_the_global_bucket_refusal_does_not_spend_the_ip_budget(buckets):
+    app, limiter = limited_app(buckets, ip_rate=0.001, global_rate=0.001, burst_seconds=2000)
+    client = app.test_client()
+    assert post(client, '192.0.2.1').status_code == 200
+    assert post(client, '192.0.2.1').status_code == 200  # both global tokens spent
+
+    for _ in range(5):
+        response = post(client, '192.0.2.2')
+        assert response.status_code == 429
+    limiter.global_rate = 0  # the global bucket no longer applies
+
+    assert [post(client, '192.0.2.2').status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_an_upload_without_content_length_is_refused_unread(buckets):
+    app, _ = limited_app(buckets, max_upload=1024)
+    stream = CountingStream(b'x' * 4096)
+
+    response = app.test_client().post('/verify', input_stream=stream, headers={'Transfer-Encoding': 'chunked'})
+
+    assert response.status_code == 411
+    assert getattr(stream, 'consumed', 0) == 0
+
+
+def test_an_upload_with_content_length_is_checked_against_the_limit(buckets):
+    app, _ = limited_app(buckets, max_upload=1024)
+    client = app.test_client()
+
+    assert client.post('/verify', data=io.BytesIO(b'x' * 512)).status_code == 200
+    assert client.post('/verify', data=io.BytesIO(b'x' * 4096)).status_code == 413
+
+
+def test_a_broken_bucket_store_admits_the_request():
+    app, _ = limited_app(BrokenBuckets(), global_rate=1)
+    errors = rate_limit.STORE_ERRORS.values.get((), 0)
+
+    response = post(app.test_client(), '192.0.2.1')
+
+    assert response.status_code == 200
+    assert rate_limit.STORE_ERRORS.values[()] == errors + 1
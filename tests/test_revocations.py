@@ -0,0 +1,204 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+ISSUER_FUNCTIONS = frozenset({'issueCertificate', 'revokeCertificate', 'isRevoked'})
+
+
+class StandInCall:
+    def __init__(self, result):
+        self.result = result
+
+    def call(self):
+        return self.result
+
+
+class StandInContract:
+    """revokeCertificate(...) -> the call sent; isRevoked(...) from `revoked`"""
+
+    def __init__(self):
+        self.functions = self
+        self.revoked = set()
+
+    def revokeCertificate(self, cert_id, reason):
+        return ('revokeCertificate', cert_id, reason)
+
+    def isRevoked(self, cert_id):
+        return StandInCall(cert_id in self.revoked)
+
+
+class StandInTransactions:
+    def __init__(self, contract):
+        self.contract = contract
+        self.sent = []
+        self.failing = False
+
+    def send(self, call):
+        if self.failing:
+            raise RuntimeError('nonce too low')
+        self.sent.append(call)
+        self.contract.revoked.add(call[1])
+        return len(self.sent)
+
+    def wait(self, pending):
+        return {'transactionHash': bytes([pending]) * 32, 'status': 1}
+
+
+@pytest.fixture
+def chain(certichain, monkeypatch):
+    from web3 import Web3
+
+    services = certichain.services
+    saved = {name: services.__dict__.get(name) for name in
+             ('w3', 'contract', 'contract_functions', 'transactions', 'issuer')}
+    contract = StandInContract()
+    transactions = StandInTransactions(contract)
+    services.w3, services.contract, services.transactions = Web3(), contract, transactions
+    services.issuer, services.contract_functions = '0xissuer', ISSUER_FUNCTIONS
+    monkeypatch.setattr(certichain, 'ISSUER_PRIVATE_KEY', '0xkey')
+    yield services, transactions
+    for name, value in saved.items():
+        if value is None:
+            services.__dict__.pop(name, None)
+        else:
+            services.__dict__[name] = value
+    services.contract = None
+
+
+def anchored_certificate(certichain, institution_id, name):
+    from models import db, Certificate
+
+    with certichain.app.app_context():
+        cert = Certificate(institution_id=institution_id, certificate_type='badge', recipient_name=name,
+                           file_hash=f'{name}-{institution_id}', blockchain_hash='0x' + 'ab' * 32, status='issued')
+        db.session.add(cert)
+        db.session.commit()
+        return cert.id, certichain.certificate_id(cert.file_hash)
+
+
+def revocation(certichain, cert_id, age=None):
+    """The revocation row; `age` moves it back in time past the retry delay"""
+    from models import db, Revocation
+
+    with certichain.app.app_context():
+        row = Revocation.query.filter_by(certificate_id=cert_id).one()
+        if age is not None:
+            row.revoked_at = datetime.utcnow() - age
+            db.session.commit()
+        return row.chain_pending, row.tx_hash
+
+
+def test_failed_chain_revocation_stays_pending_and_is_retried(certichain, institution, chain):
+    services, transactions = chain
+    institution_id, client = institution
+    db_id, cert_id = anchored_certificate(certichain, institution_id, 'retried')
+
+    transactions.failing = True
+    response = client.post(f'/api/certificates/{db_id}/revoke', json={'reason': 'fraude'})
+    assert response.get_json()['blockchain_error'] == 'nonce too low'
+    assert revocation(certichain, cert_id) == (True, None)
+
+    transactions.failing = False
+    with certichain.app.app_context():
+        assert certichain.retry_chain_revocations() == 0  # may still be waiting for its receipt
+    revocation(certichain, cert_id, age=timedelta(seconds=certichain.REVOCATION_RETRY_AFTER + 1))
+    with certichain.app.app_context():
+        assert certichain.retry_chain_revocations() == 1
+    assert transactions.sent == [('revokeCertificate', cert_id, 'fraude')]
+    pending, tx_hash = revocation(certichain, cert_id)
+    assert not pending and tx_hash == '0x' + '01' * 32
+
+
+def test_revocation_already_mined_is_settled_without_a_new_transaction(certichain, institution, chain):
+    services, transactions = chain
+    institution_id, client = institution
+    db_id, cert_id = anchored_certificate(certichain, institution_id, 'mined-late')
+    transactions.failing = True
+    client.post(f'/api/certificates/{db_id}/revoke', json={})
+    services.contract.revoked.add(cert_id)  # the first send was mined after its receipt timeout
+
+    revocation(certichain, cert_id, age=timedelta(hours=1))
+    with certichain.app.app_context():
+        assert certichain.retry_chain_revocations() == 1
+    assert transactions.sent == []
+    assert revocation(certichain, cert_id)[0] is False
+
+
+def test_contract_without_revoke_keeps_revocations_pending(certichain, institution, chain):
+    services, transactions = chain
+    institution_id, client = institution
+    db_id, cert_id = anchored_certificate(certichain, institution_id, 'legacy')
+    services.contract_functions = frozenset({'issueCertificate', 'certificates'})
+
+    response = client.post(f'/api/certificates/{db_id}/revoke', json={})
+
+    assert 'revokeCertificate' in response.get_json()['blockchain_error']
+    revocation(certichain, cert_id, age=timedelta(hours=1))
+    with certichain.app.app_context():
+        assert certichain.retry_chain_revocations() == 0
+    assert transactions.sent == []
+    assert revocation(certichain, cert_id) == (True, None)
+
+
+def test_unanchored_certificate_is_not_pending(certichain, institution, chain):
+    from models import db, Certificate
+
+    institution_id, client = institution
+    with certichain.app.app_context():
+        cert = Certificate(institution_id=institution_id, certificate_type='badge', recipient_name='local',
+                           file_hash=f'local-{institution_id}', status='created')
+        db.session.add(cert)
+        db.session.commit()
+        db_id, cert_id = cert.id, certichain.certificate_id(cert.file_hash)
+
+    client.post(f'/api/certificates/{db_id}/revoke', json={})
+
+    assert revocation(certichain, cert_id) == (False, None)
+
+
+class StandInEth:
+    def __init__(self, block_hash):
+        self.block_hash = block_hash
+
+    def get_block(self, number):
+        return {'hash': self.block_hash}
+
+
+class StandInWeb3:
+    """What ChainIndexer._check_reorg uses: eth.get_block and to_hex"""
+
+    def __init__(self, block_hash):
+        from web3 import Web3
+
+        self.eth = StandInEth(block_hash)
+        self.to_hex = Web3.to_hex
+
+
+def test_registry_reloads_after_an_indexer_rewind_even_when_ids_are_reused(certichain):
+    import chain_indexer
+    from models import db, IndexerState, Revocation
+    from revocation import RevocationRegistry
+
+    with certichain.app.app_context():
+        Revocation.query.delete()
+        db.session.add_all([Revocation(certificate_id=f'0xkept{i}', source='chain', block_number=100)
+                            for i in range(3)])
+        db.session.add(Revocation(certificate_id='0xorphaned', source='chain', block_number=190))
+        state = db.session.get(IndexerState, chain_indexer.STATE_NAME) or IndexerState(name=chain_indexer.STATE_NAME)
+        state.last_block, state.last_block_hash = 200, '0x' + '11' * 32
+        db.session.add(state)
+        db.session.commit()
+    registry = RevocationRegistry(certichain.app, refresh_interval=0)
+    assert registry.is_revoked('0xorphaned')
+
+    indexer = chain_indexer.ChainIndexer.__new__(chain_indexer.ChainIndexer)
+    indexer.w3, indexer.start_block = StandInWeb3(b'\x22' * 32), 0  # block 200 was reorganised away
+    with certichain.app.app_context():
+        indexer._check_reorg(db.session.get(IndexerState, chain_indexer.STATE_NAME))
+        assert Revocation.query.filter_by(certificate_id='0xorphaned').count() == 0
+        # A new revocation takes the freed id: same count and max(id) as before the rewind
+        db.session.add(Revocation(certificate_id='0xafter-rewind', source='app'))
+        db.session.commit()
+
+    assert registry.is_revoked('0xafter-rewind')
+    assert not registry.is_revoked('0xorphaned')
@@ -0,0 +1,102 @@
+import pytest
+from eth_hash.auto import keccak
+from web3 import Web3
+
+import rpc_pool
+from bench_rpc_pool import HEAD, FakeNode, make_pool
+
+
+@pytest.fixture
+def nodes(monkeypatch):
+    """Starts stand-in JSON-RPC nodes and stops them after the test"""
+    monkeypatch.setattr(rpc_pool, 'COOLDOWN', 0.5)
+    started = []
+
+    def start(**options):
+        node = FakeNode(**options).start()
+        started.append(node)
+        return node
+
+    yield start
+    for node in started:
+        try:
+            node.stop()
+        except OSError:
+            pass
+
+
+def test_requests_go_to_the_fastest_node(nodes):
+    fast, slow = nodes(latency=0.002), nodes(latency=0.03)
+    w3 = Web3(make_pool([slow, fast]))
+
+    for _ in range(50):
+        w3.eth.block_number
+
+    share = fast.count('eth_blockNumber') / (fast.count('eth_blockNumber') + slow.count('eth_blockNumber'))
+    assert share >= 0.9
+
+
+@pytest.mark.parametrize('bad_node', [
+    dict(failure_rate=1.0),
+    dict(rpc_error={'code': -32005, 'message': 'daily request count exceeded'}),
+    dict(head=HEAD - 50),
+    dict(),
+], ids=['http 503', 'rate limit', 'lagging node', 'dead node'])
+def test_failing_node_fails_over_without_errors(nodes, bad_node):
+    good = nodes(latency=0.02)
+    bad = nodes(latency=0.001, **bad_node)
+    if not bad_node:
+        bad.stop()  # connection refused on every attempt
+    pool = make_pool([bad, good])
+    w3 = Web3(pool)
+
+    for _ in range(20):
+        assert w3.eth.chain_id == 11155111
+        pool.cache.clear()  # eth_chainId is cached: make every call reach a node
+
+    assert good.count() - good.count('eth_blockNumber') == 20
+
+
+def test_finalized_eth_call_is_cached_and_latest_is_not(nodes):
+    node = nodes()
+    pool = make_pool([node])
+    w3 = Web3(pool)
+    tx = {'to': Web3.to_checksum_address('0x' + '22' * 20), 'data': '0x1234'}
+    finalized = HEAD - pool.finality_depth
+    blocks = ('finalized', finalized, finalized - 10, 'latest', HEAD)
+
+    first = [w3.eth.call(tx, block_identifier=block) for block in blocks]
+    before = node.count('eth_call')
+    second = [w3.eth.call(tx, block_identifier=block) for block in blocks]
+
+    assert node.count('eth_call') - before == 2  # 'latest' and the head block
+    assert second == first
+
+
+def test_batch_answers_finalized_calls_from_the_cache(nodes):
+    node = nodes()
+    pool = make_pool([node])
+    to = '0x' + '22' * 20
+    finalized = HEAD - pool.finality_depth
+    calls = [('eth_call', [{'to': to, 'data': hex(i)}, hex(finalized)]) for i in range(1, 11)]
+    pool.check_health()  # finality is judged against the heads the health check saw
+
+    first = pool.batch(calls)
+    before = node.count('eth_call')
+    second = pool.batch(calls + [('eth_call', [{'to': to, 'data': '0x99'}, 'latest'])])
+
+    assert node.count('eth_call') - before == 1
+    assert second[:10] == first
+
+
+def test_rebroadcast_already_known_returns_the_hash(nodes):
+    raw = '0x' + 'ab' * 100
+    first = nodes(latency=0.001)
+    second = nodes(latency=0.02, known_txs=[raw])
+    pool = make_pool([first, second])
+    pool.check_health()
+    first.failure_rate = 1.0  # broadcast lost behind a failing node
+
+    tx_hash = Web3(pool).eth.send_raw_transaction(raw)
+
+    assert bytes(tx_hash) == keccak(bytes.fromhex(raw[2:]))
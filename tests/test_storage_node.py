@@ -0,0 +1,35 @@
+import pytest
+
+from storage_node import CACHE_MAX_OBJECT, StorageNode
+
+
+@pytest.fixture(params=['flat', 'segment'])
+def node(request, tmp_path):
+    node = StorageNode(storage_path=str(tmp_path), engine=request.param)
+    yield node
+    node.engine.close()
+
+
+def put(node, file_id, data):
+    writer = node.engine.open_writer(file_id, len(data))
+    writer.write(data)
+    writer.commit()
+
+
+def test_read_object_returns_size_and_chunks(node):
+    put(node, 'small', b's' * 100)
+    put(node, 'large', b'l' * (CACHE_MAX_OBJECT + 1))
+
+    size, chunks = node._read_object('small')
+    assert (size, b''.join(chunks)) == (100, b's' * 100)
+    assert node._read_object('small')[0] == 100  # now from the read cache
+    size, chunks = node._read_object('large')
+    assert (size, b''.join(bytes(c) for c in chunks)) == (CACHE_MAX_OBJECT + 1, b'l' * (CACHE_MAX_OBJECT + 1))
+
+
+def test_read_object_is_not_found_when_the_object_is_deleted_meanwhile(node, monkeypatch):
+    put(node, 'racing', b'r' * 100)
+    monkeypatch.setattr(node.engine, 'size', lambda file_id: None)  # deleted after the size lookup
+
+    assert node._read_object('racing') == (None, None)
+    assert node._read_object('missing') == (None, None)
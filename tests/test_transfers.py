@@ -0,0 +1,90 @@
+import socket
+import threading
+import time
+
+import pytest
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def network(tmp_path, monkeypatch):
+    """NetworkServer on a free port with backend_api pointed at it"""
+    monkeypatch.chdir(tmp_path)  # backend_api creates ./uploads on import
+    import backend_api
+    from network_server import NetworkServer
+
+    server = NetworkServer(host='127.0.0.1', port=_free_port(), metrics_port=None)
+    threading.Thread(target=server.start, daemon=True).start()
+    monkeypatch.setattr(backend_api, 'NETWORK_PORT', server.port)
+    monkeypatch.setattr(backend_api, 'UPLOAD_FOLDER', tmp_path)
+    deadline = time.time() + 5
+    while backend_api.communicate_with_network({'type': 'get_transfers'}).get('status') != 'success':
+        assert time.time() < deadline, 'network server did not start'
+        time.sleep(0.05)
+    yield server, backend_api
+    server.running = False
+
+
+def register_dead_nodes(backend_api, count):
+    """Nodes whose port refuses connections: every send to them fails"""
+    for i in range(count):
+        backend_api.communicate_with_network({
+            'type': 'register_node', 'node_id': f'dead{i}', 'ip': '127.0.0.1', 'port': _free_port(),
+            'storage_capacity': 10 ** 9,
+        })
+
+
+def network_transfers(backend_api):
+    return backend_api.communicate_with_network({'type': 'get_transfers'})['transfers']
+
+
+def test_failed_upload_closes_the_transfer_on_the_network_server(network, tmp_path):
+    server, backend_api = network
+    register_dead_nodes(backend_api, 1)
+    source = tmp_path / 'payload.bin'
+    source.write_bytes(b'x' * 1024)
+
+    result = backend_api.store_single_copy('user', 'file-1', 'payload.bin', source, 1024)
+
+    assert result['status'] == 'error'
+    assert [t['status'] for t in network_transfers(backend_api)] == ['failed']
+    node = server.nodes['dead0']
+    assert server._node_load(node, time.time()) == 0
+    assert server.messages.values[('finish_transfers',)] == 1
+    assert ('unknown',) not in server.messages.values
+
+
+def test_partial_erasure_upload_deletes_stored_fragments(network, tmp_path):
+    server, backend_api = network
+    from storage_node import StorageNode
+
+    live = []
+    for i in range(backend_api.ERASURE_K):
+        node = StorageNode(network_host='127.0.0.1', network_port=server.port, node_port=_free_port(),
+                           storage_path=str(tmp_path / f'node{i}'), capacity_gb=50)
+        threading.Thread(target=node.start, daemon=True).start()
+        live.append(node)
+    # Less free space: ranked after the live nodes, so the parity fragments fail
+    register_dead_nodes(backend_api, backend_api.ERASURE_M)
+    deadline = time.time() + 5
+    while len(server.nodes) < len(live) + backend_api.ERASURE_M:
+        assert time.time() < deadline, 'storage nodes did not register'
+        time.sleep(0.05)
+    for i in range(backend_api.ERASURE_M):
+        server.nodes[f'dead{i}']['storage_capacity'] = 10 ** 8
+    source = tmp_path / 'payload.bin'
+    source.write_bytes(b'y' * 40000)
+
+    result = backend_api.store_erasure_coded('user', 'file-2', 'payload.bin', source, 40000)
+
+    assert result['status'] == 'error'
+    assert [node.files for node in live] == [{}] * len(live)
+    transfers = network_transfers(backend_api)
+    assert len(transfers) == backend_api.ERASURE_K + backend_api.ERASURE_M
+    assert not [t for t in transfers if t['status'] == 'in_progress']
+    assert not [p for p in tmp_path.iterdir() if '.frag' in p.name]
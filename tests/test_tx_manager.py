@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import tx_manager
+
+
+class StandInEth:
+    """
+    web3.eth for one issuer. The 'pending' count only includes transactions
+    this node has seen, like a pool node that has not yet received what
+    another worker sent elsewhere.
+    """
+
+    def __init__(self):
+        self.block_number = 100
+        self.gas_price = 10 ** 9
+        self.sent = []  # (nonce, hash)
+        self.seen = 0  # transactions visible in the 'pending' count
+        self.mined = {}  # hash -> receipt
+        self.reject = None  # message of the next send_raw_transaction error
+        self.lock = threading.Lock()
+        self.account = SimpleNamespace(sign_transaction=self.sign_transaction)
+
+    def fee_history(self, blocks, newest, percentiles):
+        return {'baseFeePerGas': [10 ** 9], 'reward': [[10 ** 8]]}
+
+    def get_transaction_count(self, address, block):
+        return self.seen
+
+    def sign_transaction(self, tx, private_key):
+        return SimpleNamespace(raw_transaction=tx)
+
+    def send_raw_transaction(self, tx):
+        with self.lock:
+            if self.reject:
+                message, self.reject = self.reject, None
+                raise ValueError(message)
+            tx_hash = f"0x{len(self.sent):064x}"
+            self.sent.append((tx['nonce'], tx_hash))
+            return tx_hash
+
+    def get_transaction_receipt(self, tx_hash):
+        return self.mined.get(tx_hash)
+
+
+class StandInFunction:
+    def estimate_gas(self, tx):
+        return 50000
+
+    def build_transaction(self, tx):
+        return dict(tx)
+
+
+def manager(eth, **options):
+    w3 = SimpleNamespace(eth=eth, to_hex=str)
+    options.setdefault('poll_interval', 0.01)
+    return tx_manager.TxManager(w3, '0x' + '11' * 20, '0x' + '42' * 32, 1337, **options)
+
+
+def test_workers_sharing_the_nonce_file_never_reuse_a_nonce(tmp_path):
+    eth = StandInEth()
+    nonce_file = str(tmp_path / 'nonce')
+    workers = [manager(eth, nonce_file=nonce_file) for _ in range(2)]  # two processes' managers
+
+    def issue(worker):
+        for _ in range(20):
+            worker.send(StandInFunction())
+
+    threads = [threading.Thread(target=issue, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(nonce for nonce, _ in eth.sent) == list(range(40))
+
+
+def test_without_the_nonce_file_workers_collide():
+    eth = StandInEth()
+    first, second = manager(eth), manager(eth)
+
+    first.send(StandInFunction())
+    second.send(StandInFunction())
+
+    assert [nonce for nonce, _ in eth.sent] == [0, 0]
+
+
+def test_a_stale_nonce_file_is_ignored(tmp_path):
+    eth = StandInEth()
+    nonce_file = tmp_path / 'nonce'
+    nonce_file.write_text('7')  # a transaction since dropped by the mempool
+    old = time.time() - 3600
+    os.utime(nonce_file, (old, old))
+
+    pending = manager(eth, nonce_file=str(nonce_file), receipt_timeout=120).send(StandInFunction())
+
+    assert pending.nonce == 0
+    assert nonce_file.read_text() == '1'
+
+
+def test_a_failed_send_clears_the_shared_nonce(tmp_path):
+    eth = StandInEth()
+    nonce_file = tmp_path / 'nonce'
+    worker = manager(eth, nonce_file=str(nonce_file))
+    worker.send(StandInFunction())
+    eth.reject = 'nonce too low'
+
+    with pytest.raises(ValueError):
+        worker.send(StandInFunction())
+
+    assert nonce_file.read_text() == ''
+    eth.seen = 5
+    assert worker.send(StandInFunction()).nonce == 5
+
+
+def test_nonce_taken_by_another_transaction_fails_without_waiting():
+    eth = StandInEth()
+    worker = manager(eth, replace_after=1, receipt_timeout=30)
+    pending = worker.send(StandInFunction())
+    eth.block_number += 1
+    eth.reject = 'nonce too low: next nonce 1, tx nonce 0'  # mined, but not one of ours
+
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match='Nonce 0'):
+        worker.wait(pending)
+    assert time.monotonic() - start < 1
+
+
+def test_nonce_too_low_after_our_own_version_was_mined_returns_its_receipt():
+    eth = StandInEth()
+    worker = manager(eth, replace_after=1, receipt_timeout=30)
+    pending = worker.send(StandInFunction())
+    eth.block_number += 1
+    eth.reject = 'nonce too low'
+    receipt = {'transactionHash': pending.hashes[0], 'status': 1}
+
+    original = eth.send_raw_transaction
+
+    def mined_meanwhile(tx):
+        eth.mined[pending.hashes[0]] = receipt  # mined between the poll and the replacement
+        return original(tx)
+
+    eth.send_raw_transaction = mined_meanwhile
+    assert worker.wait(pending) == receipt
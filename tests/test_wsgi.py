@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+from bench_import import _env
+
+PROBE = "import wsgi, app; print(type(app.cache).__name__, type(app.verify_limiter.buckets).__name__)"
+
+
+def run_wsgi(tmp_path, **env):
+    environment = _env(str(tmp_path))
+    environment.pop('CACHE_URL', None)
+    environment.update(CACHE_FILE=str(tmp_path / 'cache.db'), **env)
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=tmp_path, env=environment,
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip().splitlines()[-1].split()
+
+
+def test_workers_share_a_sqlite_cache_by_default(tmp_path):
+    assert run_wsgi(tmp_path) == ['SQLiteCache', 'SQLiteBuckets']
+    assert (tmp_path / 'cache.db').exists()
+
+
+def test_memory_cache_can_still_be_chosen(tmp_path):
+    assert run_wsgi(tmp_path, CACHE_URL='memory', RATE_LIMIT_URL='memory') == ['MemoryCache', 'MemoryBuckets']
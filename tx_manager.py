@@ -0,0 +1,228 @@
+"""
+Transactions de l'émetteur : frais EIP-1559 tirés d'une fenêtre
+eth_feeHistory mise en cache, gaz estimé pour chaque appel (plus une marge)
+au lieu d'une limite fixe, nonces attribués localement, et remplacement des
+transactions encore en attente après REPLACE_AFTER blocs : même nonce, frais
+augmentés d'au moins FEE_BUMP (les nœuds refusent un remplacement à moins
+de +10 %).
+
+Avec `nonce_file`, l'attribution du nonce et l'envoi se font sous un verrou
+exclusif (flock) sur ce fichier, partagé par tous les workers de la machine,
+qui y notent le prochain nonce : un worker n'attribue pas un nonce déjà
+envoyé par un autre à un nœud qui ne l'a pas encore vu. La valeur notée est
+ignorée après `receipt_timeout` secondes, pour qu'une transaction abandonnée
+par le mempool ne bloque pas les suivantes.
+
+Le reçu renvoyé par wait() peut donc être celui d'un remplacement : son
+transactionHash est le hash à enregistrer.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+try:
+    import fcntl
+except ImportError:  # Windows : verrou du processus seulement
+    fcntl = None
+
+import metrics
+
+GWEI = 10 ** 9
+FEE_HISTORY_BLOCKS = 20
+PRIORITY_PERCENTILE = 50
+FEE_CACHE_TTL = 12  # secondes, environ un bloc
+MIN_PRIORITY_FEE = GWEI // 10
+BASE_FEE_MULTIPLIER = 2  # reste incluable après ~6 blocs pleins (+12,5 % chacun)
+MAX_FEE = 500 * GWEI  # plafond de maxFeePerGas, remplacements compris
+GAS_MARGIN = 1.2
+REPLACE_AFTER = 3  # blocs
+FEE_BUMP = 1.125
+POLL_INTERVAL = 1  # secondes
+RECEIPT_TIMEOUT = 120  # secondes
+
+TX_REPLACEMENTS = metrics.REGISTRY.counter(
+    'certichain_tx_replacements_total', 'Transactions remplacées avec des frais augmentés')
+
+
+class FeeOracle:
+    def __init__(self, w3, blocks=FEE_HISTORY_BLOCKS, percentile=PRIORITY_PERCENTILE,
+                 ttl=FEE_CACHE_TTL, max_fee=MAX_FEE):
+        self.w3 = w3
+        self.blocks = blocks
+        self.percentile = percentile
+        self.ttl = ttl
+        self.max_fee = max_fee
+        self.lock = threading.Lock()
+        self.history = None
+        self.fetched_at = None
+        self.legacy = False  # chaîne sans EIP-1559
+
+    def _history(self):
+        with self.lock:
+            if self.fetched_at is None or time.monotonic() - self.fetched_at >= self.ttl:
+                try:
+                    self.history = self.w3.eth.fee_history(self.blocks, 'latest', [self.percentile])
+                    self.legacy = not self.history.get('baseFeePerGas')
+                except Exception:
+                    self.history, self.legacy = None, True
+                self.fetched_at = time.monotonic()
+            return self.history
+
+    def fees(self):
+        """{'maxFeePerGas', 'maxPriorityFeePerGas'}, ou {'gasPrice'} sans EIP-1559"""
+        history = self._history()
+        if self.legacy:
+            return {'gasPrice': min(self.w3.eth.gas_price, self.max_fee)}
+        base_fee = history['baseFeePerGas'][-1]  # base du prochain bloc
+        tips = sorted(reward[0] for reward in history.get('reward') or [] if reward and reward[0] > 0)
+        tip = max(tips[len(tips) // 2] if tips else 0, MIN_PRIORITY_FEE)
+        max_fee = min(base_fee * BASE_FEE_MULTIPLIER + tip, self.max_fee)
+        return {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': min(tip, max_fee)}
+
+
+class PendingTx:
+    def __init__(self, nonce, tx):
+        self.nonce = nonce
+        self.tx = tx  # transaction sans frais
+        self.fees = {}
+        self.hashes = []  # hash de chaque envoi, le plus récent en dernier
+        self.sent_block = None
+
+
+def _bump(fees, fresh, factor, cap):
+    """Frais du remplacement : +factor sur chaque champ, au moins les frais courants, au plus cap"""
+    bumped = {key: min(max(int(value * factor) + 1, fresh.get(key, 0)), cap) for key, value in fees.items()}
+    if 'maxPriorityFeePerGas' in bumped:
+        bumped['maxPriorityFeePerGas'] = min(bumped['maxPriorityFeePerGas'], bumped['maxFeePerGas'])
+    return bumped
+
+
+class TxManager:
+    def __init__(self, w3, address, private_key, chain_id, fee_history_blocks=FEE_HISTORY_BLOCKS,
+                 priority_percentile=PRIORITY_PERCENTILE, gas_margin=GAS_MARGIN,
+                 replace_after=REPLACE_AFTER, fee_bump=FEE_BUMP, max_fee=MAX_FEE,
+                 poll_interval=POLL_INTERVAL, receipt_timeout=RECEIPT_TIMEOUT, nonce_file=None):
+        self.w3 = w3
+        self.address = address
+        self.private_key = private_key
+        self.chain_id = chain_id
+        self.oracle = FeeOracle(w3, fee_history_blocks, priority_percentile, max_fee=max_fee)
+        self.gas_margin = gas_margin
+        self.replace_after = replace_after
+        self.fee_bump = fee_bump
+        self.max_fee = max_fee
+        self.poll_interval = poll_interval
+        self.receipt_timeout = receipt_timeout
+        self.lock = threading.Lock()
+        self.next_nonce = None
+        self.nonce_file = nonce_file if fcntl is not None else None
+
+    @contextmanager
+    def _shared_nonce(self):
+        """Verrou entre processus sur `nonce_file` ; {'next_nonce': noté par le dernier envoi, ou None}"""
+        with open(self.nonce_file, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                text = f.read().strip()
+                fresh = text and time.time() - os.fstat(f.fileno()).st_mtime < self.receipt_timeout
+                shared = {'next_nonce': int(text) if fresh else None}
+                try:
+                    yield shared
+                finally:
+                    f.seek(0)
+                    f.truncate()
+                    if shared['next_nonce'] is not None:
+                        f.write(str(shared['next_nonce']))
+                    f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _submit(self, pending, fees):
+        signed = self.w3.eth.account.sign_transaction({**pending.tx, **fees}, private_key=self.private_key)
+        tx_hash = self.w3.eth.send_raw_transaction(signed.raw_transaction)
+        pending.fees = fees
+        pending.hashes.append(tx_hash)
+        pending.sent_block = self.w3.eth.block_number
+        return tx_hash
+
+    def send(self, function):
+        """Envoie l'appel de contrat `function` (contract.functions.f(...)) ; renvoie un PendingTx"""
+        gas = int(function.estimate_gas({'from': self.address}) * self.gas_margin)
+        fees = self.oracle.fees()
+        # Attribution du nonce et envoi sous verrou : pas de trou entre deux transactions
+        shared_nonce = self._shared_nonce() if self.nonce_file else nullcontext({'next_nonce': None})
+        with self.lock, shared_nonce as shared:
+            pending_count = self.w3.eth.get_transaction_count(self.address, 'pending')
+            nonce = max([pending_count] + [n for n in (self.next_nonce, shared['next_nonce']) if n is not None])
+            tx = function.build_transaction({
+                'chainId': self.chain_id,
+                'from': self.address,
+                'gas': gas,
+                'nonce': nonce,
+                **fees
+            })
+            for key in ('gasPrice', 'maxFeePerGas', 'maxPriorityFeePerGas'):
+                tx.pop(key, None)
+            pending = PendingTx(nonce, tx)
+            try:
+                self._submit(pending, fees)
+            except Exception:
+                self.next_nonce = shared['next_nonce'] = None  # relu au prochain envoi
+                raise
+            self.next_nonce = shared['next_nonce'] = nonce + 1
+        return pending
+
+    def _receipt(self, pending):
+        for tx_hash in reversed(pending.hashes):
+            try:
+                receipt = self.w3.eth.get_transaction_receipt(tx_hash)
+            except Exception:
+                continue  # TransactionNotFound : pas encore minée
+            if receipt is not None:
+                return receipt
+        return None
+
+    def _replace(self, pending, block):
+        fees = _bump(pending.fees, self.oracle.fees(), self.fee_bump, self.max_fee)
+        if fees == pending.fees:
+            pending.sent_block = block  # déjà au plafond : on attend
+            return
+        try:
+            tx_hash = self._submit(pending, fees)
+        except Exception as e:
+            message = str(e).lower()
+            if 'underpriced' in message:
+                pending.fees, pending.sent_block = fees, block  # le suivant montera encore
+                return
+            if 'nonce too low' in message and self._receipt(pending) is None:
+                # Aucune de nos versions n'est minée : le nonce a servi à une autre transaction
+                raise RuntimeError(f"Nonce {pending.nonce} déjà utilisé par une autre transaction de "
+                                   f"{self.address}, aucune version de celle-ci n'a été minée")
+            if 'nonce too low' in message or 'already known' in message:
+                pending.sent_block = block  # une version précédente vient d'être minée (ou est déjà connue)
+                return
+            raise
+        TX_REPLACEMENTS.inc()
+        print(f"⛽ Transaction nonce {pending.nonce} remplacée après {self.replace_after} blocs: "
+              f"{self.w3.to_hex(tx_hash)}")
+
+    def wait(self, pending):
+        """Reçu de la transaction (ou de son remplacement), en la remplaçant si elle reste en attente"""
+        deadline = time.monotonic() + self.receipt_timeout
+        while True:
+            receipt = self._receipt(pending)
+            if receipt is not None:
+                return receipt
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Transaction nonce {pending.nonce} non minée après "
+                                   f"{self.receipt_timeout} s: {self.w3.to_hex(pending.hashes[-1])}")
+            block = self.w3.eth.block_number
+            if block - pending.sent_block >= self.replace_after:
+                self._replace(pending, block)
+            time.sleep(self.poll_interval)
+
+    def transact(self, function):
+        return self.wait(self.send(function))
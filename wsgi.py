@@ -0,0 +1,56 @@
+"""
+Point d'entrée WSGI de production :
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Le processus maître applique les migrations avant le fork ; chaque worker
+repart d'un pool de connexions neuf, et un seul worker de la machine (celui
+qui obtient le verrou JOBS_LOCK_FILE) lance le sweeper IPFS, l'indexeur et
+la file d'emails.
+Si ce worker meurt, le verrou est libéré et son remplaçant le reprend.
+
+Sans CACHE_URL, le cache et les seaux de jetons sont un fichier SQLite
+partagé par les workers (CACHE_FILE) : avec un cache par processus, le
+commit d'un worker n'invaliderait que sa propre copie. CACHE_URL=memory
+force le cache du processus (un seul worker).
+"""
+
+import fcntl
+import os
+import tempfile
+
+JOBS_LOCK_FILE = os.getenv("JOBS_LOCK_FILE", os.path.join(tempfile.gettempdir(), "certichain-jobs.lock"))
+CACHE_FILE = os.getenv("CACHE_FILE", os.path.join(
+    '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(), "certichain-cache.db"))
+
+# Avant l'import de config (lu par app)
+if not os.getenv("CACHE_URL"):
+    os.environ["CACHE_URL"] = f"sqlite:///{CACHE_FILE}"
+
+from app import app, db, migrations, start_background_jobs
+
+_jobs_lock = None
+
+
+def upgrade_schema():
+    """Migrations dans le maître ; aucune connexion ne doit être héritée par les workers"""
+    with app.app_context():
+        migrations.upgrade()
+        db.engine.dispose()
+
+
+def init_worker():
+    """Après le fork ; renvoie True si ce worker lance les tâches de fond"""
+    global _jobs_lock
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    lock = open(JOBS_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _jobs_lock = lock  # gardé ouvert pour toute la vie du worker
+    start_background_jobs()
+    return True